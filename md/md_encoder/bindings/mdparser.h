@@ -25,7 +25,10 @@ void (*set_threshold)(CProtoGenerator *ptr, uint32_t parallel_threshold);
 uint32_t (*get_threshold)(CProtoGenerator *ptr);
 const CProtoVec *(*generate_proto)(CProtoGenerator *ptr,
                                    char *input);
+/* frees the data of a proto, the CProto itself stays allocated */
 void (*free_proto)(const CProto *ptr);
+/* frees a vec from generate_proto with its protos and their data,
+   don't call free_proto on its protos before */
 void (*free_proto_vec)(const CProtoVec *ptr);
 
 #endif
\ No newline at end of file
@@ -59,17 +59,27 @@ pub unsafe extern "C" fn generate_proto(
     }))
 }
 
+/// Frees the data of a proto, the `CProto` itself stays allocated.
 #[no_mangle]
 pub unsafe extern "C" fn free_proto(p: *const CProto) {
     libc::free((*p).data as *mut libc::c_void);
 }
 
+/// Frees a vec from `generate_proto` with everything it owns: the data of
+/// each proto, each `CProto`, the pointer array and the `CProtoVec`.
+/// Don't call `free_proto` on its protos before.
 #[no_mangle]
 pub unsafe extern "C" fn free_proto_vec(p: *const CProtoVec) {
-    for p in std::slice::from_raw_parts((*p).data, (*p).len as usize) {
-        free_proto(p.clone());
+    let p = Box::from_raw(p as *mut CProtoVec);
+    for proto in std::slice::from_raw_parts(p.data, p.len as usize) {
+        drop_proto(*proto);
     }
-    libc::free((*p).data as *mut libc::c_void);
+    libc::free(p.data as *mut libc::c_void);
+}
+
+unsafe fn drop_proto(p: *const CProto) {
+    let p = Box::from_raw(p as *mut CProto);
+    libc::free(p.data as *mut libc::c_void);
 }
 
 pub unsafe fn copy_single_proto(input: &[u8]) -> *const CProto {
@@ -0,0 +1,193 @@
+extern crate md_net;
+
+use criterion::{black_box, criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use md_net::analytics::PageRankParams;
+use md_net::layout::LayoutParams;
+use md_net::net::{
+    MultiNetGenerator, NetLinkSchema, NetNodeSchema, NetSchema, NoteSchema, Vector,
+};
+use md_parser::expr::RawLink;
+use std::collections::HashSet;
+use std::fs::{create_dir_all, write};
+
+const NOTES: usize = 10_000;
+const DENSE_NOTES: [usize; 4] = [1_000, 2_000, 4_000, 8_000];
+const DENSE_LINKS: usize = 32;
+const LAYOUT_NODES: [usize; 3] = [1_000, 10_000, 50_000];
+const PAGERANK_NODES: usize = 50_000;
+
+/// a synthetic vault, each note is a few paragraphs with `links` links to other notes
+fn create_vault(name: &str, size: usize, links: usize) -> Vec<NoteSchema> {
+    let dir = std::env::temp_dir().join(name);
+    create_dir_all(&dir).unwrap();
+    (0..size)
+        .map(|i| {
+            let url = dir.join(format!("{i}.md")).to_str().unwrap().to_string();
+            let mut text = format!("# note {i}\n\n");
+            for j in 1..=links {
+                text.push_str(&format!(
+                    "some **text** about [n{0}](md://n{0}) and [res](res_{1}.pdf)\n\n",
+                    (i + j * 7) % size,
+                    j % 8
+                ));
+            }
+            write(&url, text).unwrap();
+            NoteSchema::new(i, format!("n{i}"), url)
+        })
+        .collect()
+}
+
+/// the former resolution, a linear scan over all nodes per link
+fn linear_resolve(notes: &[NoteSchema], refs: Vec<Vec<RawLink>>) -> NetSchema {
+    let mut nodes: Vec<NetNodeSchema> = notes
+        .iter()
+        .enumerate()
+        .map(|(i, _)| NetNodeSchema {
+            id: i,
+            data: format!("n{i}"),
+            is_md: true,
+            pos: Vector { x: 0, y: 0 },
+        })
+        .collect();
+    let mut link_set: HashSet<NetLinkSchema> = HashSet::new();
+    for (i, links) in refs.iter().enumerate() {
+        for l in links {
+            if let Some(h) = &l.href {
+                if !l.is_md {
+                    nodes.push(NetNodeSchema {
+                        id: 0,
+                        data: l.content.clone(),
+                        is_md: false,
+                        pos: Vector { x: 0, y: 0 },
+                    });
+                    link_set.insert(NetLinkSchema {
+                        source: i,
+                        target: nodes.len() - 1,
+                    });
+                } else if let Some(idx) = nodes.iter().position(|n| n.data == h[5..]) {
+                    link_set.insert(NetLinkSchema {
+                        source: i,
+                        target: idx,
+                    });
+                }
+            }
+        }
+    }
+    NetSchema {
+        nodes,
+        links: link_set.into_iter().collect(),
+    }
+}
+
+/// 1, 2, 4, ... up to the number of logical cores
+fn worker_counts() -> Vec<usize> {
+    let max_workers = std::thread::available_parallelism().unwrap().get();
+    let mut counts: Vec<usize> = (0..)
+        .map(|i| 1 << i)
+        .take_while(|w| *w < max_workers)
+        .collect();
+    counts.push(max_workers);
+    counts
+}
+
+fn scaling_benchmark(c: &mut Criterion) {
+    let notes = create_vault("md_net_bench", NOTES, 8);
+    let mut group = c.benchmark_group("extract");
+    group.sample_size(10);
+    for workers in worker_counts() {
+        let net_generator = MultiNetGenerator::new(workers);
+        group.bench_with_input(BenchmarkId::from_parameter(workers), &notes, |b, notes| {
+            b.iter(|| net_generator.extract(black_box(notes.clone())))
+        });
+    }
+    group.finish();
+
+    let mut group = c.benchmark_group("generate");
+    group.sample_size(10);
+    for workers in worker_counts() {
+        let net_generator = MultiNetGenerator::new(workers);
+        group.bench_with_input(BenchmarkId::from_parameter(workers), &notes, |b, notes| {
+            b.iter(|| net_generator.generate(black_box(notes.clone())))
+        });
+    }
+    group.finish();
+}
+
+fn resolve_benchmark(c: &mut Criterion) {
+    let net_generator = MultiNetGenerator::new(0);
+    let mut group = c.benchmark_group("resolve");
+    group.sample_size(10);
+    for size in DENSE_NOTES {
+        let notes = create_vault(&format!("md_net_bench_dense_{size}"), size, DENSE_LINKS);
+        let refs = net_generator.read_refs(&notes);
+        group.bench_with_input(BenchmarkId::new("hash", size), &refs, |b, refs| {
+            b.iter(|| MultiNetGenerator::resolve(&notes, black_box(refs.clone())))
+        });
+        group.bench_with_input(BenchmarkId::new("linear", size), &refs, |b, refs| {
+            b.iter(|| linear_resolve(&notes, black_box(refs.clone())))
+        });
+    }
+    group.finish();
+}
+
+/// one layout iteration at each size, throughput is iterations per second
+fn layout_benchmark(c: &mut Criterion) {
+    let net_generator = MultiNetGenerator::new(0);
+    let mut group = c.benchmark_group("layout");
+    group.sample_size(10);
+    group.throughput(Throughput::Elements(1));
+    for size in LAYOUT_NODES {
+        let sources: Vec<u32> = (0..size * 4).map(|i| (i / 4) as u32).collect();
+        let targets: Vec<u32> = (0..size * 4)
+            .map(|i| ((i / 4 * 7919 + i % 4 * 104_729) % size) as u32)
+            .collect();
+        let mut xs = vec![0.0; size];
+        let mut ys = vec![0.0; size];
+        let known = vec![false; size];
+        let params = LayoutParams {
+            iterations: 1,
+            ..Default::default()
+        };
+        net_generator.layout(&mut xs, &mut ys, &known, &sources, &targets, &params);
+        let known = vec![true; size];
+        group.bench_function(BenchmarkId::from_parameter(size), |b| {
+            b.iter(|| {
+                net_generator.layout(
+                    black_box(&mut xs),
+                    &mut ys,
+                    &known,
+                    &sources,
+                    &targets,
+                    &params,
+                )
+            })
+        });
+    }
+    group.finish();
+}
+
+/// PageRank to convergence, components and degrees on a synthetic graph
+fn analytics_benchmark(c: &mut Criterion) {
+    let net_generator = MultiNetGenerator::new(0);
+    let size = PAGERANK_NODES;
+    let sources: Vec<u32> = (0..size * 4).map(|i| (i / 4) as u32).collect();
+    let targets: Vec<u32> = (0..size * 4)
+        .map(|i| ((i / 4 * 7919 + i % 4 * 104_729) % size) as u32)
+        .collect();
+    let params = PageRankParams::default();
+    let mut group = c.benchmark_group("analytics");
+    group.sample_size(10);
+    group.bench_function(BenchmarkId::from_parameter(size), |b| {
+        b.iter(|| net_generator.analyze(size, black_box(&sources), &targets, &params))
+    });
+    group.finish();
+}
+
+criterion_group!(
+    benches,
+    scaling_benchmark,
+    resolve_benchmark,
+    layout_benchmark,
+    analytics_benchmark
+);
+criterion_main!(benches);
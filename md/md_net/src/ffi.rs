@@ -1,4 +1,7 @@
+use crate::analytics::PageRankParams;
+use crate::layout::LayoutParams;
 use crate::net::*;
+use crate::trigram;
 use std::{
     ffi::{c_char, c_uint, CStr, CString},
     mem::size_of,
@@ -40,18 +43,59 @@ pub struct CNetSchema {
     l_len: c_uint,
 }
 
+/// columnar input, `names[name_offsets[i]..name_offsets[i + 1]]` is the name of note `i`
+#[repr(C)]
+pub struct CNoteColumns {
+    len: c_uint,
+    ids: *const c_uint,
+    names: *const u8,
+    name_offsets: *const c_uint,
+    urls: *const u8,
+    url_offsets: *const c_uint,
+}
+
+/// columnar net, every array is contiguous, `data` packs all node names as UTF-8
+#[repr(C)]
+pub struct CNetColumns {
+    n_len: c_uint,
+    ids: *const c_uint,
+    is_md: *const u8,
+    pos_x: *const c_uint,
+    pos_y: *const c_uint,
+    data: *const u8,
+    data_offsets: *const c_uint,
+    l_len: c_uint,
+    sources: *const c_uint,
+    targets: *const c_uint,
+}
+
+/// columnar links, `data` packs all target names as UTF-8
+#[repr(C)]
+pub struct CNetRefColumns {
+    len: c_uint,
+    note_ids: *const c_uint,
+    is_md: *const u8,
+    data: *const u8,
+    data_offsets: *const c_uint,
+}
+
 #[repr(C)]
 pub struct CNetGenerator {
     gen: *const MultiNetGenerator,
 }
 
 #[no_mangle]
-pub extern "C" fn init_net_generator() -> *const CNetGenerator {
-    let net_generator = MultiNetGenerator::new();
+pub extern "C" fn init_net_generator(workers: c_uint) -> *const CNetGenerator {
+    let net_generator = MultiNetGenerator::new(workers as usize);
     let p = Box::into_raw(Box::new(net_generator));
     Box::into_raw(Box::new(CNetGenerator { gen: p }))
 }
 
+#[no_mangle]
+pub unsafe extern "C" fn get_workers(net_generator: *const CNetGenerator) -> c_uint {
+    (*(*net_generator).gen).get_workers() as c_uint
+}
+
 #[no_mangle]
 pub unsafe extern "C" fn generate(
     net_generator: *const CNetGenerator,
@@ -87,6 +131,249 @@ pub unsafe extern "C" fn free_net_schema(p: *const CNetSchema) {
     libc::free((*p).nodes as *mut libc::c_void);
 }
 
+#[no_mangle]
+pub unsafe extern "C" fn generate_columns(
+    net_generator: *const CNetGenerator,
+    notes: *const CNoteColumns,
+) -> *const CNetColumns {
+    let notes = parse_note_columns(notes);
+    let net = (*(*net_generator).gen).generate(notes);
+    let (data, data_offsets) = pack_strings(net.nodes.iter().map(|n| n.data.as_str()));
+    let p = CNetColumns {
+        n_len: net.nodes.len() as c_uint,
+        ids: leak_vec(net.nodes.iter().map(|n| n.id as c_uint).collect()),
+        is_md: leak_vec(net.nodes.iter().map(|n| n.is_md as u8).collect()),
+        pos_x: leak_vec(net.nodes.iter().map(|n| n.pos.x as c_uint).collect()),
+        pos_y: leak_vec(net.nodes.iter().map(|n| n.pos.y as c_uint).collect()),
+        data: leak_vec(data),
+        data_offsets: leak_vec(data_offsets),
+        l_len: net.links.len() as c_uint,
+        sources: leak_vec(net.links.iter().map(|l| l.source as c_uint).collect()),
+        targets: leak_vec(net.links.iter().map(|l| l.target as c_uint).collect()),
+    };
+    Box::into_raw(Box::new(p))
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn free_net_columns(p: *const CNetColumns) {
+    let p = Box::from_raw(p.cast_mut());
+    let n_len = p.n_len as usize;
+    let l_len = p.l_len as usize;
+    free_vec(p.ids, n_len);
+    free_vec(p.is_md, n_len);
+    free_vec(p.pos_x, n_len);
+    free_vec(p.pos_y, n_len);
+    free_vec(p.data, *p.data_offsets.add(n_len) as usize);
+    free_vec(p.data_offsets, n_len + 1);
+    free_vec(p.sources, l_len);
+    free_vec(p.targets, l_len);
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn extract_ref_columns(
+    net_generator: *const CNetGenerator,
+    notes: *const CNoteColumns,
+) -> *const CNetRefColumns {
+    let notes = parse_note_columns(notes);
+    let refs = (*(*net_generator).gen).extract(notes);
+    let (data, data_offsets) = pack_strings(refs.iter().map(|r| r.data.as_str()));
+    let p = CNetRefColumns {
+        len: refs.len() as c_uint,
+        note_ids: leak_vec(refs.iter().map(|r| r.note_id as c_uint).collect()),
+        is_md: leak_vec(refs.iter().map(|r| r.is_md as u8).collect()),
+        data: leak_vec(data),
+        data_offsets: leak_vec(data_offsets),
+    };
+    Box::into_raw(Box::new(p))
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn free_net_ref_columns(p: *const CNetRefColumns) {
+    let p = Box::from_raw(p.cast_mut());
+    let len = p.len as usize;
+    free_vec(p.note_ids, len);
+    free_vec(p.is_md, len);
+    free_vec(p.data, *p.data_offsets.add(len) as usize);
+    free_vec(p.data_offsets, len + 1);
+}
+
+#[repr(C)]
+pub struct CLayoutParams {
+    iterations: c_uint,
+    temperature: f32,
+    theta: f32,
+    length: f32,
+    gravity: f32,
+}
+
+/// lay out `n_len` nodes in place, every buffer is owned by the caller,
+/// `known[i] == 0` marks a node without a position yet
+#[no_mangle]
+pub unsafe extern "C" fn layout_columns(
+    net_generator: *const CNetGenerator,
+    n_len: c_uint,
+    pos_x: *mut f32,
+    pos_y: *mut f32,
+    known: *const u8,
+    l_len: c_uint,
+    sources: *const c_uint,
+    targets: *const c_uint,
+    params: *const CLayoutParams,
+) {
+    if n_len == 0 {
+        return;
+    }
+    let n_len = n_len as usize;
+    let xs = std::slice::from_raw_parts_mut(pos_x, n_len);
+    let ys = std::slice::from_raw_parts_mut(pos_y, n_len);
+    let known: Vec<bool> = std::slice::from_raw_parts(known, n_len)
+        .iter()
+        .map(|k| *k != 0)
+        .collect();
+    let (sources, targets) = match l_len as usize {
+        0 => (&[][..], &[][..]),
+        l_len => (
+            std::slice::from_raw_parts(sources, l_len),
+            std::slice::from_raw_parts(targets, l_len),
+        ),
+    };
+    let params = LayoutParams {
+        iterations: (*params).iterations,
+        temperature: (*params).temperature,
+        theta: (*params).theta,
+        length: (*params).length,
+        gravity: (*params).gravity,
+    };
+    (*(*net_generator).gen).layout(xs, ys, &known, sources, targets, &params);
+}
+
+/// analytics of each node, release with `free_net_analytics`
+#[repr(C)]
+pub struct CNetAnalytics {
+    n_len: c_uint,
+    rank: *const f64,
+    component: *const c_uint,
+    in_degree: *const c_uint,
+    out_degree: *const c_uint,
+    iterations: c_uint,
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn analyze_columns(
+    net_generator: *const CNetGenerator,
+    n_len: c_uint,
+    l_len: c_uint,
+    sources: *const c_uint,
+    targets: *const c_uint,
+    damping: f64,
+    tolerance: f64,
+    max_iterations: c_uint,
+) -> *const CNetAnalytics {
+    let (sources, targets) = match l_len as usize {
+        0 => (&[][..], &[][..]),
+        l_len => (
+            std::slice::from_raw_parts(sources, l_len),
+            std::slice::from_raw_parts(targets, l_len),
+        ),
+    };
+    let params = PageRankParams {
+        damping,
+        tolerance,
+        max_iterations,
+    };
+    let analytics = (*(*net_generator).gen).analyze(n_len as usize, sources, targets, &params);
+    let p = CNetAnalytics {
+        n_len,
+        rank: leak_vec(analytics.rank),
+        component: leak_vec(analytics.component),
+        in_degree: leak_vec(analytics.in_degree),
+        out_degree: leak_vec(analytics.out_degree),
+        iterations: analytics.iterations,
+    };
+    Box::into_raw(Box::new(p))
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn free_net_analytics(p: *const CNetAnalytics) {
+    let p = Box::from_raw(p.cast_mut());
+    let n_len = p.n_len as usize;
+    free_vec(p.rank, n_len);
+    free_vec(p.component, n_len);
+    free_vec(p.in_degree, n_len);
+    free_vec(p.out_degree, n_len);
+}
+
+/// trigram posting lists, the list of `keys[i]` is `data[offsets[i]..offsets[i + 1]]`
+#[repr(C)]
+pub struct CTrigramPostings {
+    len: c_uint,
+    keys: *const c_uint,
+    offsets: *const u64,
+    data: *const u8,
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn build_trigram_columns(
+    net_generator: *const CNetGenerator,
+    notes: *const CNoteColumns,
+) -> *const CTrigramPostings {
+    let notes = parse_note_columns(notes);
+    let postings = (*(*net_generator).gen).trigrams(notes);
+    let p = CTrigramPostings {
+        len: postings.keys.len() as c_uint,
+        keys: leak_vec(postings.keys),
+        offsets: leak_vec(postings.offsets),
+        data: leak_vec(postings.data),
+    };
+    Box::into_raw(Box::new(p))
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn free_trigram_postings(p: *const CTrigramPostings) {
+    let p = Box::from_raw(p.cast_mut());
+    let len = p.len as usize;
+    free_vec(p.data, *p.offsets.add(len) as usize);
+    free_vec(p.keys, len);
+    free_vec(p.offsets, len + 1);
+}
+
+/// sorted distinct trigrams of one text, `len` is set to their count, release with `free_trigrams`
+#[no_mangle]
+pub unsafe extern "C" fn extract_trigrams(data: *const u8, data_len: usize, len: *mut c_uint) -> *const c_uint {
+    let data = match data_len {
+        0 => &[][..],
+        data_len => std::slice::from_raw_parts(data, data_len),
+    };
+    let grams = trigram::trigrams(data);
+    *len = grams.len() as c_uint;
+    leak_vec(grams)
+}
+
+#[no_mangle]
+pub unsafe extern "C" fn free_trigrams(p: *const c_uint, len: c_uint) {
+    free_vec(p, len as usize);
+}
+
+/// hand the buffer of `v` over to the caller, release it with `free_vec`
+fn leak_vec<T>(v: Vec<T>) -> *const T {
+    Box::into_raw(v.into_boxed_slice()) as *const T
+}
+
+unsafe fn free_vec<T>(p: *const T, len: usize) {
+    let _ = Box::from_raw(std::ptr::slice_from_raw_parts_mut(p.cast_mut(), len));
+}
+
+/// concatenate strings into one UTF-8 blob, return the blob and `len + 1` byte offsets
+fn pack_strings<'a>(strings: impl Iterator<Item = &'a str>) -> (Vec<u8>, Vec<c_uint>) {
+    let mut data = Vec::new();
+    let mut offsets = vec![0];
+    for s in strings {
+        data.extend_from_slice(s.as_bytes());
+        offsets.push(data.len() as c_uint);
+    }
+    (data, offsets)
+}
+
 pub unsafe fn copy_net_node_schema(input: &NetNodeSchema) -> *const CNetNodeSchema {
     let data = CString::new(input.data.clone()).unwrap();
     let data = data.into_raw();
@@ -122,6 +409,26 @@ pub unsafe fn parse_note_schema(input: *const CNoteSchema) -> NoteSchema {
     NoteSchema::new(id as usize, name, url)
 }
 
+pub unsafe fn parse_note_columns(input: *const CNoteColumns) -> Vec<NoteSchema> {
+    let len = (*input).len as usize;
+    let ids = std::slice::from_raw_parts((*input).ids, len);
+    let name_offsets = std::slice::from_raw_parts((*input).name_offsets, len + 1);
+    let url_offsets = std::slice::from_raw_parts((*input).url_offsets, len + 1);
+    let names = std::slice::from_raw_parts((*input).names, name_offsets[len] as usize);
+    let urls = std::slice::from_raw_parts((*input).urls, url_offsets[len] as usize);
+    (0..len)
+        .map(|i| {
+            let name = &names[name_offsets[i] as usize..name_offsets[i + 1] as usize];
+            let url = &urls[url_offsets[i] as usize..url_offsets[i + 1] as usize];
+            NoteSchema::new(
+                ids[i] as usize,
+                String::from_utf8_lossy(name).into_owned(),
+                String::from_utf8_lossy(url).into_owned(),
+            )
+        })
+        .collect()
+}
+
 pub unsafe fn parse_note_schema_vec(input: *const CNoteSchemaVec) -> Vec<NoteSchema> {
     let mut output = Vec::new();
     for i in 0..(*input).len {
@@ -0,0 +1,310 @@
+//! force-directed layout over flat coordinate arrays
+//!
+//! Fruchterman–Reingold forces, links attract with `d² / k` and every pair
+//! of nodes repels with `k² / d`. The repulsion is approximated with a
+//! Barnes–Hut quadtree, so an iteration is O(n log n) instead of O(n²).
+use rayon::prelude::*;
+
+/// max quadtree depth, coincident points below it share one leaf
+const MAX_DEPTH: u32 = 32;
+const NONE: u32 = u32::MAX;
+
+#[derive(Debug, Clone, Copy)]
+pub struct LayoutParams {
+    /// iteration count
+    pub iterations: u32,
+    /// max displacement of a node in the first iteration, cools down linearly to 0
+    pub temperature: f32,
+    /// Barnes–Hut opening angle, a cell of width `w` at distance `d` is one body if `w / d < theta`
+    pub theta: f32,
+    /// ideal link length
+    pub length: f32,
+    /// pull toward the origin, keeps unlinked components together
+    pub gravity: f32,
+}
+
+impl Default for LayoutParams {
+    fn default() -> Self {
+        Self {
+            iterations: 300,
+            temperature: 100.0,
+            theta: 0.8,
+            length: 30.0,
+            gravity: 0.01,
+        }
+    }
+}
+
+#[derive(Debug, Clone, Copy)]
+struct Cell {
+    /// center and half width of the square
+    x: f32,
+    y: f32,
+    half: f32,
+    /// body count and the sum of body positions, center of mass is `sum / mass`
+    mass: f32,
+    sum_x: f32,
+    sum_y: f32,
+    /// first of the 4 children, `NONE` for a leaf
+    children: u32,
+    /// the single body of a leaf, `NONE` if empty or internal
+    body: u32,
+}
+
+impl Cell {
+    fn new(x: f32, y: f32, half: f32) -> Self {
+        Self {
+            x,
+            y,
+            half,
+            mass: 0.0,
+            sum_x: 0.0,
+            sum_y: 0.0,
+            children: NONE,
+            body: NONE,
+        }
+    }
+
+    fn quadrant(&self, x: f32, y: f32) -> u32 {
+        (x >= self.x) as u32 | ((y >= self.y) as u32) << 1
+    }
+}
+
+/// Barnes–Hut quadtree stored as a flat cell array, cell 0 is the root
+pub struct QuadTree {
+    cells: Vec<Cell>,
+}
+
+impl QuadTree {
+    pub fn build(xs: &[f32], ys: &[f32]) -> Self {
+        let (mut min_x, mut min_y, mut max_x, mut max_y) = (f32::MAX, f32::MAX, f32::MIN, f32::MIN);
+        for (&x, &y) in xs.iter().zip(ys) {
+            min_x = min_x.min(x);
+            min_y = min_y.min(y);
+            max_x = max_x.max(x);
+            max_y = max_y.max(y);
+        }
+        let half = ((max_x - min_x).max(max_y - min_y) / 2.0).max(1.0) * 1.01;
+        let mut tree = Self {
+            cells: Vec::with_capacity(xs.len() * 2 + 1),
+        };
+        tree.cells
+            .push(Cell::new((min_x + max_x) / 2.0, (min_y + max_y) / 2.0, half));
+        for i in 0..xs.len() {
+            tree.insert(i as u32, xs, ys);
+        }
+        tree
+    }
+
+    fn insert(&mut self, body: u32, xs: &[f32], ys: &[f32]) {
+        let (x, y) = (xs[body as usize], ys[body as usize]);
+        let mut cell = 0;
+        let mut depth = 0;
+        loop {
+            let next = self.cells.len() as u32;
+            let c = &mut self.cells[cell];
+            c.mass += 1.0;
+            c.sum_x += x;
+            c.sum_y += y;
+            if c.children == NONE {
+                if c.mass == 1.0 {
+                    c.body = body;
+                    return;
+                }
+                if depth >= MAX_DEPTH {
+                    // coincident points, the leaf keeps the mass of all of them
+                    return;
+                }
+                // split the leaf and push its body one level down
+                let old = c.body;
+                let (cx, cy, quarter) = (c.x, c.y, c.half / 2.0);
+                c.body = NONE;
+                c.children = next;
+                for q in 0..4 {
+                    let dx = if q & 1 == 1 { quarter } else { -quarter };
+                    let dy = if q & 2 == 2 { quarter } else { -quarter };
+                    self.cells.push(Cell::new(cx + dx, cy + dy, quarter));
+                }
+                if old != NONE {
+                    let (ox, oy) = (xs[old as usize], ys[old as usize]);
+                    let child = &mut self.cells[cell];
+                    let o = (child.children + child.quadrant(ox, oy)) as usize;
+                    let leaf = &mut self.cells[o];
+                    leaf.mass = 1.0;
+                    leaf.sum_x = ox;
+                    leaf.sum_y = oy;
+                    leaf.body = old;
+                }
+            }
+            let c = &self.cells[cell];
+            cell = (c.children + c.quadrant(x, y)) as usize;
+            depth += 1;
+        }
+    }
+
+    /// repulsive displacement of body `i` at `(x, y)`, `k2` is the squared ideal length
+    pub fn repulsion(&self, i: u32, x: f32, y: f32, theta: f32, k2: f32) -> (f32, f32) {
+        let (mut fx, mut fy) = (0.0, 0.0);
+        let mut stack = vec![0u32];
+        while let Some(cell) = stack.pop() {
+            let c = &self.cells[cell as usize];
+            if c.mass == 0.0 || c.body == i && c.mass == 1.0 {
+                continue;
+            }
+            let (cx, cy) = (c.sum_x / c.mass, c.sum_y / c.mass);
+            let (mut dx, mut dy) = (x - cx, y - cy);
+            let mut d2 = dx * dx + dy * dy;
+            if c.children == NONE || (2.0 * c.half) * (2.0 * c.half) < theta * theta * d2 {
+                let mass = if c.body == i { c.mass - 1.0 } else { c.mass };
+                if d2 < 1e-4 {
+                    // push coincident bodies apart in a direction that depends on the body
+                    let angle = i as f32 * 2.399_963;
+                    (dx, dy) = (angle.cos() * 1e-2, angle.sin() * 1e-2);
+                    d2 = 1e-4;
+                }
+                fx += dx * k2 * mass / d2;
+                fy += dy * k2 * mass / d2;
+            } else {
+                stack.extend(c.children..c.children + 4);
+            }
+        }
+        (fx, fy)
+    }
+}
+
+/// place the nodes without a position, near their placed neighbors or on a spiral
+/// around the origin, so a warm start only has to settle the new nodes
+pub fn seed(xs: &mut [f32], ys: &mut [f32], known: &[bool], sources: &[u32], targets: &[u32], length: f32) {
+    let n = xs.len();
+    let (mut sum_x, mut sum_y, mut count) = (vec![0.0f32; n], vec![0.0f32; n], vec![0u32; n]);
+    for (&s, &t) in sources.iter().zip(targets) {
+        let (s, t) = (s as usize, t as usize);
+        if known[s] && !known[t] {
+            sum_x[t] += xs[s];
+            sum_y[t] += ys[s];
+            count[t] += 1;
+        }
+        if known[t] && !known[s] {
+            sum_x[s] += xs[t];
+            sum_y[s] += ys[t];
+            count[s] += 1;
+        }
+    }
+    let radius = known.iter().filter(|k| **k).count() as f32;
+    for i in 0..n {
+        if known[i] {
+            continue;
+        }
+        let angle = i as f32 * 2.399_963;
+        if count[i] > 0 {
+            xs[i] = sum_x[i] / count[i] as f32 + angle.cos() * length;
+            ys[i] = sum_y[i] / count[i] as f32 + angle.sin() * length;
+        } else {
+            let r = length * (radius + i as f32).sqrt();
+            xs[i] = angle.cos() * r;
+            ys[i] = angle.sin() * r;
+        }
+    }
+}
+
+/// run the layout in place, repulsion is computed in parallel on the current rayon pool
+pub fn layout(xs: &mut [f32], ys: &mut [f32], sources: &[u32], targets: &[u32], params: &LayoutParams) {
+    let n = xs.len();
+    if n == 0 {
+        return;
+    }
+    let k = params.length;
+    let k2 = k * k;
+    let bodies: Vec<u32> = (0..n as u32).collect();
+    for iteration in 0..params.iterations {
+        let tree = QuadTree::build(xs, ys);
+        let (px, py): (&[f32], &[f32]) = (xs, ys);
+        let mut disp: Vec<(f32, f32)> = bodies
+            .par_iter()
+            .map(|&i| tree.repulsion(i, px[i as usize], py[i as usize], params.theta, k2))
+            .collect();
+        for (&s, &t) in sources.iter().zip(targets) {
+            let (s, t) = (s as usize, t as usize);
+            if s == t {
+                continue;
+            }
+            let (dx, dy) = (xs[s] - xs[t], ys[s] - ys[t]);
+            let f = (dx * dx + dy * dy).sqrt() / k;
+            disp[s].0 -= dx * f;
+            disp[s].1 -= dy * f;
+            disp[t].0 += dx * f;
+            disp[t].1 += dy * f;
+        }
+        let temperature = params.temperature * (1.0 - iteration as f32 / params.iterations as f32);
+        for (i, (dx, dy)) in disp.into_iter().enumerate() {
+            let (dx, dy) = (dx - params.gravity * k * xs[i], dy - params.gravity * k * ys[i]);
+            let d = (dx * dx + dy * dy).sqrt();
+            if d > 0.0 {
+                let step = d.min(temperature) / d;
+                xs[i] += dx * step;
+                ys[i] += dy * step;
+            }
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// exact repulsion and the sum of the magnitudes of its terms
+    fn brute_force(i: usize, xs: &[f32], ys: &[f32], k2: f32) -> (f32, f32, f32) {
+        let (mut fx, mut fy, mut scale) = (0.0, 0.0, 0.0);
+        for j in 0..xs.len() {
+            if j != i {
+                let (dx, dy) = (xs[i] - xs[j], ys[i] - ys[j]);
+                let d2 = dx * dx + dy * dy;
+                fx += dx * k2 / d2;
+                fy += dy * k2 / d2;
+                scale += k2 / d2.sqrt();
+            }
+        }
+        (fx, fy, scale)
+    }
+
+    #[test]
+    fn repulsion_matches_brute_force() {
+        let n = 500;
+        let xs: Vec<f32> = (0..n).map(|i| ((i * 7919) % 1000) as f32).collect();
+        let ys: Vec<f32> = (0..n).map(|i| ((i * 104_729) % 997) as f32).collect();
+        let tree = QuadTree::build(&xs, &ys);
+        for i in 0..n {
+            let exact = tree.repulsion(i as u32, xs[i], ys[i], 0.0, 900.0);
+            let expected = brute_force(i, &xs, &ys, 900.0);
+            let (x, y, scale) = expected;
+            assert!(((exact.0 - x).powi(2) + (exact.1 - y).powi(2)).sqrt() < 1e-4 * scale);
+            let approx = tree.repulsion(i as u32, xs[i], ys[i], 0.8, 900.0);
+            assert!(((approx.0 - x).powi(2) + (approx.1 - y).powi(2)).sqrt() < 0.05 * scale);
+        }
+    }
+
+    #[test]
+    fn layout_pulls_linked_nodes_together() {
+        // two triangles, far apart at first
+        let sources = [0, 1, 2, 3, 4, 5];
+        let targets = [1, 2, 0, 4, 5, 3];
+        let mut xs = vec![0.0; 6];
+        let mut ys = vec![0.0; 6];
+        seed(&mut xs, &mut ys, &[false; 6], &sources, &targets, 30.0);
+        layout(&mut xs, &mut ys, &sources, &targets, &LayoutParams::default());
+        let distance = |a: usize, b: usize| ((xs[a] - xs[b]).powi(2) + (ys[a] - ys[b]).powi(2)).sqrt();
+        assert!(xs.iter().chain(&ys).all(|v| v.is_finite()));
+        assert!(distance(0, 1) < distance(0, 3));
+        assert!(distance(3, 4) < distance(3, 0));
+    }
+
+    #[test]
+    fn seed_places_new_nodes_near_neighbors() {
+        let mut xs = vec![1000.0, 0.0, 0.0];
+        let mut ys = vec![1000.0, 0.0, 0.0];
+        seed(&mut xs, &mut ys, &[true, false, false], &[1], &[0], 30.0);
+        assert!((xs[0], ys[0]) == (1000.0, 1000.0));
+        assert!(((xs[1] - 1000.0).powi(2) + (ys[1] - 1000.0).powi(2)).sqrt() <= 30.01);
+        assert!((xs[2].powi(2) + ys[2].powi(2)).sqrt() > 0.0);
+    }
+}
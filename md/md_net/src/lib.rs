@@ -1,2 +1,5 @@
+pub mod analytics;
 pub mod ffi;
+pub mod layout;
 pub mod net;
+pub mod trigram;
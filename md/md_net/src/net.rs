@@ -1,6 +1,13 @@
+use crate::analytics::{self, Analytics, PageRankParams};
+use crate::layout::{self, LayoutParams};
+use crate::trigram::{self, Postings};
+use md_parser::expr::RawLink;
 use md_parser::generator::NetGenerator;
-use std::collections::HashSet;
+use rayon::prelude::{IntoParallelRefIterator, ParallelIterator};
+use rayon::{ThreadPool, ThreadPoolBuilder};
+use std::collections::{HashMap, HashSet};
 use std::fs;
+use std::hash::{Hash, Hasher};
 
 #[derive(Debug, Clone)]
 pub struct NoteSchema {
@@ -29,12 +36,20 @@ pub struct NetNodeSchema {
     pub pos: Vector,
 }
 
-#[derive(Debug, Clone, Hash)]
+#[derive(Debug, Clone)]
 pub struct NetLinkSchema {
     pub source: usize,
     pub target: usize,
 }
 
+impl Hash for NetLinkSchema {
+    fn hash<H: Hasher>(&self, state: &mut H) {
+        // links are undirected, must agree with `PartialEq`
+        self.source.min(self.target).hash(state);
+        self.source.max(self.target).hash(state);
+    }
+}
+
 impl PartialEq for NetLinkSchema {
     fn eq(&self, other: &Self) -> bool {
         (self.source == other.source && self.target == other.target)
@@ -44,20 +59,60 @@ impl PartialEq for NetLinkSchema {
 
 impl Eq for NetLinkSchema {}
 
+#[derive(Debug, Clone)]
+pub struct NetRefSchema {
+    pub note_id: usize,
+    pub data: String,
+    pub is_md: bool,
+}
+
 #[derive(Debug, Clone)]
 pub struct NetSchema {
     pub nodes: Vec<NetNodeSchema>,
     pub links: Vec<NetLinkSchema>,
 }
 
-pub struct MultiNetGenerator;
+pub struct MultiNetGenerator {
+    pool: ThreadPool,
+}
 
 impl MultiNetGenerator {
-    pub fn new() -> Self {
-        Self
+    /// `workers` is the size of the extraction thread pool, 0 means one worker per logical core
+    pub fn new(workers: usize) -> Self {
+        let pool = ThreadPoolBuilder::new()
+            .num_threads(workers)
+            .build()
+            .unwrap();
+        Self { pool }
+    }
+
+    pub fn get_workers(&self) -> usize {
+        self.pool.current_num_threads()
+    }
+
+    /// read and parse every note file in parallel, keep the order of `notes`
+    pub fn read_refs(&self, notes: &[NoteSchema]) -> Vec<Vec<RawLink>> {
+        self.pool.install(|| {
+            notes
+                .par_iter()
+                .map(|note| {
+                    let input = fs::read_to_string(&note.url).unwrap_or_default();
+                    self.get_refs(input)
+                })
+                .collect()
+        })
     }
 
     pub fn generate(&self, notes: Vec<NoteSchema>) -> NetSchema {
+        let refs = self.read_refs(&notes);
+        Self::resolve(&notes, refs)
+    }
+
+    /// build the net from the links of each note, `refs[i]` belongs to `notes[i]`
+    ///
+    /// note names and resource names are resolved through hash maps, a resource
+    /// referenced by several notes is a single node
+    pub fn resolve(notes: &[NoteSchema], refs: Vec<Vec<RawLink>>) -> NetSchema {
         let mut nodes: Vec<NetNodeSchema> = notes
             .iter()
             .map(|n| NetNodeSchema {
@@ -67,46 +122,104 @@ impl MultiNetGenerator {
                 pos: Vector { x: 0, y: 0 },
             })
             .collect();
+        let mut md_index: HashMap<&str, usize> = HashMap::with_capacity(notes.len());
+        for (i, n) in notes.iter().enumerate() {
+            md_index.entry(n.name.as_str()).or_insert(i);
+        }
+        let mut res_index: HashMap<String, usize> = HashMap::new();
         let mut link_set: HashSet<NetLinkSchema> = HashSet::new();
-        for (i, note) in notes.iter().enumerate() {
-            let input = fs::read_to_string(&note.url).unwrap();
-            let links = self.get_refs(input);
-            links.iter().for_each(|l| {
-                match &l.href {
-                    Some(h) => {
-                        if !l.is_md {
-                            nodes.push(NetNodeSchema {
-                                id: 0,
-                                data: l.content.clone(),
-                                is_md: false,
-                                pos: Vector { x: 0, y: 0 },
-                            });
-                            link_set.insert(NetLinkSchema {
-                                source: i,
-                                target: nodes.len() - 1,
-                            });
-                        } else {
-                            let idx = nodes.iter().position(|n| {
-                                let name = &h[5..];
-                                n.data == name
-                            });
-                            if let Some(idx) = idx {
-                                link_set.insert(NetLinkSchema {
-                                    source: i,
-                                    target: idx,
-                                });
-                            }
-                        }
-                    }
-                    None => (),
+        for (i, links) in refs.into_iter().enumerate() {
+            for l in links {
+                let target = match &l.href {
+                    Some(h) if l.is_md => md_index.get(&h[5..]).copied(),
+                    Some(_) => Some(*res_index.entry(l.content).or_insert_with_key(|content| {
+                        nodes.push(NetNodeSchema {
+                            id: 0,
+                            data: content.clone(),
+                            is_md: false,
+                            pos: Vector { x: 0, y: 0 },
+                        });
+                        nodes.len() - 1
+                    })),
+                    None => None,
                 };
-            })
+                if let Some(target) = target {
+                    link_set.insert(NetLinkSchema { source: i, target });
+                }
+            }
         }
         NetSchema {
             nodes,
             links: link_set.into_iter().collect(),
         }
     }
+
+    pub fn extract(&self, notes: Vec<NoteSchema>) -> Vec<NetRefSchema> {
+        let mut refs = Vec::new();
+        for (note, links) in notes.iter().zip(self.read_refs(&notes)) {
+            links.into_iter().for_each(|l| {
+                if let Some(h) = &l.href {
+                    refs.push(NetRefSchema {
+                        note_id: note.id,
+                        data: if l.is_md {
+                            h[5..].to_string()
+                        } else {
+                            l.content
+                        },
+                        is_md: l.is_md,
+                    });
+                }
+            })
+        }
+        refs
+    }
+
+    /// lay out the net in place on the extraction thread pool, nodes with
+    /// `known[i] == false` are seeded next to their placed neighbors first
+    pub fn layout(
+        &self,
+        xs: &mut [f32],
+        ys: &mut [f32],
+        known: &[bool],
+        sources: &[u32],
+        targets: &[u32],
+        params: &LayoutParams,
+    ) {
+        layout::seed(xs, ys, known, sources, targets, params.length);
+        self.pool
+            .install(|| layout::layout(xs, ys, sources, targets, params))
+    }
+
+    /// PageRank, components and degrees of the directed link graph on the extraction thread pool
+    pub fn analyze(
+        &self,
+        n: usize,
+        sources: &[u32],
+        targets: &[u32],
+        params: &PageRankParams,
+    ) -> Analytics {
+        self.pool
+            .install(|| analytics::analyze(n, sources, targets, params))
+    }
+
+    /// read the note files in parallel batches and build the trigram posting lists of their contents
+    pub fn trigrams(&self, mut notes: Vec<NoteSchema>) -> Postings {
+        notes.sort_unstable_by_key(|n| n.id);
+        let mut builder = trigram::Builder::default();
+        let batch = self.get_workers() * 64;
+        for chunk in notes.chunks(batch) {
+            let grams: Vec<Vec<u32>> = self.pool.install(|| {
+                chunk
+                    .par_iter()
+                    .map(|note| trigram::trigrams(&fs::read(&note.url).unwrap_or_default()))
+                    .collect()
+            });
+            for (note, grams) in chunk.iter().zip(&grams) {
+                builder.add(note.id as u32, grams);
+            }
+        }
+        self.pool.install(|| builder.finish())
+    }
 }
 
 impl NetGenerator for MultiNetGenerator {}
@@ -0,0 +1,193 @@
+//! trigram posting lists for substring and regex prefiltering
+//!
+//! Text is lowercased (ASCII only) before it is cut into trigrams, trigram
+//! `abc` is `a << 16 | b << 8 | c`. The posting list of a trigram holds the
+//! ids of the notes containing it, delta-encoded as LEB128 varints, or as a
+//! bitset over note ids when that is smaller. Its first byte is the kind.
+use std::collections::HashMap;
+
+use rayon::prelude::*;
+
+pub const VARINT: u8 = 0;
+pub const BITSET: u8 = 1;
+
+/// sorted distinct trigrams of `data`
+pub fn trigrams(data: &[u8]) -> Vec<u32> {
+    let mut grams: Vec<u32> = data
+        .windows(3)
+        .map(|w| {
+            (w[0].to_ascii_lowercase() as u32) << 16
+                | (w[1].to_ascii_lowercase() as u32) << 8
+                | w[2].to_ascii_lowercase() as u32
+        })
+        .collect();
+    grams.sort_unstable();
+    grams.dedup();
+    grams
+}
+
+/// posting lists by trigram, the list of `keys[i]` is `data[offsets[i]..offsets[i + 1]]`
+pub struct Postings {
+    pub keys: Vec<u32>,
+    pub offsets: Vec<u64>,
+    pub data: Vec<u8>,
+}
+
+/// incremental inversion, notes are added in ascending id order and each
+/// posting list grows as varints, so memory stays near the encoded size
+#[derive(Default)]
+pub struct Builder {
+    /// slot of each seen trigram in `lists`, only the trigrams of the notes take memory
+    slots: HashMap<u32, u32>,
+    /// trigram, last note id and the varint deltas of each seen trigram
+    lists: Vec<(u32, u32, Vec<u8>)>,
+    universe: usize,
+}
+
+impl Builder {
+    /// add the trigrams of a note, `id` must be larger than every id added before
+    pub fn add(&mut self, id: u32, grams: &[u32]) {
+        self.universe = id as usize + 1;
+        for &g in grams {
+            let lists = &mut self.lists;
+            let slot = *self.slots.entry(g).or_insert_with(|| {
+                lists.push((g, 0, Vec::new()));
+                lists.len() as u32 - 1
+            });
+            let (_, last, list) = &mut self.lists[slot as usize];
+            let mut delta = id - *last;
+            *last = id;
+            while delta >= 0x80 {
+                list.push(delta as u8 | 0x80);
+                delta >>= 7;
+            }
+            list.push(delta as u8);
+        }
+    }
+
+    /// sort by trigram and pick the smaller encoding of each list
+    pub fn finish(mut self) -> Postings {
+        self.slots = HashMap::new();
+        self.lists.sort_unstable_by_key(|(g, _, _)| *g);
+        let universe = self.universe;
+        let lists: Vec<Vec<u8>> = self
+            .lists
+            .par_iter()
+            .map(|(_, _, varint)| {
+                let bitset_len = 1 + (universe + 7) / 8;
+                if 1 + varint.len() <= bitset_len {
+                    let mut list = Vec::with_capacity(1 + varint.len());
+                    list.push(VARINT);
+                    list.extend_from_slice(varint);
+                    return list;
+                }
+                let mut list = vec![0u8; bitset_len];
+                list[0] = BITSET;
+                let (mut last, mut delta, mut shift) = (0u32, 0u32, 0);
+                for &b in varint {
+                    delta |= ((b & 0x7f) as u32) << shift;
+                    shift += 7;
+                    if b & 0x80 == 0 {
+                        last += delta;
+                        list[1 + last as usize / 8] |= 1 << (last % 8);
+                        (delta, shift) = (0, 0);
+                    }
+                }
+                list
+            })
+            .collect();
+        let keys = self.lists.iter().map(|(g, _, _)| *g).collect();
+        self.lists = Vec::new();
+        let mut offsets = Vec::with_capacity(lists.len() + 1);
+        offsets.push(0);
+        let mut data = Vec::with_capacity(lists.iter().map(|l| l.len()).sum());
+        for l in lists {
+            data.extend_from_slice(&l);
+            offsets.push(data.len() as u64);
+        }
+        Postings { keys, offsets, data }
+    }
+}
+
+/// decode a posting list back into note ids
+pub fn decode(list: &[u8]) -> Vec<u32> {
+    let mut ids = Vec::new();
+    match list.first() {
+        Some(&VARINT) => {
+            let (mut last, mut delta, mut shift) = (0u32, 0u32, 0);
+            for &b in &list[1..] {
+                delta |= ((b & 0x7f) as u32) << shift;
+                shift += 7;
+                if b & 0x80 == 0 {
+                    last += delta;
+                    ids.push(last);
+                    (delta, shift) = (0, 0);
+                }
+            }
+        }
+        Some(&BITSET) => {
+            for (i, &b) in list[1..].iter().enumerate() {
+                for bit in 0..8 {
+                    if b & 1 << bit != 0 {
+                        ids.push((i * 8 + bit) as u32);
+                    }
+                }
+            }
+        }
+        _ => {}
+    }
+    ids
+}
+
+/// invert the trigrams of each note, `grams[i]` belongs to `ids[i]`, ids ascending
+pub fn build(ids: &[u32], grams: &[Vec<u32>]) -> Postings {
+    let mut builder = Builder::default();
+    for (&id, grams) in ids.iter().zip(grams) {
+        builder.add(id, grams);
+    }
+    builder.finish()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn trigrams_are_lowercase_and_distinct() {
+        let grams = trigrams(b"AbcAbc");
+        let expect = |s: &[u8]| (s[0] as u32) << 16 | (s[1] as u32) << 8 | s[2] as u32;
+        assert_eq!(grams, {
+            let mut g = vec![expect(b"abc"), expect(b"bca"), expect(b"cab")];
+            g.sort();
+            g
+        });
+        assert!(trigrams(b"ab").is_empty());
+    }
+
+    #[test]
+    fn postings_round_trip() {
+        let ids: Vec<u32> = (0..300).map(|i| i * 3 + 1).collect();
+        // trigram 7 in every note, trigram 9 in every tenth, trigram 11 in one
+        let grams: Vec<Vec<u32>> = ids
+            .iter()
+            .map(|&id| {
+                let mut g = vec![7];
+                if id % 10 == 1 {
+                    g.push(9);
+                }
+                if id == 301 {
+                    g.push(11);
+                }
+                g
+            })
+            .collect();
+        let postings = build(&ids, &grams);
+        assert_eq!(postings.keys, vec![7, 9, 11]);
+        let list = |i: usize| &postings.data[postings.offsets[i] as usize..postings.offsets[i + 1] as usize];
+        assert_eq!(list(0)[0], BITSET);
+        assert_eq!(list(2)[0], VARINT);
+        assert_eq!(decode(list(0)), ids);
+        assert_eq!(decode(list(1)), ids.iter().copied().filter(|id| id % 10 == 1).collect::<Vec<_>>());
+        assert_eq!(decode(list(2)), vec![301]);
+    }
+}
@@ -59,7 +59,14 @@ if ($Update -eq $true) {
     Move-Item .\PapPack\dist .\dist
     Move-Item .\PapPack\src-python .\src-python
     Move-Item .\PapPack\README.md .\README.md
-    Move-Item .\PapPack\md_net.dll .\md_net.dll
+    foreach ($lib in "md_net.dll", "mdencoder.dll") {
+        if (Test-Path -Path ".\PapPack\$lib") {
+            Move-Item ".\PapPack\$lib" ".\$lib" -Force
+        }
+        else {
+            Write-Warning "$lib is not in this release, build it with scripts\tool.ps1 -Build"
+        }
+    }
     Move-Item .\PapPack\requirements_release.txt .\requirements_release.txt
 
     Remove-Item .\PapPack -Recurse -Force
@@ -51,7 +51,13 @@ if [ "$Update" = true ]; then
     mv ./PapPack/dist ./dist
     mv ./PapPack/src-python ./src-python
     mv ./PapPack/README.md ./README.md
-    mv ./PapPack/libmd_net.so ./libmd_net.so
+    for lib in libmd_net.so libmdencoder.so; do
+        if [ -f "./PapPack/$lib" ]; then
+            mv "./PapPack/$lib" "./$lib"
+        else
+            echo "warning: $lib is not in this release, build it with scripts/tool.sh --build"
+        fi
+    done
     mv ./PapPack/requirements_release.txt ./requirements_release.txt
 
     rm ./PapPack -r
@@ -30,6 +30,12 @@ build_rust() {
     cp ./target/release/libmd_net.so ..
     cd ..
 
+    cd ./md/md_encoder
+    cargo build --release
+    cd ..
+    cp ./target/release/libmdencoder.so ..
+    cd ..
+
     cd sim
     cargo build --release
     wasm-pack build
@@ -69,6 +69,12 @@ function Build-Rust {
     Copy-Item -Path .\target\release\md_net.dll -Destination ..
     Set-Location ..
 
+    Set-Location .\md\md_encoder
+    cargo build --release
+    Set-Location ..
+    Copy-Item -Path .\target\release\mdencoder.dll -Destination ..
+    Set-Location ..
+
     Set-Location .\sim
     cargo build --release
     wasm-pack build
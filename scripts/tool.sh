@@ -31,6 +31,24 @@ build_rust() {
     cp ./target/release/libmd_net.so ..
     cd ..
 
+    cd ./md/md_encoder
+    cargo build --release
+    cd ..
+    cp ./target/release/libmdencoder.so ..
+    cd ..
+
+    # the Windows libraries of the release, cross compiled with MinGW
+    if command -v x86_64-w64-mingw32-gcc > /dev/null; then
+        rustup target add x86_64-pc-windows-gnu
+        cd ./md
+        cargo build --release --target x86_64-pc-windows-gnu -p md_net -p md_encoder
+        cp ./target/x86_64-pc-windows-gnu/release/md_net.dll ..
+        cp ./target/x86_64-pc-windows-gnu/release/mdencoder.dll ..
+        cd ..
+    else
+        echo "warning: x86_64-w64-mingw32-gcc is not installed, the Windows libraries are not built"
+    fi
+
     cd sim
     cargo build --release
     wasm-pack build
@@ -43,8 +61,14 @@ pack() {
     fi
     mkdir PapPack
     mkdir PapPack/data
-    cp libmd_net.so PapPack/
-    cp md_net.dll PapPack/
+    # only the libraries built from this tree, a stale one fails to bind its exports at import
+    for lib in libmd_net.so md_net.dll libmdencoder.so mdencoder.dll; do
+        if [ -f "$lib" ]; then
+            cp "$lib" PapPack/
+        else
+            echo "warning: $lib is not built, it is not packed"
+        fi
+    done
     cp data/config.toml PapPack/data/ -r
     cp data/emoji.db PapPack/data/ -r
     cp dist PapPack/dist -r
@@ -55,6 +79,7 @@ pack() {
     cp scripts/pap.sh PapPack/
     cp scripts/pap.sh.man PapPack/
     rm PapPack/src-python/test -r
+    rm PapPack/src-python/bench -r
     chmod 774 scripts/pap.sh
 }
 
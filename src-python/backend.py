@@ -1,9 +1,17 @@
+from contextlib import asynccontextmanager
+from mimetypes import guess_type
+from os import PathLike, stat_result
+
 from router import login, config, note, tag, emoji, net, resource
 from model.note_group import Base
 from service.logger import logger
 from service.config import system_config, dev_config
 from service.database import engine
+from service.migration import migrate
 from service.security import authentication_manager
+from service.grep import note_grep
+from service.trigram import trigram_index
+from service.write_behind import note_buffer
 
 from uvicorn import run
 from fastapi import FastAPI, Response, status
@@ -11,6 +19,7 @@ from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.requests import Request
+from starlette.types import Scope
 
 # system init
 host = system_config.host
@@ -20,9 +29,22 @@ backend_port = system_config.backend_port
 
 # database ORM init
 Base.metadata.create_all(bind=engine)
+migrate(engine)
+
+
+# app lifespan
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """write the buffered note saves, stop the worker processes and unmap the trigram index on shutdown
+    """
+    yield
+    note_buffer.close()
+    note_grep.close()
+    trigram_index.close()
+
 
 # FastAPI app
-app = FastAPI(debug=dev_config.debug)
+app = FastAPI(debug=dev_config.debug, lifespan=lifespan)
 
 # templates
 templates = Jinja2Templates(directory="dist")
@@ -70,8 +92,20 @@ app.add_middleware(
 )
 
 # static files
+class NoteStaticFiles(StaticFiles):
+    """static note files, the content of a note still in the write-behind buffer is served from it
+    """
+
+    def file_response(self, full_path: str | PathLike[str], stat_result: stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        if (data := note_buffer.get_file(str(full_path))) is not None:
+            return Response(data, status_code=status_code,
+                            media_type=guess_type(str(full_path))[0] or "text/plain")
+        return super().file_response(full_path, stat_result, scope, status_code)
+
+
 app.mount("/assets", StaticFiles(directory="dist/assets"), name="assets")
-app.mount("/data/note", StaticFiles(directory="data/note"), name="note")
+app.mount("/data/note", NoteStaticFiles(directory="data/note"), name="note")
 app.mount("/data/res", StaticFiles(directory="data/res"), name="res")
 
 # router
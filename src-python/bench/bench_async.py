@@ -0,0 +1,152 @@
+"""async database load test, read requests served by one uvicorn worker
+
+Each run starts a server process with the note and tag routers on a
+temporary database, then keeps a fixed number of requests in flight. The
+`sync` target is the read route as it was before the async session layer, a
+`def` handler in the threadpool on the sync read only pool, the `async`
+target is the route of `router.note`, an `async def` handler awaiting the
+aiosqlite read only pool.
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_async
+"""
+from asyncio import run, gather, sleep as async_sleep, Event
+from os import path
+from random import Random
+from socket import socket
+from subprocess import Popen
+from sys import argv, executable
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+
+from bench.bench_concurrency import create_database, NOTES
+
+from httpx import AsyncClient, Limits, HTTPError
+
+CONCURRENCY = [8, 32, 64, 256]
+SECONDS = 5.0
+TARGETS = {"sync": "/sync/get_note_by_name", "async": "/note/get_note_by_name"}
+
+
+def serve(db_path: str, port: int) -> None:
+    """server process, one worker with both targets mounted
+    """
+    from router import note as note_router, tag as tag_router
+    from service.config import database_config
+    from service.crud import note
+    from service.database import (create_database_engine, create_async_database_engine,
+                                  get_read_db, get_async_read_db)
+    from service.logger import logger
+
+    from fastapi import FastAPI, Depends, HTTPException, status
+    from sqlalchemy.orm import sessionmaker, Session
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from uvicorn import run as run_server
+
+    # request logs would be most of the handler time
+    logger.setLevel("WARNING")
+    ReadSession = sessionmaker(autocommit=False, autoflush=False,
+                               bind=create_database_engine(f"sqlite:///{db_path}", database_config.readers))
+    AsyncReadSession = async_sessionmaker(autoflush=False, bind=create_async_database_engine(
+        f"sqlite+aiosqlite:///{db_path}", database_config.readers))
+
+    def override_get_read_db():
+        db = ReadSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_read_db():
+        async with AsyncReadSession() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(note_router.router)
+    app.include_router(tag_router.router)
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_read_db
+
+    @app.get("/sync/get_note_by_name")
+    def get_note_by_name(note_name: str, db: Session = Depends(get_read_db)) -> dict:
+        if data := note.get_note_by_name(db, note_name):
+            return {"id": data.id, "name": data.name, "url": data.url,
+                    "tags": [{"id": t.id, "name": t.name, "color": t.color} for t in data.tags]}
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    run_server(app, host="127.0.0.1", port=port, workers=1, log_level="warning")
+
+
+async def load(port: int, target: str, concurrency: int) -> tuple[float, float, float, int]:
+    """keep `concurrency` requests in flight for `SECONDS`
+
+    Returns:
+        tuple[float, float, float, int]: requests/s, p50 and p99 latency in ms, failed requests
+    """
+    latencies: list[float] = []
+    failed = 0
+    stop = Event()
+
+    async def client(client_id: int, http: AsyncClient) -> None:
+        nonlocal failed
+        rand = Random(client_id)
+        while not stop.is_set():
+            start = perf_counter()
+            try:
+                response = await http.get(target, params={"note_name": f"n{rand.randint(1, NOTES)}"})
+                response.raise_for_status()
+                latencies.append(perf_counter() - start)
+            except HTTPError:
+                failed += 1
+
+    async def timer() -> None:
+        await async_sleep(SECONDS)
+        stop.set()
+
+    async with AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60,
+                           limits=Limits(max_connections=concurrency)) as http:
+        start = perf_counter()
+        await gather(timer(), *(client(i, http) for i in range(concurrency)))
+        elapsed = perf_counter() - start
+    latencies.sort()
+    if not latencies:
+        return 0.0, 0.0, 0.0, failed
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[len(latencies) * 99 // 100] * 1000, failed)
+
+
+def free_port() -> int:
+    with socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int) -> None:
+    for _ in range(200):
+        with socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        sleep(0.05)
+    raise RuntimeError("server didn't start")
+
+
+if __name__ == "__main__":
+    if len(argv) == 4 and argv[1] == "serve":
+        serve(argv[2], int(argv[3]))
+    else:
+        with TemporaryDirectory() as tmp:
+            db_path = path.join(tmp, "tag.db")
+            create_database(db_path)
+            port = free_port()
+            server = Popen([executable, "-m", "bench.bench_async", "serve", db_path, str(port)])
+            try:
+                wait_ready(port)
+                print(f"{NOTES} notes, 1 worker, {SECONDS:.0f} s per run")
+                for concurrency in CONCURRENCY:
+                    for name, target in TARGETS.items():
+                        rps, p50, p99, failed = run(load(port, target, concurrency))
+                        print(f"{concurrency:>4} in flight | {name:>5} | {rps:>6.0f} req/s "
+                              f"p50 {p50:>7.1f} ms p99 {p99:>7.1f} ms {failed:>5} failed")
+            finally:
+                server.terminate()
+                server.wait()
@@ -0,0 +1,102 @@
+"""bulk note and tag routes benchmark, rows per second of one request per item against one batch
+
+Each run starts on a fresh database with the profile of `config.toml`, the
+notes are created, tagged and deleted through the routes, once per item
+and once in batches.
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_bulk
+"""
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest.mock import patch
+
+from backend import app
+from model.note_group import Base
+from service.config import path_config
+from service.database import create_database_engine, get_db, get_read_db, get_session_factory, \
+    get_read_session_factory
+from service.migration import migrate
+from service.net import net_index
+from service.search import note_search
+
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+SIZES = [500, 5_000]
+TAGS = 5
+# one request per item is slow, it runs on the first rows only
+SINGLE = 500
+BATCH = 1_000
+
+
+def session(tmp: str) -> TestClient:
+    engine = create_database_engine(f"sqlite:///{path.join(tmp, 'tag.db')}")
+    Base.metadata.create_all(engine)
+    migrate(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: SessionLocal
+    app.dependency_overrides[get_read_session_factory] = lambda: SessionLocal
+    net_index.is_ready = False
+    note_search.is_ready = False
+    return TestClient(app)
+
+
+def single(client: TestClient, size: int) -> tuple[float, float, float]:
+    start = perf_counter()
+    notes_id = [client.post("/note/create_note", json={"name": f"n{i}"}).json()["id"] for i in range(size)]
+    create = perf_counter() - start
+    tags_id = [client.post("/tag/create_tag", json={"name": f"t{i}", "color": "#FFFFFF",
+                                                    "note_id": notes_id[0]}).json()["id"] for i in range(TAGS)]
+    start = perf_counter()
+    for tag_id in tags_id:
+        for note_id in notes_id[1:]:
+            client.put(f"/tag/add_tag?tag_id={tag_id}&note_id={note_id}")
+    assign = perf_counter() - start
+    start = perf_counter()
+    for note_id in notes_id:
+        client.delete(f"/note/delete_note?note_id={note_id}")
+    delete = perf_counter() - start
+    return size / create, TAGS * (size - 1) / assign, size / delete
+
+
+def bulk(client: TestClient, size: int) -> tuple[float, float, float]:
+    start = perf_counter()
+    notes_id = [n["id"] for i in range(0, size, BATCH) for n in client.post(
+        "/note/bulk_create", json=[{"name": f"n{j}"} for j in range(i, min(i + BATCH, size))]).json()]
+    create = perf_counter() - start
+    tags_id = [client.post("/tag/create_tag", json={"name": f"t{i}", "color": "#FFFFFF",
+                                                    "note_id": notes_id[0]}).json()["id"] for i in range(TAGS)]
+    start = perf_counter()
+    for i in range(1, size, BATCH):
+        client.put("/tag/bulk_assign", json={"tags_id": tags_id, "notes_id": notes_id[i:i + BATCH]})
+    assign = perf_counter() - start
+    start = perf_counter()
+    for i in range(0, size, BATCH):
+        client.post("/note/bulk_delete", json={"notes_id": notes_id[i:i + BATCH]})
+    delete = perf_counter() - start
+    return size / create, TAGS * (size - 1) / assign, size / delete
+
+
+if __name__ == "__main__":
+    print(f"{TAGS} tags per note, batches of {BATCH}, rows/s")
+    for size in SIZES:
+        for name, run in (("single", single), ("bulk", bulk)):
+            if name == "single" and size > SINGLE:
+                continue
+            with TemporaryDirectory() as tmp, \
+                    patch.object(type(path_config), "note_dir", property(lambda _self: tmp)):
+                create, assign, delete = run(session(tmp), size)
+            print(f"{size:>6} notes | {name:>6} | create {create:>8.0f} | "
+                  f"assign {assign:>8.0f} | delete {delete:>8.0f}")
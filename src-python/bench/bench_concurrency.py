@@ -0,0 +1,113 @@
+"""database concurrency benchmark, mixed read/write throughput of threadpool handlers
+
+Compares the engine before the database profile, default pool and rollback
+journal, with the profile of `config.toml`: one writer connection and a pool
+of read only connections with the pragmas applied.
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_concurrency
+"""
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+from threading import Thread, Event
+from time import perf_counter, sleep
+
+from model.note_group import Base, NoteModel, TagModel, note_tag_association
+from service.config import database_config
+from service.crud import note as note_crud, tag as tag_crud
+from service.database import create_database_engine
+
+from sqlalchemy import create_engine, insert, Engine
+from sqlalchemy.exc import OperationalError, TimeoutError
+from sqlalchemy.orm import sessionmaker
+
+NOTES = 20_000
+TAGS = 200
+TAGS_PER_NOTE = 5
+THREADS = [4, 16]
+WRITE_SHARE = [0.1, 0.5]
+SECONDS = 5.0
+
+
+def create_database(db_path: str) -> None:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    rand = Random(0)
+    with sessionmaker(bind=engine)() as db:
+        db.execute(insert(NoteModel), [{"id": i, "name": f"n{i}", "url": f"{i}.md"}
+                                       for i in range(1, NOTES + 1)])
+        db.execute(insert(TagModel), [{"id": i, "name": f"t{i}", "color": "#FFFFFF"}
+                                      for i in range(1, TAGS + 1)])
+        db.execute(insert(note_tag_association), [{"note_id": n, "tag_id": t} for n, t in
+                                                  {(n, rand.randint(1, TAGS)) for n in range(1, NOTES + 1)
+                                                   for _ in range(TAGS_PER_NOTE)}])
+        db.commit()
+    engine.dispose()
+
+
+def run(read_engine: Engine, write_engine: Engine, threads: int, write_share: float) -> tuple[float, float, int]:
+    """handlers in threads, each a read (a note by name with its tags) or a write (tag a note, untag it)
+
+    Returns:
+        tuple[float, float, int]: reads/s, writes/s, failed requests
+    """
+    ReadSession = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    WriteSession = sessionmaker(autocommit=False, autoflush=False, bind=write_engine)
+    stop = Event()
+    counts = [[0, 0, 0] for _ in range(threads)]
+
+    def handler(i: int) -> None:
+        rand = Random(i)
+        while not stop.is_set():
+            try:
+                if rand.random() < write_share:
+                    with WriteSession() as db:
+                        note_id, tag_id = rand.randint(1, NOTES), rand.randint(1, TAGS)
+                        tag_crud.add_tag(db, tag_id, note_id)
+                        tag_crud.remove_tag(db, tag_id, note_id)
+                    counts[i][1] += 1
+                else:
+                    with ReadSession() as db:
+                        if note := note_crud.get_note_by_name(db, f"n{rand.randint(1, NOTES)}"):
+                            list(note.tags)
+                    counts[i][0] += 1
+            except (OperationalError, TimeoutError):
+                # database is locked, or no connection within the pool timeout
+                counts[i][2] += 1
+
+    workers = [Thread(target=handler, args=(i,)) for i in range(threads)]
+    start = perf_counter()
+    for worker in workers:
+        worker.start()
+    sleep(SECONDS)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    elapsed = perf_counter() - start
+    return (sum(c[0] for c in counts) / elapsed, sum(c[1] for c in counts) / elapsed,
+            sum(c[2] for c in counts))
+
+
+if __name__ == "__main__":
+    with TemporaryDirectory() as tmp:
+        db_path = path.join(tmp, "tag.db")
+        create_database(db_path)
+        url = f"sqlite:///{db_path}"
+        print(f"{NOTES} notes, {TAGS} tags, {SECONDS:.0f} s per run | profile: {database_config.model}")
+        for threads in THREADS:
+            for write_share in WRITE_SHARE:
+                # before: one default engine for both, rollback journal
+                default = create_engine(url, connect_args={"check_same_thread": False})
+                with default.connect() as conn:
+                    conn.exec_driver_sql("PRAGMA journal_mode = DELETE")
+                before = run(default, default, threads, write_share)
+                default.dispose()
+                writer = create_database_engine(url)
+                reader = create_database_engine(url, database_config.readers)
+                after = run(reader, writer, threads, write_share)
+                writer.dispose()
+                reader.dispose()
+                for name, (reads, writes, failed) in (("before", before), ("after", after)):
+                    print(f"{threads:>3} threads {write_share:>4.0%} writes | {name:>6} | "
+                          f"{reads:>7.0f} reads/s {writes:>6.0f} writes/s {failed:>5} failed")
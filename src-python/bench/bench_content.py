@@ -0,0 +1,73 @@
+"""note content benchmark, latency and body bytes of reopening an unchanged note
+
+`static` is the note file from the `/data/note` mount downloaded in full on
+every open, as the client does. The other cases are `/note/get_content`
+with gzip: `cold` with the LRU cache cleared before each open, `warm` from
+the cache, `304` sends the ETag of the first open and gets no body. Notes
+are random words, markdown compresses about as well.
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_content
+"""
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest.mock import patch
+
+from backend import app
+from bench.bench_bulk import session
+from service.config import path_config
+from service.content_cache import note_contents
+
+from fastapi.testclient import TestClient
+from starlette.routing import Mount
+
+SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+REPEAT = 20
+WORDS = ["note", "笔记", "tag", "- [ ]", "**bold**", "link", "[[net]]", "the", "a", "markdown", "\n", "# title\n"]
+
+
+def body(size: int) -> bytes:
+    rand = Random(size)
+    text = " ".join(rand.choice(WORDS) + str(rand.randint(0, 999)) for _ in range(size // 6)).encode()
+    return text[:size]
+
+
+def reopen(client: TestClient, url: str, encoding: str, revalidate: bool = False,
+           cold: bool = False) -> tuple[float, float]:
+    """mean body bytes and ms of an open after the first one
+    """
+    headers = {"Accept-Encoding": encoding}
+    etag = client.get(url, headers=headers).headers["ETag"]
+    if revalidate:
+        headers["If-None-Match"] = etag
+    received = 0
+    start = perf_counter()
+    for _ in range(REPEAT):
+        if cold:
+            note_contents.clear()
+        response = client.get(url, headers=headers)
+        assert response.status_code == (304 if revalidate else 200)
+        received += response.num_bytes_downloaded
+    return received / REPEAT, (perf_counter() - start) / REPEAT * 1000
+
+
+if __name__ == "__main__":
+    print(f"mean of {REPEAT} reopens, body bytes on the wire")
+    static = next(route.app for route in app.routes if isinstance(route, Mount) and route.path == "/data/note")
+    with TemporaryDirectory() as tmp, \
+            patch.object(type(path_config), "note_dir", property(lambda _self: tmp)), \
+            patch.object(static, "all_directories", [tmp]):
+        client = session(tmp)
+        for size in SIZES:
+            created = client.post("/note/create_note", json={"name": f"n{size}"}).json()
+            note_id, file_name = created["id"], path.basename(created["url"])
+            client.post(f"/note/save_note?note_id={note_id}", files={"file": ("n.md", body(size))})
+            content = f"/note/get_content?note_id={note_id}"
+            cases = {"static": reopen(client, f"/data/note/{file_name}", "identity"),
+                     "cold": reopen(client, content, "gzip", cold=True),
+                     "warm": reopen(client, content, "gzip"),
+                     "304": reopen(client, content, "gzip", revalidate=True)}
+            print(f"{size // 1024:>6} KB | " + " | ".join(
+                f"{name} {received:>8.0f} B {ms:>6.2f} ms" for name, (received, ms) in cases.items()))
@@ -0,0 +1,100 @@
+"""tag database benchmark, query plans and latency at 100k note-tag associations before and after `migrate`
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_database
+"""
+from os import path
+from random import Random
+from sqlite3 import connect
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from model.note_group import Base
+from schemas.tag_base import TagSetSchema
+from service.crud import note as note_crud, tag as tag_crud
+from service.migration import migrate
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+NOTES = 20_000
+TAGS = 1_000
+ASSOCIATIONS = 100_000
+REPEAT = 50
+# schema of the files made before migrations
+OLD_SCHEMA = """
+CREATE TABLE notes (id INTEGER NOT NULL, name VARCHAR, url VARCHAR, PRIMARY KEY (id));
+CREATE INDEX ix_notes_id ON notes (id);
+CREATE TABLE tags (id INTEGER NOT NULL, name VARCHAR(15), color VARCHAR(7), PRIMARY KEY (id));
+CREATE INDEX ix_tags_id ON tags (id);
+CREATE TABLE note_tag_association (
+    note_id INTEGER, tag_id INTEGER,
+    FOREIGN KEY(note_id) REFERENCES notes (id), FOREIGN KEY(tag_id) REFERENCES tags (id));
+"""
+PLANS = {
+    "notes by tags": "SELECT notes.id FROM notes JOIN note_tag_association ON notes.id = note_tag_association.note_id "
+                     "WHERE note_tag_association.tag_id IN (5, 6) GROUP BY notes.id HAVING count(*) = 2",
+    "note by name": "SELECT * FROM notes WHERE name = 'n12345' LIMIT 1",
+    "tags of a note": "SELECT tag_id FROM note_tag_association WHERE note_id = 12345",
+}
+
+
+def create_database(db_path: str) -> None:
+    """create an old schema database, tags of each note drawn with Zipf frequencies
+    """
+    rand = Random(0)
+    weights = [1 / (rank + 1) for rank in range(TAGS)]
+    pairs: set[tuple[int, int]] = set()
+    while len(pairs) < ASSOCIATIONS:
+        pairs.add((rand.randrange(NOTES) + 1, rand.choices(range(TAGS), weights)[0] + 1))
+    with connect(db_path) as conn:
+        conn.executescript(OLD_SCHEMA)
+        conn.executemany("INSERT INTO notes VALUES (?, ?, ?)",
+                         ((i + 1, f"n{i}", f"{i}.md") for i in range(NOTES)))
+        conn.executemany("INSERT INTO tags VALUES (?, ?, ?)",
+                         ((i + 1, f"t{i}", "#FFFFFF") for i in range(TAGS)))
+        conn.executemany("INSERT INTO note_tag_association VALUES (?, ?)", pairs)
+
+
+def bench(db_path: str) -> None:
+    with connect(db_path) as conn:
+        for name, query in PLANS.items():
+            steps = " | ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}"))
+            start = perf_counter()
+            for _ in range(REPEAT):
+                conn.execute(query).fetchall()
+            print(f"  {name:>15} SQL  {(perf_counter() - start) / REPEAT * 1000:>8.2f} ms | {steps}")
+    engine = create_engine(f"sqlite:///{db_path}")
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    crud_queries = {
+        # a mid-frequency pair, the most frequent tags return thousands of notes with all their tags
+        "notes by tags": lambda db: note_crud.get_notes_by_tags(db, TagSetSchema(tags_id=[5, 6])),
+        "note by name": lambda db: note_crud.get_note_by_name(db, "n12345"),
+        # loads every note of each tag of the note, as the route returns
+        "tags of a note": lambda db: tag_crud.get_note_tags(db, 12345),
+    }
+    for name, crud_query in crud_queries.items():
+        with SessionLocal() as db:
+            start = perf_counter()
+            for _ in range(REPEAT):
+                crud_query(db)
+                db.expunge_all()
+            print(f"  {name:>15} crud {(perf_counter() - start) / REPEAT * 1000:>8.2f} ms")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    with TemporaryDirectory() as tmp:
+        db_path = path.join(tmp, "tag.db")
+        create_database(db_path)
+        print(f"{NOTES} notes, {TAGS} tags, {ASSOCIATIONS} associations")
+        print("before migration")
+        bench(db_path)
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(engine)
+        start = perf_counter()
+        migrate(engine)
+        print(f"migration {(perf_counter() - start) * 1000:.0f} ms")
+        engine.dispose()
+        print("after migration")
+        bench(db_path)
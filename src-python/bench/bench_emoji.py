@@ -0,0 +1,51 @@
+"""emoji search benchmark, in-memory index against a sqlite `LIKE` scan per query
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_emoji
+"""
+from sqlite3 import connect
+from time import perf_counter
+
+from schemas.emoji import EmojiSchema
+from service.config import path_config
+from service.emoji import EmojiGetter
+
+# keystrokes of a few autocomplete sessions
+QUERIES = [word[:i] for word in ["smile", "cat face", "heart", "flag", "thumbs up", "zzz"]
+           for i in range(1, len(word) + 1)]
+ROUNDS = 200
+
+
+def like_search(db_path: str, emoji: str) -> list[EmojiSchema]:
+    """the search before the index, a connection and a table scan per query
+    """
+    conn = connect(db_path)
+    rows = conn.execute(
+        "SELECT unicode, name FROM emoji WHERE name LIKE ?", ('%' + emoji + '%',)).fetchall()
+    conn.close()
+    return [EmojiSchema(unicode=row[0], name=row[1]) for row in rows]
+
+
+def timed(search, rounds: int) -> float:
+    """mean µs per query
+    """
+    start = perf_counter()
+    for _ in range(rounds):
+        for query in QUERIES:
+            search(query)
+    return (perf_counter() - start) / rounds / len(QUERIES) * 1e6
+
+
+if __name__ == "__main__":
+    db_path = path_config.emoji_path
+    getter = EmojiGetter(db_path)
+    start = perf_counter()
+    getter.load()
+    print(f"{len(QUERIES)} queries | index load {(perf_counter() - start) * 1000:.1f} ms")
+    like = timed(lambda q: like_search(db_path, q), ROUNDS // 10)
+    # `_rank` skips the LRU cache
+    index = timed(lambda q: getter._rank(q, EmojiGetter.LIMIT), ROUNDS)
+    cached = timed(lambda q: getter.search(q), ROUNDS)
+    print(f"sqlite LIKE   {like:>8.1f} µs/query")
+    print(f"index         {index:>8.1f} µs/query, {like / index:.0f}x")
+    print(f"index cached  {cached:>8.1f} µs/query, {like / cached:.0f}x")
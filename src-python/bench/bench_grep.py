@@ -0,0 +1,70 @@
+"""regular expression grep benchmark, scan throughput against worker count and first match latency
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_grep
+"""
+from os import path, cpu_count
+from json import loads
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from service.grep import NoteGrep
+
+NOTES = 10_000
+WORDS_PER_NOTE = 1_000
+WORKERS = sorted({1, 2, 4, cpu_count() or 1})
+# sparse, the scan is not dominated by writing matches
+PATTERN = r"w1234\dx"
+
+
+def create_vault(note_dir: str) -> tuple[list[tuple[int, str, str]], int]:
+    """create synthetic note files
+
+    Args:
+        note_dir (str): note file directory
+
+    Returns:
+        tuple[list[tuple[int, str, str]], int]: notes to scan and their total bytes
+    """
+    rand = Random(0)
+    notes, total = [], 0
+    for i in range(NOTES):
+        url = path.join(note_dir, f"{i}.md")
+        words = (f"w{rand.randrange(20_000)}x" for _ in range(WORDS_PER_NOTE))
+        body = f"# note {i}\n\n" + "\n".join(" ".join(line) for line in zip(*[words] * 10))
+        with open(url, "w") as f:
+            f.write(body)
+        total += len(body)
+        notes.append((i + 1, f"n{i}", url))
+    return notes, total
+
+
+def bench(notes: list[tuple[int, str, str]], total: int, workers: int) -> None:
+    grep = NoteGrep(workers, 60.0, 1_000_000)
+    # start the pool, the run below measures steady state
+    list(grep.grep(notes[:2 * workers * grep.MAX_CHUNK], PATTERN, False))
+    start = perf_counter()
+    first = 0.0
+    lines = 0
+    for _ in grep.grep(notes, PATTERN, False):
+        if not lines:
+            first = perf_counter() - start
+        lines += 1
+    scan = perf_counter() - start
+    grep.close()
+    print(f"{workers:>3} workers | {total / scan / 2 ** 20:>7.1f} MiB/s, "
+          f"scan {scan * 1000:.0f} ms, first match {first * 1000:.1f} ms, {lines - 1} matches")
+
+
+if __name__ == "__main__":
+    with TemporaryDirectory() as tmp:
+        notes, total = create_vault(tmp)
+        print(f"{NOTES} notes {total >> 20} MiB, {cpu_count()} logical cores")
+        for workers in WORKERS:
+            bench(notes, total, workers)
+        grep = NoteGrep(1, 60.0, 1_000_000)
+        start = perf_counter()
+        summary = loads(list(grep.grep(notes, PATTERN, False))[-1])
+        print(f"cold pool | scan {(perf_counter() - start) * 1000:.0f} ms, {summary['matches']} matches")
+        grep.close()
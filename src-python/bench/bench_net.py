@@ -0,0 +1,201 @@
+"""relationship net benchmark, cold and warm graph build, deltas, analytics, paths, layout, FFI marshalling
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_net
+"""
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import ctypes
+
+from model.note_group import Base, NoteModel
+from service.net import NetIndex, NetLayout, net_generator, parse_note_model, \
+    generate, free_net_schema, parse_cnet, copy_notes, \
+    generate_columns, free_net_columns, parse_cnet_columns, copy_note_columns
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker, Session
+
+SIZES = [1_000, 10_000, 50_000]
+LINKS_PER_NOTE = 4
+MARSHAL_NOTES = 25_000
+EGO_QUERIES = 100
+PATH_QUERIES = 100
+LAYOUT_NOTES = 10_000
+
+
+def create_vault(db: Session, note_dir: str, size: int) -> None:
+    """create a synthetic vault, each note links to some random notes
+
+    Args:
+        db (Session): database session
+        note_dir (str): note file directory
+        size (int): note count
+    """
+    rand = Random(size)
+    notes = []
+    for i in range(size):
+        url = path.join(note_dir, f"{i}.md")
+        refs = " ".join(f"[n{j}](md://n{j})" for j in
+                        rand.sample(range(size), LINKS_PER_NOTE))
+        with open(url, "w") as f:
+            f.write(f"# note {i}\n\n{refs} [file](res_{i % 100}.pdf)\n")
+        notes.append({"name": f"n{i}", "url": url})
+    db.execute(insert(NoteModel), notes)
+    db.commit()
+
+
+def bench(size: int) -> None:
+    with TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{path.join(tmp, 'tag.db')}")
+        Base.metadata.create_all(engine)
+        SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=engine)
+        with SessionLocal() as db:
+            create_vault(db, tmp, size)
+
+            start = perf_counter()
+            net_generator.generate(
+                list(map(parse_note_model, db.query(NoteModel).all())))
+            full = perf_counter() - start
+
+            index = NetIndex(net_generator, 256)
+            start = perf_counter()
+            index.prepare(db)
+            net = index.assemble(db)
+            cold = perf_counter() - start
+
+            start = perf_counter()
+            index.assemble(db)
+            warm = perf_counter() - start
+
+            ego = []
+            for depth in [1, 2]:
+                start = perf_counter()
+                for note_id in range(1, size, size // EGO_QUERIES):
+                    index.neighborhood(db, note_id, depth, 1000)
+                ego.append((perf_counter() - start) / EGO_QUERIES)
+
+            # one save, then the delta a client would fetch instead of the whole net
+            version = index.version
+            note = db.get(NoteModel, size // 2)
+            assert note is not None
+            with open(str(note.url), "a") as f:
+                f.write("[new](md://n0) [new](new.pdf)\n")
+            start = perf_counter()
+            index.update(db, note)
+            update = perf_counter() - start
+            delta = index.delta(db, version).to_json()
+            snapshot = index.assemble(db).to_json()
+
+            start = perf_counter()
+            index.analytics(db, 20)
+            analytics = perf_counter() - start
+            start = perf_counter()
+            index.analytics(db, 20)
+            cached = perf_counter() - start
+
+            start = perf_counter()
+            index.paths(db, 1, 2, 1, False)
+            path_index = perf_counter() - start
+            rand = Random(0)
+            pairs = [(rand.randint(1, size), rand.randint(1, size))
+                     for _ in range(PATH_QUERIES)]
+            chains = []
+            for k in [1, 4]:
+                start = perf_counter()
+                for source, target in pairs:
+                    index.paths(db, source, target, k, False)
+                chains.append((perf_counter() - start) / PATH_QUERIES)
+        engine.dispose()
+    print(f"{size:>8} notes {len(net.sources):>8} links | "
+          f"full generate {full * 1000:>9.1f} ms | "
+          f"cold {cold * 1000:>9.1f} ms | warm {warm * 1000:>9.1f} ms | "
+          f"ego depth 1 {ego[0] * 1000:.2f} ms, depth 2 {ego[1] * 1000:.2f} ms | "
+          f"save {update * 1000:.1f} ms, delta {len(delta)} B vs full {len(snapshot) >> 10} KiB | "
+          f"analytics {analytics * 1000:.1f} ms, cached {cached * 1000:.3f} ms | "
+          f"path index {path_index * 1000:.1f} ms, k=1 {chains[0] * 1000:.2f} ms, k=4 {chains[1] * 1000:.2f} ms")
+
+
+def bench_layout() -> None:
+    """cold layout, warm start after one save, and an unchanged net
+    """
+    with TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{path.join(tmp, 'tag.db')}")
+        Base.metadata.create_all(engine)
+        SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=engine)
+        with SessionLocal() as db:
+            create_vault(db, tmp, LAYOUT_NOTES)
+            index = NetIndex(net_generator, 256)
+            layout = NetLayout(net_generator, 300)
+            index.prepare(db)
+            times = []
+            for _ in range(2):
+                net = index.assemble(db)
+                net.version = index.version
+                start = perf_counter()
+                layout.apply(db, net)
+                times.append(perf_counter() - start)
+
+            note = db.get(NoteModel, 1)
+            assert note is not None
+            with open(str(note.url), "a") as f:
+                f.write("[new](new.pdf)\n")
+            index.update(db, note)
+            net = index.assemble(db)
+            net.version = index.version
+            start = perf_counter()
+            layout.apply(db, net)
+            warm = perf_counter() - start
+        engine.dispose()
+    print(f"{len(net.ids):>8} nodes layout | cold {times[0] * 1000:.1f} ms | "
+          f"warm start {warm * 1000:.1f} ms | unchanged {times[1] * 1000:.1f} ms")
+
+
+def bench_marshal() -> None:
+    """time the python side of the FFI, from returned pointer to response JSON
+    """
+    with TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{path.join(tmp, 'tag.db')}")
+        Base.metadata.create_all(engine)
+        SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=engine)
+        with SessionLocal() as db:
+            create_vault(db, tmp, MARSHAL_NOTES)
+            notes = list(map(parse_note_model, db.query(NoteModel).all()))
+        engine.dispose()
+
+        gen = net_generator.generator
+        start = perf_counter()
+        cnotes = copy_notes(notes)
+        cnet = generate(gen, ctypes.byref(cnotes))
+        rust = perf_counter() - start
+        start = perf_counter()
+        net = parse_cnet(cnet.contents)
+        body = net.model_dump_json().encode('utf-8')
+        row = perf_counter() - start
+        free_net_schema(cnet)
+
+        start = perf_counter()
+        cnotes_columns = copy_note_columns(notes)
+        ccolumns = generate_columns(gen, ctypes.byref(cnotes_columns))
+        rust_columns = perf_counter() - start
+        start = perf_counter()
+        columns = parse_cnet_columns(ccolumns.contents)
+        body_columns = columns.to_json()
+        column = perf_counter() - start
+        free_net_columns(ccolumns)
+    print(f"{len(columns.sources):>8} links, {len(body) >> 10} KiB JSON | "
+          f"row-wise: call {rust * 1000:.1f} ms, marshal {row * 1000:.1f} ms | "
+          f"columnar: call {rust_columns * 1000:.1f} ms, marshal {column * 1000:.1f} ms")
+    assert len(body_columns) == len(body)
+
+
+if __name__ == "__main__":
+    for size in SIZES:
+        bench(size)
+    bench_layout()
+    bench_marshal()
@@ -0,0 +1,60 @@
+"""patch save benchmark, request bytes and latency of an edit as a full save and as a patch
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_patch
+"""
+from hashlib import sha256
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+from unittest.mock import patch
+
+from bench.bench_bulk import session
+from service.config import path_config
+
+from fastapi.testclient import TestClient
+
+SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+EDITS = {"1 char": "x", "paste 1 KB": "y" * 1024}
+REPEAT = 5
+
+
+def body(size: int) -> bytes:
+    line = "- [ ] 一行笔记 with some markdown **text**\n".encode()
+    return (line * (size // len(line) + 1))[:size]
+
+
+def timed(client: TestClient, reset: Callable[[], None], method: str, url: str, **kwargs) -> tuple[int, float]:
+    """request body bytes and mean ms per request, each against the base content
+    """
+    size = len(client.build_request(method, url, **kwargs).read())
+    elapsed = 0.0
+    for _ in range(REPEAT):
+        reset()
+        start = perf_counter()
+        assert client.request(method, url, **kwargs).status_code == 202
+        elapsed += perf_counter() - start
+    return size, elapsed / REPEAT * 1000
+
+
+if __name__ == "__main__":
+    print(f"mean of {REPEAT} requests, request body bytes")
+    with TemporaryDirectory() as tmp, \
+            patch.object(type(path_config), "note_dir", property(lambda _self: tmp)):
+        client = session(tmp)
+        note_id = client.post("/note/create_note", json={"name": "n"}).json()["id"]
+        for size in SIZES:
+            content = body(size)
+            for name, text in EDITS.items():
+                def reset() -> None:
+                    client.post(f"/note/save_note?note_id={note_id}", files={"file": ("n.md", content)})
+
+                middle = size // 2
+                edited = content[:middle] + text.encode() + content[middle + 1:]
+                full = timed(client, reset, "POST", f"/note/save_note?note_id={note_id}",
+                             files={"file": ("n.md", edited)})
+                patched = timed(client, reset, "POST", "/note/patch_note", json={
+                    "note_id": note_id, "base_hash": sha256(content).hexdigest(),
+                    "edits": [{"start": middle, "end": middle + 1, "text": text}]})
+                print(f"{size // 1024:>6} KB | {name:>10} | save {full[0]:>9} B {full[1]:>7.1f} ms | "
+                      f"patch {patched[0]:>5} B {patched[1]:>7.1f} ms | {full[0] / patched[0]:>7.0f}x fewer bytes")
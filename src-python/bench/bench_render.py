@@ -0,0 +1,65 @@
+"""markdown render benchmark, latency of `/note/get_blocks` on a cold and a warm cache
+
+The note is `md/test/test.md` repeated up to the size. `cold` clears the
+note content and block caches before each request, the note is read and
+rendered by `libmdencoder`. `warm` is a cache hit, `304` sends the ETag of
+the first response. Needs `libmdencoder.so` built into the project root.
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_render
+"""
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest.mock import patch
+
+from bench.bench_bulk import session
+from service.config import path_config
+from service.content_cache import note_contents
+from service.render import block_renderer
+
+from fastapi.testclient import TestClient
+
+SIZES = [1024 * 1024, 10 * 1024 * 1024]
+REPEAT = 5
+
+
+def body(size: int) -> bytes:
+    with open("md/test/test.md", "rb") as f:
+        text = f.read()
+    # cut at a line end, the note stays UTF-8
+    data = (text * (size // len(text) + 1))[:size]
+    return data[:data.rfind(b"\n") + 1]
+
+
+def timed(client: TestClient, url: str, cold: bool = False, etag: str = "") -> tuple[float, int]:
+    """mean ms and body bytes of a request
+    """
+    headers = {"If-None-Match": etag} if etag else {}
+    elapsed = 0.0
+    for _ in range(REPEAT):
+        if cold:
+            note_contents.clear()
+            block_renderer.cache.clear()
+        start = perf_counter()
+        response = client.get(url, headers=headers)
+        elapsed += perf_counter() - start
+        assert response.status_code == (304 if etag else 200)
+    return elapsed / REPEAT * 1000, len(response.content)
+
+
+if __name__ == "__main__":
+    if not block_renderer.load():
+        raise SystemExit(f"{block_renderer.lib_path} not found, build md/md_encoder first")
+    print(f"mean of {REPEAT} requests, parallel from {block_renderer.PARALLEL_THRESHOLD} blocks")
+    with TemporaryDirectory() as tmp, \
+            patch.object(type(path_config), "note_dir", property(lambda _self: tmp)):
+        client = session(tmp)
+        for size in SIZES:
+            note_id = client.post("/note/create_note", json={"name": f"n{size}"}).json()["id"]
+            client.post(f"/note/save_note?note_id={note_id}", files={"file": ("n.md", body(size))})
+            url = f"/note/get_blocks?note_id={note_id}"
+            cold, blocks = timed(client, url, cold=True)
+            warm, _ = timed(client, url)
+            revalidated, _ = timed(client, url, etag=client.get(url).headers["ETag"])
+            print(f"{size // 1024 // 1024:>3} MB | {blocks:>9} B blocks | cold {cold:>8.1f} ms | "
+                  f"warm {warm:>6.1f} ms | 304 {revalidated:>5.1f} ms")
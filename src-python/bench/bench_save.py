@@ -0,0 +1,82 @@
+"""note save benchmark, peak RSS and latency of the `/note/save_note` route
+
+The route function runs with an upload as starlette hands it over, a
+spooled file on disk past 1 MB, and indexes the note for the net, the
+full-text search and the grep prefilter. `changed` saves a new content
+each time, `unchanged` saves the content the note already has without
+sending its hash. Each case runs in its own process on a fresh database,
+the peak RSS is the growth over the process before the saves.
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_save
+"""
+from os import path
+from resource import getrusage, RUSAGE_SELF
+from subprocess import run
+from sys import argv, executable
+from tempfile import TemporaryDirectory, SpooledTemporaryFile
+from time import perf_counter
+from typing import BinaryIO, cast
+from unittest.mock import patch
+
+SIZES_MB = [1, 10, 100]
+MODES = ["changed", "unchanged"]
+REPEAT = 3
+
+
+def upload(size: int, tail: bytes) -> BinaryIO:
+    spooled = SpooledTemporaryFile(max_size=1024 * 1024)
+    line = b"0123456789abcdefghijklmnopqrstuvwxyz " * 27 + b"\n"
+    for _ in range(size // len(line)):
+        spooled.write(line)
+    spooled.write(tail * (size % len(line)))
+    spooled.seek(0)
+    return cast(BinaryIO, spooled)
+
+
+def case(mode: str, size_mb: int, tmp: str) -> tuple[float, float]:
+    """one save mode and size, in this process
+
+    Returns:
+        tuple[float, float]: mean ms per save, peak RSS growth in MiB
+    """
+    from bench.bench_bulk import session
+    from backend import app
+    from router.note import save_note
+    from service.config import path_config
+    from service.database import get_db
+    from service.trigram import trigram_index
+
+    from fastapi import UploadFile
+
+    with patch.object(type(path_config), "note_dir", property(lambda _self: tmp)):
+        trigram_index.set_path(path.join(tmp, "trigram.idx"))
+        client = session(tmp)
+        note_id = client.post("/note/create_note", json={"name": "n"}).json()["id"]
+        db = next(app.dependency_overrides[get_db]())
+        size = size_mb * 1024 * 1024
+        save_note(note_id, UploadFile(upload(size, b"x")), None, db)
+        tails = [b"y", b"x"] if mode == "changed" else [b"x"]
+        uploads = [upload(size, tails[i % len(tails)]) for i in range(REPEAT)]
+        base = getrusage(RUSAGE_SELF).ru_maxrss
+        start = perf_counter()
+        for spooled in uploads:
+            save_note(note_id, UploadFile(spooled), None, db)
+        elapsed = (perf_counter() - start) / REPEAT * 1000
+        db.close()
+    return elapsed, (getrusage(RUSAGE_SELF).ru_maxrss - base) / 1024
+
+
+if __name__ == "__main__":
+    if len(argv) == 5 and argv[1] == "case":
+        ms, rss = case(argv[2], int(argv[3]), argv[4])
+        print(f"{ms} {rss}")
+    else:
+        print(f"mean of {REPEAT} saves")
+        for size_mb in SIZES_MB:
+            for mode in MODES:
+                with TemporaryDirectory() as tmp:
+                    out = run([executable, "-m", "bench.bench_save", "case", mode, str(size_mb), tmp],
+                              capture_output=True, text=True, check=True).stdout.split()
+                ms, rss = float(out[-2]), float(out[-1])
+                print(f"{size_mb:>4} MB | {mode:>9} | {ms:>8.1f} ms | peak RSS +{rss:>6.1f} MiB")
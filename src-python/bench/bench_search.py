@@ -0,0 +1,97 @@
+"""full-text search benchmark, index build throughput, query and update latency
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_search
+"""
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from model.note_group import Base, NoteModel
+from service.search import NoteSearch
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker, Session
+
+SIZES = [10_000, 50_000]
+WORDS_PER_NOTE = 300
+VOCABULARY = 20_000
+QUERIES = {
+    "common": "w1x",
+    "mid": "w5000x",
+    "rare": "w19999x",
+    "two terms": "w10x w200x",
+    "short term": "w1x 7x",
+}
+REPEAT = 20
+
+
+def create_vault(db: Session, note_dir: str, size: int) -> int:
+    """create a synthetic vault, words drawn from a Zipf-like vocabulary
+
+    Args:
+        db (Session): database session
+        note_dir (str): note file directory
+        size (int): note count
+
+    Returns:
+        int: total bytes of the note files
+    """
+    rand = Random(size)
+    weights = [1 / (i + 1) for i in range(VOCABULARY)]
+    total = 0
+    notes = []
+    for i in range(size):
+        url = path.join(note_dir, f"{i}.md")
+        words = rand.choices(range(VOCABULARY), weights, k=WORDS_PER_NOTE)
+        body = f"# note {i}\n\n" + " ".join(f"w{w}x" for w in words) + "\n"
+        with open(url, "w") as f:
+            f.write(body)
+        total += len(body)
+        notes.append({"name": f"n{i}", "url": url})
+    db.execute(insert(NoteModel), notes)
+    db.commit()
+    return total
+
+
+def bench(size: int) -> None:
+    with TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{path.join(tmp, 'tag.db')}")
+        Base.metadata.create_all(engine)
+        SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=engine)
+        with SessionLocal() as db:
+            total = create_vault(db, tmp, size)
+            search = NoteSearch()
+
+            start = perf_counter()
+            search.prepare(db)
+            build = perf_counter() - start
+
+            latency = {}
+            for name, query in QUERIES.items():
+                search.search(db, query, 50)
+                start = perf_counter()
+                for _ in range(REPEAT):
+                    hits = search.search(db, query, 50)
+                latency[name] = ((perf_counter() - start) / REPEAT, len(hits))
+
+            note = db.get(NoteModel, size // 2)
+            assert note is not None
+            with open(str(note.url), "a") as f:
+                f.write("fresh words\n")
+            start = perf_counter()
+            search.update(db, note)
+            update = perf_counter() - start
+            assert [h.id for h in search.search(db, "fresh", 50)] == [note.id]
+        engine.dispose()
+    print(f"{size:>8} notes {total >> 20:>5} MiB | build {build:.1f} s, "
+          f"{size / build:.0f} notes/s, {total / build / 2 ** 20:.1f} MiB/s | "
+          + " | ".join(f"{name} {t * 1000:.2f} ms ({n} hits)" for name, (t, n) in latency.items())
+          + f" | save {update * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    for size in SIZES:
+        bench(size)
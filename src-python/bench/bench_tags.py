@@ -0,0 +1,90 @@
+"""tag query benchmark, in-memory bitmap index against SQLite at 100k notes and 1k tags
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_tags
+"""
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+from model.note_group import Base, NoteModel, TagModel, note_tag_association
+from schemas.tag_base import TagSetSchema, TagQuerySchema
+from service.crud import note as note_crud
+from service.migration import migrate
+from service.tag_index import TagIndex
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+NOTES = 100_000
+TAGS = 1_000
+MAX_TAGS_PER_NOTE = 10
+REPEAT = 20
+# the SQL of `get_notes_by_tags` without loading the notes
+SQL_AND = ("SELECT notes.id FROM notes JOIN note_tag_association ON notes.id = note_tag_association.note_id "
+           "WHERE note_tag_association.tag_id IN ({}) GROUP BY notes.id HAVING count(*) = {}")
+QUERIES: dict[str, dict[str, Any]] = {
+    "and, common pair": {"and": [{"tag_id": 1}, {"tag_id": 2}]},
+    "and, mid pair": {"and": [{"tag_id": 20}, {"tag_id": 30}]},
+    "and, rare pair": {"and": [{"tag_id": 500}, {"tag_id": 501}]},
+    "rare tag": {"and": [{"tag_id": 900}]},
+    "or of 5": {"or": [{"tag_id": i} for i in range(10, 15)]},
+    "not": {"not": {"tag_id": 1}},
+    "nested": {"and": [{"or": [{"tag_id": 1}, {"tag_id": 3}]}, {"not": {"tag_id": 2}}, {"tag_id": 7}]},
+}
+
+
+def timed(run, repeat: int = REPEAT) -> float:
+    """mean ms per run
+    """
+    start = perf_counter()
+    for _ in range(repeat):
+        run()
+    return (perf_counter() - start) / repeat * 1000
+
+
+if __name__ == "__main__":
+    with TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{path.join(tmp, 'tag.db')}")
+        Base.metadata.create_all(engine)
+        migrate(engine)
+        rand = Random(0)
+        weights = [1 / (rank + 1) for rank in range(TAGS)]
+        pairs = {(note_id, tag_id) for note_id in range(1, NOTES + 1)
+                 for tag_id in rand.choices(range(1, TAGS + 1), weights, k=rand.randint(0, MAX_TAGS_PER_NOTE))}
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        with SessionLocal() as db:
+            db.execute(insert(NoteModel), [{"id": i, "name": f"n{i}", "url": f"{i}.md"}
+                                           for i in range(1, NOTES + 1)])
+            db.execute(insert(TagModel), [{"id": i, "name": f"t{i}", "color": "#FFFFFF"}
+                                          for i in range(1, TAGS + 1)])
+            db.execute(insert(note_tag_association), [{"note_id": n, "tag_id": t} for n, t in pairs])
+            db.commit()
+        print(f"{NOTES} notes, {TAGS} tags, {len(pairs)} associations")
+
+        with SessionLocal() as db:
+            index = TagIndex()
+            start = perf_counter()
+            index.prepare(db)
+            print(f"index build {(perf_counter() - start) * 1000:.0f} ms")
+
+            for name, query in QUERIES.items():
+                expression = TagQuerySchema.model_validate(query)
+                notes_id, facets = index.query(expression)
+                bitmap = timed(lambda: index.query(expression))
+                line = f"{name:>17} | {len(notes_id):>6} notes {len(facets):>4} facets | index {bitmap:>7.2f} ms"
+                if "and" in query and all("tag_id" in e for e in query["and"]):
+                    tags_id = [e["tag_id"] for e in query["and"]]
+                    sql = SQL_AND.format(", ".join(map(str, tags_id)), len(tags_id))
+                    assert [row[0] for row in db.execute(text(sql))] == notes_id
+                    raw = timed(lambda: db.execute(text(sql)).all())
+                    def crud_query() -> None:
+                        note_crud.get_notes_by_tags(db, TagSetSchema(tags_id=tags_id))
+                        db.expunge_all()
+
+                    crud = timed(crud_query, 3)
+                    line += f" | SQL ids {raw:>7.2f} ms, {raw / bitmap:>5.1f}x | get_notes_by_tags {crud:>8.1f} ms"
+                print(line)
+        engine.dispose()
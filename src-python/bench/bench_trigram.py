@@ -0,0 +1,118 @@
+"""trigram index benchmark, index size, build time and grep speedup over a linear scan
+
+Run from the project root, the vault size in MiB defaults to 1024:
+    PYTHONPATH=src-python python -m bench.bench_trigram [MiB]
+"""
+import sys
+from os import path, cpu_count
+from json import loads
+from random import Random
+from string import ascii_lowercase
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from model.note_group import Base, NoteModel
+from service.grep import NoteGrep
+from service.net import net_generator
+from service.trigram import TrigramIndex
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+NOTE_BYTES = 16 << 10
+VOCABULARY = 50_000
+# (pattern, ignore case), from a planted rare token to one in most notes
+QUERIES = [
+    ("needle4242", False),
+    ("needle\\d+x", False),
+    ("(?:haystack|needle)7", False),
+    ("NEEDLE1", True),
+    ("common[a-z]+", False),
+]
+NEEDLES = 100
+
+
+def create_vault(note_dir: str, size: int) -> list[tuple[int, str, str]]:
+    """create synthetic notes of random words with Zipf frequencies, a few with planted needles
+
+    Args:
+        note_dir (str): note file directory
+        size (int): total bytes
+
+    Returns:
+        list[tuple[int, str, str]]: notes
+    """
+    rand = Random(0)
+    vocabulary = ["".join(rand.choices(ascii_lowercase, k=rand.randint(3, 10)))
+                  for _ in range(VOCABULARY)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY)]
+    count = size // NOTE_BYTES
+    needles = {rand.randrange(count): i for i in range(NEEDLES)}
+    notes = []
+    for i in range(count):
+        words = rand.choices(vocabulary, weights, k=NOTE_BYTES // 7)
+        if i in needles:
+            words[rand.randrange(len(words))] = f"needle{needles[i]}x"
+        if i % 2 == 0:
+            words[0] = "commonword"
+        url = path.join(note_dir, f"{i}.md")
+        with open(url, "w") as f:
+            f.write(" ".join(words))
+        notes.append((i + 1, f"n{i}", url))
+    return notes
+
+
+def grep(grep: NoteGrep, notes: list[tuple[int, str, str]], pattern: str, ignore_case: bool) -> int:
+    return loads(list(grep.grep(notes, pattern, ignore_case))[-1])["matches"]
+
+
+def bench(size: int) -> None:
+    with TemporaryDirectory() as tmp:
+        start = perf_counter()
+        notes = create_vault(tmp, size)
+        print(f"{len(notes)} notes {size >> 20} MiB, created in {perf_counter() - start:.0f} s, "
+              f"{cpu_count()} logical cores")
+        engine = create_engine(f"sqlite:///{path.join(tmp, 'tag.db')}")
+        Base.metadata.create_all(engine)
+        SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=engine)
+        with SessionLocal() as db:
+            db.execute(insert(NoteModel), [
+                {"id": id, "name": name, "url": url} for id, name, url in notes])
+            db.commit()
+            index = TrigramIndex(net_generator, path.join(tmp, "trigram.idx"))
+            start = perf_counter()
+            index.prepare(db)
+            build = perf_counter() - start
+        engine.dispose()
+        index.close()
+        print(f"build {build:.1f} s, {size / build / 2 ** 20:.1f} MiB/s | "
+              f"index {path.getsize(index.path) / 2 ** 20:.1f} MiB, "
+              f"{path.getsize(index.path) / size * 100:.1f} % of the vault")
+
+        start = perf_counter()
+        index = TrigramIndex(net_generator, index.path)
+        opened = perf_counter() - start
+        print(f"open (mmap) {opened * 1000:.2f} ms")
+
+        scanner = NoteGrep(0, 3600.0, 1 << 30)
+        for pattern, ignore_case in QUERIES:
+            start = perf_counter()
+            matches = grep(scanner, notes, pattern, ignore_case)
+            linear = perf_counter() - start
+
+            start = perf_counter()
+            candidates = index.candidates(pattern, ignore_case)
+            plan = perf_counter() - start
+            narrowed = [n for n in notes if candidates is None or candidates >> n[0] & 1]
+            assert grep(scanner, narrowed, pattern, ignore_case) == matches
+            prefiltered = perf_counter() - start
+            print(f"{pattern!r:>28} | {matches:>6} matches | linear {linear * 1000:>8.0f} ms | "
+                  f"prefilter {plan * 1000:>6.1f} ms, {len(narrowed):>6} candidates, "
+                  f"total {prefiltered * 1000:>8.1f} ms | speedup {linear / prefiltered:>7.1f}x")
+        scanner.close()
+        index.close()
+
+
+if __name__ == "__main__":
+    bench((int(sys.argv[1]) if len(sys.argv) > 1 else 1024) << 20)
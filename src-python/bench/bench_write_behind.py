@@ -0,0 +1,69 @@
+"""write-behind save benchmark, note file writes and save latency of typing bursts
+
+A burst is `SAVES` saves of one note, `GAP` apart, as an editor autosaving
+while typing. `direct` writes and indexes every save, `buffer` acknowledges
+from memory and writes once the debounce after the first save has passed.
+The buffer is closed at the end of a run, as at shutdown, its writes count.
+
+Run from the project root:
+    PYTHONPATH=src-python python -m bench.bench_write_behind
+"""
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+from unittest.mock import patch
+
+from backend import app
+from bench.bench_bulk import session
+from bench.bench_patch import body
+from router import note as note_router
+from service.config import path_config
+from service.crud import note as crud_note
+from service.database import get_db
+from service.write_behind import note_buffer, NoteWriteBehind
+
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+SIZES = [4 * 1024, 100 * 1024]
+SAVES = 50
+GAP = 0.02
+DEBOUNCE = 2.0
+
+
+def burst(client: TestClient, note_id: int, content: bytes) -> list[float]:
+    latencies = []
+    for i in range(SAVES):
+        data = content[:-len(str(i))] + str(i).encode()
+        start = perf_counter()
+        assert client.post(f"/note/save_note?note_id={note_id}", files={"file": ("n.md", data)}).status_code == 202
+        latencies.append((perf_counter() - start) * 1000)
+        sleep(GAP)
+    return latencies
+
+
+if __name__ == "__main__":
+    print(f"{SAVES} saves {GAP * 1000:.0f} ms apart, debounce {DEBOUNCE * 1000:.0f} ms")
+    for size in SIZES:
+        for mode in ("direct", "buffer"):
+            writes = 0
+            original = crud_note.replace_note_file
+
+            def counted(temp: str, url: str) -> None:
+                global writes
+                writes += 1
+                original(temp, url)
+
+            with TemporaryDirectory() as tmp, \
+                    patch.object(type(path_config), "note_dir", property(lambda _self: tmp)), \
+                    patch.object(crud_note, "replace_note_file", counted), \
+                    patch.object(NoteWriteBehind, "is_enabled", property(lambda _self: mode == "buffer")), \
+                    patch.object(note_buffer, "debounce", DEBOUNCE):
+                client = session(tmp)
+                bind = next(app.dependency_overrides[get_db]()).get_bind()
+                with patch.object(note_router, "SessionLocal", sessionmaker(autoflush=False, bind=bind)):
+                    note_id = client.post("/note/create_note", json={"name": "n"}).json()["id"]
+                    latencies = burst(client, note_id, body(size))
+                    note_buffer.close()
+            latencies.sort()
+            print(f"{size // 1024:>4} KB | {mode:>6} | {writes:>3} file writes | "
+                  f"p50 {latencies[len(latencies) // 2]:>6.1f} ms | p95 {latencies[int(len(latencies) * 0.95)]:>6.1f} ms")
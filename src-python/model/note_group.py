@@ -1,60 +1,93 @@
-from os import path, remove
-
 from service.database import Base
 
-from sqlalchemy import Column, Integer, String, Table, ForeignKey, event
-from sqlalchemy.orm import relationship, Mapper
-from sqlalchemy.engine import Connection
+from sqlalchemy import Column, Integer, String, Boolean, Float, Table, ForeignKey, Index, DDL, event
+from sqlalchemy.orm import relationship
 
 
 note_tag_association = Table(
     'note_tag_association',
     Base.metadata,
-    Column('note_id', Integer, ForeignKey('notes.id')),
-    Column('tag_id', Integer, ForeignKey('tags.id'))
+    Column('note_id', Integer, ForeignKey('notes.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    # the primary key covers lookups by note, this one covers lookups by tag
+    Index('ix_note_tag_association_tag_id_note_id', 'tag_id', 'note_id')
 )
 
 
+# full-text index of note names and contents, the rowid is the note id
+# trigram tokens match any substring, also inside CJK text without word breaks
+event.listen(Base.metadata, 'after_create', DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5(name, content, tokenize='trigram')"))
+
+
 class NoteModel(Base):
     """note ORM model
+
+    Relationships:
+        tags: TagModel 'many to many'
+        links: NoteLinkModel 'one to many'
+        position: NetPositionModel 'one to one'
     """
     __tablename__ = "notes"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String)
+    name = Column(String, index=True)
     url = Column(String)
+    # sha256 hex of the file content, None until the first save
+    content_hash = Column(String)
+    # `content_hash` the links were extracted at, '' for a note without one, None until extracted
+    links_hash = Column(String)
 
     tags = relationship(
         "TagModel", secondary="note_tag_association", back_populates="notes")
+    links = relationship(
+        "NoteLinkModel", back_populates="note", cascade="all, delete-orphan")
+    position = relationship(
+        "NetPositionModel", back_populates="note", cascade="all, delete-orphan", uselist=False)
 
     def __repr__(self):
         return "<Note(id='%d', name='%s', url='%s')>" % self.id, self.name, self.url
 
 
-@event.listens_for(NoteModel, 'after_insert')
-def create_note_file(_mapper: Mapper[NoteModel], _connection: Connection, target: NoteModel):
-    """create note file after insert
+class NoteLinkModel(Base):
+    """note link ORM model, the persisted link index of note files
 
-    Args:
-        _mapper (Mapper[NoteModel]): Mapper of NoteModel
-        _connection (Connection): database connection
-        target (NoteModel): target instance
+    Relationships:
+        note: NoteModel 'many to one'
     """
-    file = open(target.url, "w")
-    file.close()
+    __tablename__ = "note_links"
+
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey('notes.id'), index=True)
+    data = Column(String, index=True)
+    is_md = Column(Boolean)
+
+    note = relationship("NoteModel", back_populates="links")
 
+    def __repr__(self):
+        return "<NoteLinkModel(note_id='%d', data='%s', is_md='%s')>" % (self.note_id, self.data, self.is_md)
+
+
+class NetPositionModel(Base):
+    """net node position ORM model, the persisted layout of the relationship net
 
-@event.listens_for(NoteModel, 'before_delete')
-def remove_note_file(_mapper: Mapper[NoteModel], _connection: Connection, target: NoteModel):
-    """remove note file before delete
+    A note node is keyed by `note_id`, a resource node by its name in `data`.
 
-    Args:
-        _mapper (Mapper[NoteModel]): Mapper of NoteModel
-        _connection (Connection): database connection
-        target (NoteModel): target instance
+    Relationships:
+        note: NoteModel 'one to one'
     """
-    if path.exists(target.url):
-        remove(target.url)
+    __tablename__ = "net_positions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey('notes.id'), unique=True, index=True)
+    data = Column(String, unique=True, index=True)
+    x = Column(Float)
+    y = Column(Float)
+
+    note = relationship("NoteModel", back_populates="position")
+
+    def __repr__(self):
+        return "<NetPositionModel(note_id='%s', data='%s', x='%f', y='%f')>" % (self.note_id, self.data, self.x, self.y)
 
 
 class TagModel(Base):
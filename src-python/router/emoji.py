@@ -2,14 +2,18 @@ from schemas.emoji import EmojiSchema
 from service.emoji import emoji_getter
 from service.logger import logger
 
-from fastapi import HTTPException, status, APIRouter
+from fastapi import HTTPException, status, APIRouter, Query
 
 router = APIRouter(prefix="/emoji")
 
 
 @router.get("/get_emoji", response_model=list[EmojiSchema], status_code=status.HTTP_200_OK, include_in_schema=True)
-async def get_emoji(emoji: str) -> list[EmojiSchema]:
-    """search all emoji by name to frontend
+async def get_emoji(emoji: str, limit: int = Query(default=50, ge=1, le=2000)) -> list[EmojiSchema]:
+    """search all emoji by name to frontend, exact and prefix matches first
+
+    Args:
+        emoji (str): part of the emoji name
+        limit (int, optional): max emoji count. Defaults to 50.
 
     Returns:
         list[EmojiSchema]: emojis or error
@@ -17,8 +21,8 @@ async def get_emoji(emoji: str) -> list[EmojiSchema]:
     Raises:
         HTTPException: error response 404 | 406
     """
-    logger.debug(f"GET /emoji/get_emoji?emoji={emoji}")
-    data = emoji_getter.search(emoji)
+    logger.debug(f"GET /emoji/get_emoji?emoji={emoji}&limit={limit}")
+    data = emoji_getter.search(emoji, limit)
     if data is not None:
         if len(data) == 0:
             logger.warning(f"{emoji} not found")
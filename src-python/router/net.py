@@ -1,29 +1,173 @@
-from schemas.net import NetSchema
-from schemas.note import NoteSchema
-from model.note_group import NoteModel
-from service.net import net_generator
+from asyncio import ensure_future, to_thread
+from typing import Optional
+
+from schemas.net import NetSchema, NetDeltaSchema, NetAnalyticsSchema, NetPathSchema
+from service.net import net_index
 from service.logger import logger
-from service.database import get_db
+from service.config import dev_config
+from service.database import get_read_db, get_session_factory, get_read_session_factory
+from service.security import authentication_manager
 
-from sqlalchemy.orm import Session
-from fastapi import status, APIRouter, Depends
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi import HTTPException, status, APIRouter, Depends, Query, Response, WebSocket
 
 router = APIRouter(prefix="/net")
 
 
 @router.get("/get_net", response_model=NetSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
-async def get_net(db: Session = Depends(get_db)) -> NetSchema:
-    """generate relationship net and send to frontend
+async def get_net(sessions: sessionmaker = Depends(get_session_factory),
+                  read_sessions: sessionmaker = Depends(get_read_session_factory)) -> Response:
+    """assemble relationship net from the link index and send to frontend
+
+    Args:
+        sessions (sessionmaker, optional): session factory of the build. Defaults to Depends(get_session_factory).
+        read_sessions (sessionmaker, optional): read only session factory of the build.
+            Defaults to Depends(get_read_session_factory).
 
     Returns:
-        NetSchema: net
+        Response: net, JSON of NetSchema
     """
     logger.debug(f"GET /net/get_net")
-    notes = db.query(NoteModel).all()
+    return Response(content=await net_index.build(sessions, read_sessions), media_type="application/json")
+
+
+@router.get("/get_neighborhood", response_model=NetSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
+def get_neighborhood(note_id: int,
+                     depth: int = Query(default=1, ge=0, le=8),
+                     limit: int = Query(default=200, ge=1, le=1000),
+                     db: Session = Depends(get_read_db),
+                     sessions: sessionmaker = Depends(get_session_factory)) -> Response:
+    """get the k-hop neighborhood of a note, backlinks included
+
+    Args:
+        note_id (int): center note id
+        depth (int, optional): max hops from the center note. Defaults to 1.
+        limit (int, optional): max node count. Defaults to 200.
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+        sessions (sessionmaker, optional): session factory to index the notes on the first request.
+            Defaults to Depends(get_session_factory).
+
+    Raises:
+        HTTPException: 404 for not find the target note
+
+    Returns:
+        Response: subgraph, JSON of NetSchema, center note is the first node
+    """
+    logger.debug(
+        f"GET /net/get_neighborhood?note_id={note_id}&depth={depth}&limit={limit}")
+    net_index.ensure_ready(sessions)
+    if (net := net_index.neighborhood(db, note_id, depth, limit)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
+    return Response(content=net.to_json(), media_type="application/json")
+
+
+@router.get("/get_net_delta", response_model=NetDeltaSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
+def get_net_delta(since: int, db: Session = Depends(get_read_db),
+                  sessions: sessionmaker = Depends(get_session_factory)) -> Response:
+    """get the changes of the net since a version
+
+    Args:
+        since (int): version of the net the client holds
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+        sessions (sessionmaker, optional): session factory to index the notes on the first request.
+            Defaults to Depends(get_session_factory).
+
+    Returns:
+        Response: JSON of NetDeltaSchema, the full net if `since` is out of the history window
+    """
+    logger.debug(f"GET /net/get_net_delta?since={since}")
+    net_index.ensure_ready(sessions)
+    return Response(content=net_index.delta(db, since).to_json(), media_type="application/json")
+
+
+@router.get("/get_analytics", response_model=NetAnalyticsSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
+def get_analytics(top: int = Query(default=20, ge=1, le=1000), db: Session = Depends(get_read_db),
+                  sessions: sessionmaker = Depends(get_session_factory)) -> Response:
+    """get PageRank, degree rankings, connected components and orphan notes of the net
+
+    Args:
+        top (int, optional): length of each ranking. Defaults to 20.
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+        sessions (sessionmaker, optional): session factory to index the notes on the first request.
+            Defaults to Depends(get_session_factory).
+
+    Returns:
+        Response: JSON of NetAnalyticsSchema
+    """
+    logger.debug(f"GET /net/get_analytics?top={top}")
+    net_index.ensure_ready(sessions)
+    return Response(content=net_index.analytics(db, top), media_type="application/json")
+
+
+@router.get("/get_path", response_model=NetPathSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
+def get_path(source: int = Query(alias="from"), target: int = Query(alias="to"),
+             k: int = Query(default=1, ge=1, le=32), directed: bool = False,
+             db: Session = Depends(get_read_db),
+             sessions: sessionmaker = Depends(get_session_factory)) -> Response:
+    """get the k shortest reference chains between two notes
+
+    Args:
+        source (int): start note id, query `from`
+        target (int): end note id, query `to`
+        k (int, optional): max path count. Defaults to 1.
+        directed (bool, optional): only follow links from the linking note. Defaults to False.
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+        sessions (sessionmaker, optional): session factory to index the notes on the first request.
+            Defaults to Depends(get_session_factory).
+
+    Raises:
+        HTTPException: 404 for not find the target note
+
+    Returns:
+        Response: JSON of NetPathSchema
+    """
+    logger.debug(
+        f"GET /net/get_path?from={source}&to={target}&k={k}&directed={directed}")
+    net_index.ensure_ready(sessions)
+    if (paths := net_index.paths(db, source, target, k, directed)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
+    return Response(content=paths, media_type="application/json")
+
+
+@router.websocket("/watch_net")
+async def watch_net(websocket: WebSocket, since: int, token: Optional[str] = None,
+                    db: Session = Depends(get_read_db), sessions: sessionmaker = Depends(get_session_factory)):
+    """push the changes of the net, first the changes since `since`, then one delta per new version
+
+    Args:
+        websocket (WebSocket): websocket connection
+        since (int): version of the net the client holds
+        token (Optional[str], optional): access token, browsers can't set headers on websocket. Defaults to None.
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+        sessions (sessionmaker, optional): session factory to index the notes on the first request.
+            Defaults to Depends(get_session_factory).
+    """
+    logger.debug(f"WEBSOCKET /net/watch_net?since={since}")
+    if not dev_config.debug and (token is None or authentication_manager.check_jwt_token(f"Bearer {token}")):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    updated = net_index.watch()
+
+    await to_thread(net_index.ensure_ready, sessions)
 
-    def parse_model(note: NoteModel) -> NoteSchema:
-        n = NoteSchema(id=int(note.id), name=str(note.name), url=str(note.url))
-        return n
+    async def push(since: int):
+        while True:
+            delta = await to_thread(net_index.delta, db, since)
+            # release the connection between deltas, the socket holds the session for its whole life
+            await to_thread(db.close)
+            if delta.full or not delta.is_empty():
+                await websocket.send_text(delta.to_json().decode('utf-8'))
+                since = delta.version
+            await updated.wait()
+            updated.clear()
 
-    n_notes = list(map(lambda x: parse_model(x), notes))
-    return net_generator.generate(n_notes)
+    pusher = ensure_future(push(since))
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        pusher.cancel()
+        net_index.unwatch(updated)
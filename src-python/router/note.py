@@ -1,17 +1,58 @@
+from io import BytesIO
+
 from model.note_group import NoteModel
-from schemas.note_base import NoteCreateSchema, NoteUpdateSchema
-from schemas.note import NoteRelationshipSchema
-from schemas.tag_base import TagSetSchema
+from schemas.note_base import NoteCreateSchema, NoteUpdateSchema, NoteSchema, NoteSetSchema, NotePatchSchema
+from schemas.note import NoteRelationshipSchema, NoteSearchSchema
+from schemas.tag_base import TagSetSchema, TagQuerySchema, TagQueryResultSchema
 from service.logger import logger
-from service.database import get_db
-from service.crud import note, tag
-
-from sqlalchemy.orm import Session
-from fastapi import HTTPException, status, APIRouter, Depends, UploadFile
+from service.database import get_db, get_read_db, get_async_read_db, get_session_factory, SessionLocal
+from service.net import net_index
+from service.search import note_search
+from service.grep import note_grep
+from service.trigram import trigram_index, TrigramStream
+from service.tag_index import tag_index
+from service.write_behind import note_buffer
+from service.content_cache import load_note_content
+from service.render import block_renderer
+from service.crud import note, tag, note_async
+
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status, APIRouter, Depends, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 
 router = APIRouter(prefix="/note")
 
 
+def write_buffered_note(note_id: int, url: str, content: bytes) -> None:
+    """write a note from the write-behind buffer, in the flush thread
+
+    Args:
+        note_id (int): note id
+        url (str): note file path
+        content (bytes): note content
+    """
+    note.write_note_file(url, BytesIO(content))
+
+
+def index_buffered_note(note_id: int, url: str) -> None:
+    """index a note written from the write-behind buffer, in the flush thread
+
+    Args:
+        note_id (int): note id
+        url (str): note file path
+    """
+    with SessionLocal() as db:
+        if (data := note.get_note(db, note_id)):
+            net_index.update(db, data)
+            note_search.update(db, data)
+            trigram_index.update(note_id, url)
+
+
+note_buffer.writer = write_buffered_note
+note_buffer.indexer = index_buffered_note
+
+
 @router.post("/create_note", response_model=NoteRelationshipSchema, status_code=status.HTTP_201_CREATED, include_in_schema=True)
 def create_note(new_note: NoteCreateSchema, db: Session = Depends(get_db)) -> NoteModel:
     """create a new note
@@ -24,30 +65,62 @@ def create_note(new_note: NoteCreateSchema, db: Session = Depends(get_db)) -> No
         NoteModel: new note data
     """
     logger.info("POST /note/create_note")
-    return note.create_note(db, new_note)
+    with net_index.change(db, {new_note.name}):
+        data = note.create_note(db, new_note)
+    note_search.update(db, data)
+    trigram_index.update(int(data.id), str(data.url), b"")
+    return data
+
+
+@router.post("/bulk_create", response_model=list[NoteSchema], status_code=status.HTTP_201_CREATED, include_in_schema=True)
+def bulk_create(new_notes: list[NoteCreateSchema], db: Session = Depends(get_db)) -> list[NoteSchema]:
+    """create many notes in one transaction
+
+    Args:
+        new_notes (list[NoteCreateSchema]): new notes data
+        db (Session, optional): database session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: 500 for failing to create the note files, no note is created
+
+    Returns:
+        list[NoteSchema]: new notes data in the order of `new_notes`
+    """
+    logger.info(f"POST /note/bulk_create count={len(new_notes)}")
+    try:
+        with net_index.change(db, {new_note.name for new_note in new_notes}):
+            data = note.create_notes(db, new_notes)
+    except OSError as error:
+        logger.error(f"fail to create note files: {error}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="笔记文件创建失败")
+    note_search.update_many(db, data)
+    for new_note in data:
+        trigram_index.update(new_note.id, new_note.url, b"")
+    return data
 
 
 @router.get("/get_notes", response_model=list[NoteRelationshipSchema], status_code=status.HTTP_200_OK, include_in_schema=True)
-def get_notes(db: Session = Depends(get_db)) -> list[NoteModel]:
+async def get_notes(db: AsyncSession = Depends(get_async_read_db)) -> list[NoteModel]:
     """get all notes
 
     Args:
-        db (Session, optional): database session. Defaults to Depends(get_db).
+        db (AsyncSession, optional): asyncio database session. Defaults to Depends(get_async_read_db).
 
     Returns:
         list[NoteModel]: all note models
     """
     logger.debug("GET /note/get_notes")
-    return note.get_notes(db)
+    return await note_async.get_notes(db)
 
 
 @router.get("/get_note", response_model=NoteRelationshipSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
-def get_note(note_id: int, db: Session = Depends(get_db)) -> NoteModel:
+async def get_note(note_id: int, db: AsyncSession = Depends(get_async_read_db)) -> NoteModel:
     """get note by id
 
     Args:
         note_id (int): note id 
-        db (Session, optional): database session. Defaults to Depends(get_db).
+        db (AsyncSession, optional): asyncio database session. Defaults to Depends(get_async_read_db).
 
     Raises:
         HTTPException: 404 for not find the target note
@@ -56,35 +129,140 @@ def get_note(note_id: int, db: Session = Depends(get_db)) -> NoteModel:
         NoteModel: query result, note model
     """
     logger.debug(f"GET /note/get_note?note_id={note_id}")
-    if (data := note.get_note(db, note_id)):
+    if (data := await note_async.get_note(db, note_id)):
         return data
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
 
 
+@router.get("/get_content", response_class=Response, status_code=status.HTTP_200_OK, include_in_schema=True)
+def get_content(note_id: int, request: Request, db: Session = Depends(get_read_db)) -> Response:
+    """get note content, validated by a strong ETag of its content hash and gzip compressed if accepted
+
+    Args:
+        note_id (int): note id
+        request (Request): request with `If-None-Match` and `Accept-Encoding` headers
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+
+    Raises:
+        HTTPException: 404 for not find the target note or its file
+
+    Returns:
+        Response: note content, 304 without body if the cached copy of the client is the newest
+    """
+    logger.debug(f"GET /note/get_content?note_id={note_id}")
+    if not (db_note := note.get_note(db, note_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    # unknown for a note saved before the hash column
+    content_hash = str(db_note.content_hash) if db_note.content_hash else None
+    # one tag per encoding, a strong ETag names the exact bytes
+    matches = {tag.strip().removeprefix("W/").strip('"').removesuffix("-gzip")
+               for tag in request.headers.get("if-none-match", "").split(",")}
+    if content_hash and content_hash in matches:
+        headers["ETag"] = f'"{content_hash}{"-gzip" if gzip else ""}"'
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    try:
+        content = load_note_content(note_id, str(db_note.url), content_hash, gzip)
+    except OSError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
+    if content.gzip is not None:
+        headers.update({"ETag": f'"{content.content_hash}-gzip"', "Content-Encoding": "gzip"})
+        return Response(content.gzip, media_type="text/markdown; charset=utf-8", headers=headers)
+    headers["ETag"] = f'"{content.content_hash}"'
+    return Response(content.data, media_type="text/markdown; charset=utf-8", headers=headers)
+
+
+@router.get("/get_blocks", response_class=Response, status_code=status.HTTP_200_OK, include_in_schema=True)
+def get_blocks(note_id: int, request: Request, db: Session = Depends(get_read_db)) -> Response:
+    """get note content rendered into `pap_proto.Block` messages, cached by content hash
+
+    Args:
+        note_id (int): note id
+        request (Request): request with `If-None-Match` header
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+
+    Raises:
+        HTTPException: 404 for not find the target note or its file | 400 for content not UTF-8 text |
+            503 for `libmdencoder` not loaded
+
+    Returns:
+        Response: length-delimited protobuf blocks, 304 without body if the cached copy of the client is the newest
+    """
+    logger.debug(f"GET /note/get_blocks?note_id={note_id}")
+    if not (db_note := note.get_note(db, note_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
+    headers = {"Cache-Control": "no-cache"}
+    # empty for a note saved before the hash column
+    content_hash: str = str(db_note.content_hash) if db_note.content_hash else ""
+    if content_hash and content_hash in {tag.strip().removeprefix("W/").strip('"')
+                                         for tag in request.headers.get("if-none-match", "").split(",")}:
+        headers["ETag"] = f'"{content_hash}"'
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # rendered before, the note content isn't read
+    if not content_hash or (blocks := block_renderer.get(content_hash)) is None:
+        try:
+            content = load_note_content(note_id, str(db_note.url), content_hash or None)
+            content_hash = content.content_hash
+            blocks = block_renderer.render(content_hash, content.data)
+        except OSError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="笔记内容不是UTF-8文本")
+    if blocks is None:
+        logger.error(f"markdown encoder not found: {block_renderer.lib_path}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="markdown渲染库加载失败")
+    headers["ETag"] = f'"{content_hash}"'
+    return Response(blocks, media_type="application/x-protobuf", headers=headers)
+
+
 @router.post("/get_note_by_tags", response_model=list[NoteRelationshipSchema], status_code=status.HTTP_200_OK, include_in_schema=True)
-def get_note_by_tags(tags_id: TagSetSchema, db: Session = Depends(get_db)) -> list[NoteModel]:
+async def get_note_by_tags(tags_id: TagSetSchema, db: AsyncSession = Depends(get_async_read_db)) -> list[NoteModel]:
     """get notes by tags
 
     Args:
         tags_id (TagSetSchema): id of filter tags
-        db (Session, optional): database session. Defaults to Depends(get_db).
+        db (AsyncSession, optional): asyncio database session. Defaults to Depends(get_async_read_db).
 
     Returns:
         list[NoteModel]: query result, all notes model
     """
     logger.debug(f"GET /note/get_note_by_tags")
-    return note.get_notes_by_tags(db, tags_id)
+    return await note_async.get_notes_by_tags(db, tags_id)
+
+
+@router.post("/query_by_tags", response_model=TagQueryResultSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
+def query_by_tags(expression: TagQuerySchema, db: Session = Depends(get_read_db)) -> TagQueryResultSchema:
+    """get notes by a boolean tag expression from the in-memory tag index
+
+    Args:
+        expression (TagQuerySchema): `tag_id`, `and`, `or`, `not` expression tree
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+
+    Returns:
+        TagQueryResultSchema: id of matching notes and the count of them by tag
+    """
+    logger.debug(f"POST /note/query_by_tags")
+    tag_index.prepare(db)
+    notes_id, facets = tag_index.query(expression)
+    return TagQueryResultSchema(count=len(notes_id), notes_id=notes_id, facets=facets)
 
 
 @router.get("/get_note_by_name", response_model=NoteRelationshipSchema, status_code=status.HTTP_200_OK, include_in_schema=True)
-def get_note_by_name(note_name: str, db: Session = Depends(get_db)) -> NoteModel:
+async def get_note_by_name(note_name: str, db: AsyncSession = Depends(get_async_read_db)) -> NoteModel:
     """get note by name
 
     Args:
         note_name (str): note name
-        db (Session, optional): database session. Defaults to Depends(get_db).
+        db (AsyncSession, optional): asyncio database session. Defaults to Depends(get_async_read_db).
 
     Raises:
         HTTPException: 404 for not find the target note
@@ -94,36 +272,147 @@ def get_note_by_name(note_name: str, db: Session = Depends(get_db)) -> NoteModel
     """
     logger.debug(
         f"GET /note/get_note_by_name?note_name={note_name}")
-    if (data := note.get_note_by_name(db, note_name)):
+    if (data := await note_async.get_note_by_name(db, note_name)):
         return data
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
 
 
-@router.post("/save_note", status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
-def save_note(note_id: int, file: UploadFile, db: Session = Depends(get_db)):
-    """save note by id
+@router.get("/search_notes", response_model=list[NoteSearchSchema], status_code=status.HTTP_200_OK, include_in_schema=True)
+def search_notes(query: str, limit: int = Query(default=50, ge=1, le=500),
+                 db: Session = Depends(get_read_db),
+                 sessions: sessionmaker = Depends(get_session_factory)) -> list[NoteSearchSchema]:
+    """full-text search over names and contents of all notes
+
+    Args:
+        query (str): whitespace separated terms, a note must contain all of them
+        limit (int, optional): max hit count. Defaults to 50.
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+        sessions (sessionmaker, optional): session factory to index the notes on the first search.
+            Defaults to Depends(get_session_factory).
+
+    Returns:
+        list[NoteSearchSchema]: hits ranked by BM25, best first, matches in the snippet wrapped in `<mark>`
+    """
+    logger.debug(f"GET /note/search_notes?query={query}&limit={limit}")
+    # buffered saves are indexed once written
+    note_buffer.flush()
+    note_search.ensure_ready(sessions)
+    return note_search.search(db, query, limit)
+
+
+@router.get("/grep_notes", response_class=StreamingResponse, status_code=status.HTTP_200_OK, include_in_schema=True)
+def grep_notes(pattern: str, ignore_case: bool = False, db: Session = Depends(get_read_db)) -> StreamingResponse:
+    """regular expression search over all note files, matches streamed as they are found
+
+    Args:
+        pattern (str): regular expression, `^` and `$` match at every line
+        ignore_case (bool, optional): case insensitive match. Defaults to False.
+        db (Session, optional): database session. Defaults to Depends(get_read_db).
+
+    Raises:
+        HTTPException: 400 for an invalid pattern
+
+    Returns:
+        StreamingResponse: NDJSON, one line per match and a summary line at the end
+    """
+    logger.debug(f"GET /note/grep_notes?pattern={pattern}&ignore_case={ignore_case}")
+    if error := note_grep.check(pattern, ignore_case):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"正则表达式错误: {error}")
+    # the scan and the prefilter read the note files, buffered saves are written first
+    note_buffer.flush()
+    # only the notes containing the literals of the pattern are scanned
+    trigram_index.prepare(db)
+    candidates = trigram_index.candidates(pattern, ignore_case)
+    notes = [(id, name, url) for id, name, url in
+             db.query(NoteModel.id, NoteModel.name, NoteModel.url).order_by(NoteModel.id).all()
+             if candidates is None or candidates >> id & 1]
+    # the scan doesn't touch the database, don't hold the connection until the stream ends
+    db.close()
+    return StreamingResponse(note_grep.grep(notes, pattern, ignore_case), media_type="application/x-ndjson")
+
+
+@router.post("/save_note", response_model=str, status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
+def save_note(note_id: int, file: UploadFile, content_hash: str | None = None, db: Session = Depends(get_db)) -> str:
+    """save note by id, the upload is streamed to a temporary file which replaces the note
 
     Args:
         note_id (int): note id 
         file (UploadFile): upload file from frontend
+        content_hash (str | None, optional): sha256 hex of the upload, the save is skipped
+            without reading it if the note has this content already. Defaults to None.
         db (Session, optional): database session. Defaults to Depends(get_db).
 
     Raises:
         HTTPException: 404 for not find the target note
+
+    Returns:
+        str: sha256 hex of the note content
     """
     logger.debug(f"POST /note/save_note?note_id={note_id}")
     if (data := note.get_note(db, note_id)):
-        file_data = file.file.read()
-        with open(data.url, 'wb') as fout:
-            fout.write(file_data)
-            file.file.close()
+        if content_hash is None or content_hash != data.content_hash:
+            with file.file:
+                # a small save goes to the write-behind buffer, it is indexed once written
+                content = file.file.read(note_buffer.MAX_SIZE + 1) if note_buffer.is_enabled else None
+                if content is not None and note_buffer.accepts(len(content)):
+                    note.buffer_note(db, data, content)
+                else:
+                    file.file.seek(0)
+                    # trigrams are taken from the upload as it is written, the note is not read back for them
+                    grams = TrigramStream(trigram_index.generator)
+                    if note.save_note(db, data, file.file, grams):
+                        net_index.update(db, data)
+                        note_search.update(db, data)
+                        trigram_index.update(int(data.id), str(data.url), grams=grams.trigrams())
+        return str(data.content_hash)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
 
 
+@router.post("/patch_note", response_model=str, status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
+def patch_note(patch: NotePatchSchema, db: Session = Depends(get_db)) -> str:
+    """apply range edits to a note, instead of uploading the whole content
+
+    Args:
+        patch (NotePatchSchema): note id, hash of the version the edits are against and the edits
+        db (Session, optional): database session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: 404 for not find the target note
+        HTTPException: 409 for a note which is not at the base version any more, save it in full
+        HTTPException: 400 for an edit past the end of the note
+
+    Returns:
+        str: sha256 hex of the note content
+    """
+    logger.debug(f"POST /note/patch_note?note_id={patch.note_id}")
+    if not (data := note.get_note(db, patch.note_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记文件查找失败")
+    try:
+        if note_buffer.is_enabled:
+            content_hash = note.patch_buffered_note(db, data, patch)
+        else:
+            content_hash = note.patch_note(db, data, patch)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="编辑范围超出笔记内容")
+    if content_hash is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="笔记版本不一致")
+    if note_buffer.is_enabled:
+        # indexed once written
+        return content_hash
+    net_index.update(db, data)
+    note_search.update(db, data)
+    trigram_index.update(int(data.id), str(data.url))
+    return content_hash
+
+
 @router.put("/rename_note", status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
 def rename_note(note_update: NoteUpdateSchema, db: Session = Depends(get_db)):
     """update note name
@@ -133,7 +422,13 @@ def rename_note(note_update: NoteUpdateSchema, db: Session = Depends(get_db)):
         db (Session, optional): database session. Defaults to Depends(get_db).
     """
     logger.info("PUT /note/rename_note")
-    note.update_name(db, note_update)
+    names = {note_update.name}
+    if (data := note.get_note(db, note_update.id)):
+        names.add(str(data.name))
+    with net_index.change(db, names):
+        note.update_name(db, note_update)
+    if data:
+        note_search.rename(db, note_update.id, note_update.name)
 
 
 @router.delete("/delete_note", status_code=status.HTTP_200_OK, include_in_schema=True)
@@ -145,7 +440,33 @@ def delete_note(note_id: int, db: Session = Depends(get_db)):
         db (Session, optional): database session. Defaults to Depends(get_db).
     """
     logger.info(f"DELETE /note/delete_note?note_id={note_id}")
-    note.delete_note(db, note_id)
+    names = {str(data.name)} if (data := note.get_note(db, note_id)) else set()
+    with net_index.change(db, names):
+        note.delete_note(db, note_id)
+    note_search.remove(db, note_id)
+    trigram_index.remove(note_id)
+
+
+@router.post("/bulk_delete", response_model=list[int], status_code=status.HTTP_200_OK, include_in_schema=True)
+def bulk_delete(notes_id: NoteSetSchema, db: Session = Depends(get_db)) -> list[int]:
+    """delete many notes by note id in one transaction
+
+    Args:
+        notes_id (NoteSetSchema): target ids, unknown ones are skipped
+        db (Session, optional): database session. Defaults to Depends(get_db).
+
+    Returns:
+        list[int]: id of the deleted notes
+    """
+    logger.info(f"POST /note/bulk_delete count={len(notes_id.notes_id)}")
+    names = {str(name) for name, in db.query(NoteModel.name)
+             .where(NoteModel.id.in_(set(notes_id.notes_id))).all()}
+    with net_index.change(db, names):
+        deleted = note.delete_notes(db, notes_id.notes_id)
+    note_search.remove_many(db, deleted)
+    for note_id in deleted:
+        trigram_index.remove(note_id)
+    return deleted
 
 
 @router.put("/remove_note", status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
@@ -1,29 +1,30 @@
 from model.note_group import NoteModel, TagModel
-from schemas.tag_base import TagCreateSchema, TagSchema
+from schemas.tag_base import TagCreateSchema, TagSchema, TagAssignSchema
 from schemas.note import NoteRelationshipSchema
 from schemas.tag import TagRelationshipSchema
 from service.logger import logger
-from service.database import get_db
-from service.crud import tag
+from service.database import get_db, get_async_read_db
+from service.crud import tag, tag_async
 
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status, APIRouter, Depends
 
 router = APIRouter(prefix="/tag")
 
 
 @router.get("/get_tags", response_model=list[TagRelationshipSchema], status_code=status.HTTP_200_OK, include_in_schema=True)
-def get_tags(db: Session = Depends(get_db)) -> list[TagModel]:
+async def get_tags(db: AsyncSession = Depends(get_async_read_db)) -> list[TagModel]:
     """get all tags(with relationship)
 
     Args:
-        db (Session, optional): database session. Defaults to Depends(get_db).
+        db (AsyncSession, optional): asyncio database session. Defaults to Depends(get_async_read_db).
 
     Returns:
         list[TagModel]: query result, all tags model
     """
     logger.debug("GET /tag/get_tags")
-    return tag.get_tags(db)
+    return await tag_async.get_tags(db)
 
 
 @router.post("/create_tag", response_model=TagRelationshipSchema, status_code=status.HTTP_201_CREATED, include_in_schema=True)
@@ -50,17 +51,17 @@ def create_tag(new_tag: TagCreateSchema, db: Session = Depends(get_db)) -> TagMo
 
 
 @router.get("/get_note_tags", response_model=list[TagRelationshipSchema], status_code=status.HTTP_200_OK, include_in_schema=True)
-def get_note_tags(note_id: int, db: Session = Depends(get_db)) -> list[TagModel]:
+async def get_note_tags(note_id: int, db: AsyncSession = Depends(get_async_read_db)) -> list[TagModel]:
     """get target note's tags(with relationship)
 
     Args:
-        db (Session, optional): database session. Defaults to Depends(get_db).
+        db (AsyncSession, optional): asyncio database session. Defaults to Depends(get_async_read_db).
 
     Returns:
         list[TagModel]: query result, all tags model
     """
     logger.debug(f"GET /tag/get_note_tags?note_id={note_id}")
-    return tag.get_note_tags(db, note_id)
+    return await tag_async.get_note_tags(db, note_id)
 
 
 @router.put("/add_tag", response_model=NoteRelationshipSchema, status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
@@ -88,6 +89,22 @@ def add_tag(tag_id: int, note_id: int, db: Session = Depends(get_db)) -> NoteMod
             status_code=status.HTTP_404_NOT_FOUND, detail="目标笔记或者标签查找失败")
 
 
+@router.put("/bulk_assign", response_model=int, status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
+def bulk_assign(assignment: TagAssignSchema, db: Session = Depends(get_db)) -> int:
+    """add every tag to every note in one transaction
+
+    Args:
+        assignment (TagAssignSchema): target tag ids and note ids, unknown ones are skipped
+        db (Session, optional): database session. Defaults to Depends(get_db).
+
+    Returns:
+        int: count of added tag note pairs, the ones which existed are not counted
+    """
+    logger.info(
+        f"PUT /tag/bulk_assign tags={len(assignment.tags_id)}&notes={len(assignment.notes_id)}")
+    return tag.assign_tags(db, assignment.tags_id, assignment.notes_id)
+
+
 @router.put("/update_tag", response_model=TagRelationshipSchema, status_code=status.HTTP_202_ACCEPTED, include_in_schema=True)
 def update_tag(new_tag: TagSchema, db: Session = Depends(get_db)) -> TagModel:
     """update tag data to a note
@@ -23,3 +23,30 @@ class PathConfigSchema(BaseConfigSchema):
     log_path: str
     tag_path: str
     emoji_path: str
+
+
+class NetConfigSchema(BaseConfigSchema):
+    workers: int
+    history: int
+    layout: bool
+    layout_iterations: int
+
+
+class GrepConfigSchema(BaseConfigSchema):
+    workers: int
+    timeout: float
+    max_matches: int
+
+
+class DatabaseConfigSchema(BaseConfigSchema):
+    journal_mode: str
+    synchronous: str
+    cache_size: int
+    mmap_size: int
+    busy_timeout: int
+    readers: int
+
+
+class SaveConfigSchema(BaseConfigSchema):
+    write_behind: bool
+    debounce: int
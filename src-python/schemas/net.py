@@ -21,3 +21,57 @@ class NetLinkSchema (BaseModel):
 class NetSchema (BaseModel):
     nodes: list[NetNodeSchema]
     links: list[NetLinkSchema]
+    version: int = 0
+
+
+class NetDeltaLinkSchema (BaseModel):
+    """link between two nodes by key, note id for a note, name for a resource
+    """
+    source: int | str
+    target: int | str
+
+
+class NetDeltaSchema (BaseModel):
+    """changes of the net from version `since` to version `version`
+
+    `nodes` and `links` are added or updated, `removed_nodes` and
+    `removed_links` are removed. If `full` is set the delta is a whole
+    snapshot and replaces the net of the client.
+    """
+    since: int
+    version: int
+    full: bool
+    nodes: list[NetNodeSchema]
+    links: list[NetDeltaLinkSchema]
+    removed_nodes: list[NetNodeSchema]
+    removed_links: list[NetDeltaLinkSchema]
+
+
+class NetNodeKeySchema (BaseModel):
+    id: int
+    data: str
+    is_md: bool
+
+
+class NetRankSchema (NetNodeKeySchema):
+    value: float
+
+
+class NetAnalyticsSchema (BaseModel):
+    """analytics of the directed link graph at `version`, rankings are the top nodes
+    """
+    version: int
+    iterations: int
+    pagerank: list[NetRankSchema]
+    in_degree: list[NetRankSchema]
+    out_degree: list[NetRankSchema]
+    components: int
+    component_sizes: list[int]
+    orphans: list[NetNodeKeySchema]
+
+
+class NetPathSchema (BaseModel):
+    """paths between two notes at `version`, shortest first, each from the start note to the end note
+    """
+    version: int
+    paths: list[list[NetNodeKeySchema]]
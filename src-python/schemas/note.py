@@ -1,4 +1,4 @@
-from .note_base import NoteSchema
+from .note_base import NoteBaseSchema, NoteSchema
 from .tag_base import TagSchema
 
 from pydantic import ConfigDict
@@ -10,3 +10,11 @@ class NoteRelationshipSchema(NoteSchema):
     tags: list[TagSchema]
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class NoteSearchSchema(NoteBaseSchema):
+    """full-text search hit
+    """
+    id: int
+    snippet: str
+    score: float
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class NoteBaseSchema(BaseModel):
@@ -24,3 +24,37 @@ class NoteSchema(NoteCreateSchema):
     """
     id: int
     url: str
+
+
+class NoteSetSchema(BaseModel):
+    """for bulk delete
+    """
+    notes_id: list[int]
+
+
+class NoteEditSchema(BaseModel):
+    """a range edit, byte offsets into the UTF-8 content of the base version
+    """
+    start: int = Field(ge=0)
+    end: int = Field(ge=0)
+    text: str
+
+    @model_validator(mode="after")
+    def check_range(self) -> "NoteEditSchema":
+        if self.end < self.start:
+            raise ValueError("`end` is before `start`")
+        return self
+
+
+class NotePatchSchema(BaseModel):
+    """for patch, edits sorted by offset and not overlapping
+    """
+    note_id: int
+    base_hash: str
+    edits: list[NoteEditSchema]
+
+    @model_validator(mode="after")
+    def check_order(self) -> "NotePatchSchema":
+        if any(a.end > b.start for a, b in zip(self.edits, self.edits[1:])):
+            raise ValueError("edits are expected in order and not overlapping")
+        return self
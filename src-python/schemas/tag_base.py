@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class TagBaseSchema(BaseModel):
@@ -24,3 +26,38 @@ class TagSetSchema(BaseModel):
     """from filter
     """
     tags_id: list[int]
+
+
+class TagAssignSchema(TagSetSchema):
+    """for bulk assign, every tag to every note
+    """
+    notes_id: list[int]
+
+
+class TagQuerySchema(BaseModel):
+    """boolean tag expression, exactly one field is set:
+    a tag id, `and` / `or` of sub expressions, or `not` of one
+
+    e.g. `{"and": [{"tag_id": 1}, {"not": {"or": [{"tag_id": 2}, {"tag_id": 3}]}}]}`
+    """
+    tag_id: Optional[int] = None
+    and_: Optional[list["TagQuerySchema"]] = Field(default=None, alias="and")
+    or_: Optional[list["TagQuerySchema"]] = Field(default=None, alias="or")
+    not_: Optional["TagQuerySchema"] = Field(default=None, alias="not")
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    @model_validator(mode="after")
+    def check_one(self) -> "TagQuerySchema":
+        if sum(field is not None for field in (self.tag_id, self.and_, self.or_, self.not_)) != 1:
+            raise ValueError("exactly one of `tag_id`, `and`, `or`, `not` is expected")
+        return self
+
+
+class TagQueryResultSchema(BaseModel):
+    """notes matching a tag expression
+    """
+    count: int
+    notes_id: list[int]
+    # tag id to the count of matching notes with the tag, tags without one are left out
+    facets: dict[int, int]
@@ -2,7 +2,7 @@ from os import path, mkdir
 from abc import ABC, abstractmethod
 from typing import Optional, Any, TypeVar, Generic
 
-from schemas.config import BaseConfigSchema, SystemConfigSchema, BasicConfigSchema, PathConfigSchema
+from schemas.config import BaseConfigSchema, SystemConfigSchema, BasicConfigSchema, PathConfigSchema, NetConfigSchema, GrepConfigSchema, DatabaseConfigSchema, SaveConfigSchema
 
 from toml import load as toml_load
 from toml import dump as toml_dump
@@ -330,6 +330,246 @@ class PathConfig(BaseConfig[PathConfigSchema]):
         return PathConfigSchema(**data_dict)
 
 
+class NetConfig(BaseConfig[NetConfigSchema]):
+    """关系网络设置
+    """
+
+    def __init__(self, config_manager: ConfigManager) -> None:
+        super().__init__(config_manager, "net")
+
+    @property
+    def workers(self) -> int:
+        """提取笔记链接的线程数, 0 表示使用全部逻辑核心
+
+        Returns:
+            int: 线程数
+        """
+        return self.get_property("workers") or 0
+
+    @workers.setter
+    def workers(self, value: int) -> None:
+        self.set_property("workers", value)
+
+    @property
+    def history(self) -> int:
+        """保留的关系网络增量版本数, 超出后客户端需重新获取完整网络
+
+        Returns:
+            int: 版本数
+        """
+        return self.get_property("history") or 256
+
+    @history.setter
+    def history(self, value: int) -> None:
+        self.set_property("history", value)
+
+    @property
+    def layout(self) -> bool:
+        """是否在服务端计算关系网络布局
+
+        Returns:
+            bool: 是否启用
+        """
+        return self.get_property("layout") or False
+
+    @layout.setter
+    def layout(self, value: bool) -> None:
+        self.set_property("layout", value)
+
+    @property
+    def layout_iterations(self) -> int:
+        """完整布局的迭代次数, 增量布局使用其十分之一
+
+        Returns:
+            int: 迭代次数
+        """
+        return self.get_property("layout_iterations") or 300
+
+    @layout_iterations.setter
+    def layout_iterations(self, value: int) -> None:
+        self.set_property("layout_iterations", value)
+
+    def _create_schema_instance(self, data_dict) -> NetConfigSchema:
+        return NetConfigSchema(**data_dict)
+
+
+class GrepConfig(BaseConfig[GrepConfigSchema]):
+    """全库正则搜索设置
+    """
+
+    def __init__(self, config_manager: ConfigManager) -> None:
+        super().__init__(config_manager, "grep")
+
+    @property
+    def workers(self) -> int:
+        """搜索笔记文件的进程数, 0 表示使用全部逻辑核心
+
+        Returns:
+            int: 进程数
+        """
+        return self.get_property("workers") or 0
+
+    @workers.setter
+    def workers(self, value: int) -> None:
+        self.set_property("workers", value)
+
+    @property
+    def timeout(self) -> float:
+        """单次搜索的超时时间, 超时后返回已找到的结果
+
+        Returns:
+            float: 超时秒数
+        """
+        return self.get_property("timeout") or 10.0
+
+    @timeout.setter
+    def timeout(self, value: float) -> None:
+        self.set_property("timeout", value)
+
+    @property
+    def max_matches(self) -> int:
+        """单次搜索返回的最大匹配数
+
+        Returns:
+            int: 最大匹配数
+        """
+        return self.get_property("max_matches") or 1000
+
+    @max_matches.setter
+    def max_matches(self, value: int) -> None:
+        self.set_property("max_matches", value)
+
+    def _create_schema_instance(self, data_dict) -> GrepConfigSchema:
+        return GrepConfigSchema(**data_dict)
+
+
+class DatabaseConfig(BaseConfig[DatabaseConfigSchema]):
+    """SQLite 数据库设置, 每个连接建立时生效
+    """
+
+    def __init__(self, config_manager: ConfigManager) -> None:
+        super().__init__(config_manager, "database")
+
+    @property
+    def journal_mode(self) -> str:
+        """日志模式, WAL 模式下读连接不会被写入阻塞
+
+        Returns:
+            str: DELETE | TRUNCATE | PERSIST | MEMORY | WAL | OFF
+        """
+        return self.get_property("journal_mode") or "WAL"
+
+    @journal_mode.setter
+    def journal_mode(self, value: str) -> None:
+        self.set_property("journal_mode", value)
+
+    @property
+    def synchronous(self) -> str:
+        """同步级别, WAL 模式下 NORMAL 不会损坏数据库, 断电时可能丢失最后的事务
+
+        Returns:
+            str: OFF | NORMAL | FULL | EXTRA
+        """
+        return self.get_property("synchronous") or "NORMAL"
+
+    @synchronous.setter
+    def synchronous(self, value: str) -> None:
+        self.set_property("synchronous", value)
+
+    @property
+    def cache_size(self) -> int:
+        """每个连接的页缓存大小, 负数表示 KiB, 正数表示页数
+
+        Returns:
+            int: 缓存大小
+        """
+        return self.get_property("cache_size") or -16384
+
+    @cache_size.setter
+    def cache_size(self, value: int) -> None:
+        self.set_property("cache_size", value)
+
+    @property
+    def mmap_size(self) -> int:
+        """内存映射读取数据库文件的最大字节数, 0 表示不使用
+
+        Returns:
+            int: 字节数
+        """
+        mmap_size = self.get_property("mmap_size")
+        return 268435456 if mmap_size is None else mmap_size
+
+    @mmap_size.setter
+    def mmap_size(self, value: int) -> None:
+        self.set_property("mmap_size", value)
+
+    @property
+    def busy_timeout(self) -> int:
+        """数据库被锁定时的等待时间
+
+        Returns:
+            int: 毫秒数
+        """
+        return self.get_property("busy_timeout") or 5000
+
+    @busy_timeout.setter
+    def busy_timeout(self, value: int) -> None:
+        self.set_property("busy_timeout", value)
+
+    @property
+    def readers(self) -> int:
+        """只读连接池的连接数, 写入只使用一个连接
+
+        Returns:
+            int: 连接数
+        """
+        return self.get_property("readers") or 4
+
+    @readers.setter
+    def readers(self, value: int) -> None:
+        self.set_property("readers", value)
+
+    def _create_schema_instance(self, data_dict) -> DatabaseConfigSchema:
+        return DatabaseConfigSchema(**data_dict)
+
+
+class SaveConfig(BaseConfig[SaveConfigSchema]):
+    """笔记保存设置
+    """
+
+    def __init__(self, config_manager: ConfigManager) -> None:
+        super().__init__(config_manager, "save")
+
+    @property
+    def write_behind(self) -> bool:
+        """延迟写入开关, 开启时保存的内容先留在内存中, 合并连续的保存后再写入磁盘
+
+        Returns:
+            bool: 是否延迟写入
+        """
+        return self.get_property("write_behind") or False
+
+    @write_behind.setter
+    def write_behind(self, value: bool) -> None:
+        self.set_property("write_behind", value)
+
+    @property
+    def debounce(self) -> int:
+        """延迟写入时, 第一次未写入的保存到写入磁盘的等待时间
+
+        Returns:
+            int: 毫秒数
+        """
+        return self.get_property("debounce") or 2000
+
+    @debounce.setter
+    def debounce(self, value: int) -> None:
+        self.set_property("debounce", value)
+
+    def _create_schema_instance(self, data_dict) -> SaveConfigSchema:
+        return SaveConfigSchema(**data_dict)
+
+
 class DevConfig(BaseConfig[BaseConfigSchema]):
     """开发配置
     """
@@ -372,5 +612,9 @@ config_manager = ConfigManager("./data/config.toml")
 system_config = SystemConfig(config_manager=config_manager)
 basic_config = BasicConfig(config_manager=config_manager)
 path_config = PathConfig(config_manager=config_manager)
+net_config = NetConfig(config_manager=config_manager)
+grep_config = GrepConfig(config_manager=config_manager)
+database_config = DatabaseConfig(config_manager=config_manager)
+save_config = SaveConfig(config_manager=config_manager)
 dev_config = DevConfig(config_manager=config_manager)
 path_config.check_path()
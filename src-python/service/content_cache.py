@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from gzip import compress
+from hashlib import sha256
+from threading import Lock
+from typing import Any, Hashable, NamedTuple, Optional
+
+from service.write_behind import note_buffer
+
+
+class ContentCache:
+    """LRU cache of contents under a memory budget
+
+    Each entry is put with its size in bytes, the least recently used entries
+    are evicted until the total fits in `budget`, an entry larger than the
+    budget is not kept.
+    """
+
+    def __init__(self, budget: int) -> None:
+        """
+        Args:
+            budget (int): max total size of the entries in bytes
+        """
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        with self._lock:
+            self._pop(key)
+            if size > self.budget:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.budget:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _pop(self, key: Hashable) -> None:
+        if (entry := self._entries.pop(key, None)) is not None:
+            self.size -= entry[1]
+
+
+class NoteContent(NamedTuple):
+    """content of a note and its sha256, the gzip body is made on the first request accepting it
+    """
+    content_hash: str
+    data: bytes
+    gzip: Optional[bytes] = None
+
+
+# hot note contents by note id
+note_contents = ContentCache(64 * 1024 * 1024)
+# smaller contents are sent as they are
+GZIP_MIN_SIZE = 1024
+
+
+def load_note_content(note_id: int, url: str, content_hash: Optional[str], gzip: bool = False) -> NoteContent:
+    """newest content of a note, from the write-behind buffer, the cache or the note file
+
+    A cached content is used while its hash is still the one of the note,
+    a note saved since then is read again.
+
+    Args:
+        note_id (int): note id
+        url (str): note file path
+        content_hash (Optional[str]): content hash of the note in the database, None for unknown
+        gzip (bool, optional): make the gzip body too. Defaults to False.
+
+    Raises:
+        OSError: the note file can't be read
+
+    Returns:
+        NoteContent: content, hash of the content and gzip body if asked
+    """
+    cached = None
+    if (data := note_buffer.get(note_id)) is not None:
+        content = NoteContent(sha256(data).hexdigest(), data)
+    elif (cached := note_contents.get(note_id)) is not None and cached.content_hash == content_hash:
+        content = cached
+    else:
+        with open(url, "rb") as f:
+            data = f.read()
+        content = NoteContent(sha256(data).hexdigest(), data)
+    if gzip and content.gzip is None and len(content.data) >= GZIP_MIN_SIZE:
+        content = content._replace(gzip=compress(content.data, compresslevel=4, mtime=0))
+    if content is not cached:
+        note_contents.put(note_id, content, len(content.data) + len(content.gzip or b""))
+    return content
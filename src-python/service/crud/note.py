@@ -1,14 +1,324 @@
-from os import path
+from hashlib import sha256
+from os import path, remove, replace, unlink, fsync, chmod, stat, open as os_open, close as os_close, O_RDONLY
+from functools import partial
+from io import BytesIO
+from tempfile import mkstemp
+from threading import Lock
+from typing import Any, BinaryIO, Iterable, Iterator, Optional
 
 from service.config import path_config
-from model.note_group import NoteModel, note_tag_association
-from schemas.note_base import NoteCreateSchema, NoteUpdateSchema
+from model.note_group import NoteModel, NoteLinkModel, NetPositionModel, note_tag_association
+from schemas.note_base import NoteCreateSchema, NoteUpdateSchema, NoteSchema, NoteEditSchema, NotePatchSchema
 from schemas.tag_base import TagSetSchema
+from service.tag_index import tag_index
+from service.write_behind import note_buffer
+from service.content_cache import note_contents
 
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, delete, select
+from sqlalchemy.orm import Session, selectinload
 from uuid import uuid4
 
+# upload chunk size, memory held by a save
+CHUNK = 1 << 20
+EMPTY_HASH = sha256().hexdigest()
+# held from the hash update to the rename of a note file
+_replace_lock = Lock()
+
+
+def create_note_files(urls: list[str]) -> None:
+    """create empty note files, the ones made before a failure are removed again
+
+    Args:
+        urls (list[str]): note file paths
+
+    Raises:
+        OSError: a file can't be created
+    """
+    for i, url in enumerate(urls):
+        try:
+            open(url, "w").close()
+        except OSError:
+            remove_note_files(urls[:i])
+            raise
+
+
+def remove_note_files(urls: list[str]) -> None:
+    """remove note files, missing ones are skipped
+
+    Args:
+        urls (list[str]): note file paths
+    """
+    for url in urls:
+        if path.exists(url):
+            remove(url)
+
+
+def write_temp_file(url: str, chunks: Iterable[bytes]) -> tuple[str, str]:
+    """write content into a temporary file next to `url` and fsync it
+
+    Memory is bounded by the size of a chunk whatever the content size.
+
+    Args:
+        url (str): note file path
+        chunks (Iterable[bytes]): new content
+
+    Returns:
+        tuple[str, str]: temporary file path, sha256 hex of the new content
+    """
+    fd, temp = mkstemp(dir=path.dirname(url) or ".", prefix=".", suffix=".tmp")
+    try:
+        digest = sha256()
+        with open(fd, "wb") as fout:
+            for chunk in chunks:
+                digest.update(chunk)
+                fout.write(chunk)
+            fout.flush()
+            fsync(fout.fileno())
+    except BaseException:
+        unlink(temp)
+        raise
+    return temp, digest.hexdigest()
+
+
+def tapped(chunks: Iterable[bytes], tap: Any) -> Iterator[bytes]:
+    """pass chunks through, `tap.update` sees each of them on the way
+
+    Args:
+        chunks (Iterable[bytes]): content
+        tap (Any): consumer with an `update(chunk)` method, like a hashlib object
+
+    Yields:
+        Iterator[bytes]: the same chunks
+    """
+    for chunk in chunks:
+        tap.update(chunk)
+        yield chunk
+
+
+def replace_note_file(temp: str, url: str) -> None:
+    """rename a temporary file from `write_temp_file` over `url`
+
+    The note is either the old or the new content after a crash, never a
+    truncated one.
+
+    Args:
+        temp (str): temporary file path
+        url (str): note file path
+    """
+    # mkstemp makes the file private, keep the mode of the note
+    chmod(temp, stat(url).st_mode if path.exists(url) else 0o644)
+    replace(temp, url)
+    # the rename itself is durable once the directory is synced
+    dir_fd = os_open(path.dirname(url) or ".", O_RDONLY)
+    try:
+        fsync(dir_fd)
+    finally:
+        os_close(dir_fd)
+
+
+def write_note_file(url: str, stream: BinaryIO) -> str:
+    """stream content into a temporary file next to `url`, fsync it and rename it over `url`
+
+    Args:
+        url (str): note file path
+        stream (BinaryIO): new content
+
+    Returns:
+        str: sha256 hex of the new content
+    """
+    temp, content_hash = write_temp_file(url, iter(partial(stream.read, CHUNK), b""))
+    try:
+        replace_note_file(temp, url)
+    finally:
+        if path.exists(temp):
+            unlink(temp)
+    return content_hash
+
+
+def patched_chunks(source: BinaryIO, edits: list[NoteEditSchema], base: Any) -> Iterator[bytes]:
+    """content with range edits applied, read and produced in chunks
+
+    Args:
+        source (BinaryIO): base content
+        edits (list[NoteEditSchema]): sorted, non overlapping byte ranges of the base content
+        base (Any): hashlib object, updated with the whole base content as it is read
+
+    Raises:
+        ValueError: an edit range is past the end of the base content
+
+    Yields:
+        Iterator[bytes]: new content
+    """
+    def copy(size: int, keep: bool) -> Iterator[bytes]:
+        while size > 0:
+            if not (chunk := source.read(min(CHUNK, size))):
+                raise ValueError("edit range past the end of the note")
+            base.update(chunk)
+            size -= len(chunk)
+            if keep:
+                yield chunk
+
+    offset = 0
+    for edit in edits:
+        yield from copy(edit.start - offset, True)
+        yield edit.text.encode("utf-8")
+        yield from copy(edit.end - edit.start, False)
+        offset = edit.end
+    while chunk := source.read(CHUNK):
+        base.update(chunk)
+        yield chunk
+
+
+def save_note(db: Session, db_note: NoteModel, stream: BinaryIO, tap: Optional[Any] = None) -> bool:
+    """replace the content of target note and store its hash
+
+    A seekable upload is hashed before anything is written, an unchanged
+    content is neither written nor synced. The transaction of the lookup is
+    committed first, the writer connection goes back to the pool while the
+    upload is hashed, written and synced, and is taken again only for the
+    hash update and the rename.
+
+    Args:
+        db (Session): database session
+        db_note (NoteModel): target note
+        stream (BinaryIO): new content
+        tap (Optional[Any], optional): updated with each chunk of a new content as it is written,
+            like a hashlib object. Defaults to None.
+
+    Returns:
+        bool: False if the content is unchanged, the file is left untouched
+    """
+    note_id, url, old_hash = int(db_note.id), str(db_note.url), db_note.content_hash
+    db.commit()
+    if stream.seekable():
+        digest = sha256()
+        for chunk in iter(partial(stream.read, CHUNK), b""):
+            digest.update(chunk)
+        if digest.hexdigest() == old_hash:
+            return False
+        stream.seek(0)
+    chunks = iter(partial(stream.read, CHUNK), b"")
+    temp, content_hash = write_temp_file(url, chunks if tap is None else tapped(chunks, tap))
+    try:
+        if content_hash == old_hash:
+            return False
+        # buffered content older than this one is not written after it
+        note_buffer.discard(note_id)
+        # the stored hash and the file are replaced in the same order by concurrent saves
+        with _replace_lock:
+            db.query(NoteModel).filter(NoteModel.id == note_id).update({
+                NoteModel.content_hash: content_hash
+            })
+            db.commit()
+            replace_note_file(temp, url)
+        return True
+    finally:
+        if path.exists(temp):
+            unlink(temp)
+
+
+def patch_note(db: Session, db_note: NoteModel, patch: NotePatchSchema) -> str | None:
+    """apply range edits to the content of target note if it is still at the base version
+
+    The new hash is committed only if the stored one is still the base hash,
+    so of concurrent patches against one version a single one applies. The
+    hash is committed before the rename, a crash in between leaves a note
+    whose hash doesn't match and patches are refused until a full save.
+
+    Args:
+        db (Session): database session
+        db_note (NoteModel): target note
+        patch (NotePatchSchema): base hash and edits
+
+    Raises:
+        ValueError: an edit range is past the end of the note
+
+    Returns:
+        str | None: sha256 hex of the new content, None for a version mismatch
+    """
+    if db_note.content_hash != patch.base_hash:
+        return None
+    url = str(db_note.url)
+    base = sha256()
+    with open(url, "rb") as source:
+        temp, content_hash = write_temp_file(url, patched_chunks(source, patch.edits, base))
+    try:
+        if base.hexdigest() != patch.base_hash:
+            # the file was replaced since the hash was read
+            return None
+        with _replace_lock:
+            updated = db.query(NoteModel)\
+                .filter(NoteModel.id == db_note.id, NoteModel.content_hash == patch.base_hash)\
+                .update({NoteModel.content_hash: content_hash}, synchronize_session=False)
+            if not updated:
+                db.rollback()
+                return None
+            db.commit()
+            replace_note_file(temp, url)
+        return content_hash
+    finally:
+        if path.exists(temp):
+            unlink(temp)
+
+
+def buffer_note(db: Session, db_note: NoteModel, data: bytes) -> bool:
+    """store the hash of the new content of target note and leave the content to the
+    write-behind buffer
+
+    Args:
+        db (Session): database session
+        db_note (NoteModel): target note
+        data (bytes): new content
+
+    Returns:
+        bool: False if the content is unchanged
+    """
+    content_hash = sha256(data).hexdigest()
+    if content_hash == db_note.content_hash:
+        return False
+    with _replace_lock:
+        db.query(NoteModel).filter(NoteModel.id == db_note.id).update({
+            NoteModel.content_hash: content_hash
+        })
+        db.commit()
+        note_buffer.put(int(db_note.id), str(db_note.url), data)
+    return True
+
+
+def patch_buffered_note(db: Session, db_note: NoteModel, patch: NotePatchSchema) -> str | None:
+    """`patch_note` on the newest content in memory, the result goes to the write-behind buffer
+
+    Args:
+        db (Session): database session
+        db_note (NoteModel): target note
+        patch (NotePatchSchema): base hash and edits
+
+    Raises:
+        ValueError: an edit range is past the end of the note
+
+    Returns:
+        str | None: sha256 hex of the new content, None for a version mismatch
+    """
+    if db_note.content_hash != patch.base_hash:
+        return None
+    base = sha256()
+    content = note_buffer.get(int(db_note.id))
+    with BytesIO(content) if content is not None else open(str(db_note.url), "rb") as source:
+        data = b"".join(patched_chunks(source, patch.edits, base))
+    if base.hexdigest() != patch.base_hash:
+        return None
+    content_hash = sha256(data).hexdigest()
+    with _replace_lock:
+        updated = db.query(NoteModel)\
+            .filter(NoteModel.id == db_note.id, NoteModel.content_hash == patch.base_hash)\
+            .update({NoteModel.content_hash: content_hash}, synchronize_session=False)
+        if not updated:
+            db.rollback()
+            return None
+        db.commit()
+        note_buffer.put(int(db_note.id), str(db_note.url), data)
+    return content_hash
+
 
 def create_note(db: Session, note: NoteCreateSchema) -> NoteModel:
     """create a new note to database
@@ -21,15 +331,50 @@ def create_note(db: Session, note: NoteCreateSchema) -> NoteModel:
         NoteModel: new note
     """
     note_path = path.join(path_config.note_dir, f"{uuid4()}.md")
-    db_note = NoteModel(name=note.name, url=note_path)
+    db_note = NoteModel(name=note.name, url=note_path, content_hash=EMPTY_HASH)
     db.add(db_note)
+    db.flush()
+    create_note_files([note_path])
     db.commit()
     db.refresh(db_note)
+    tag_index.add_note(int(db_note.id))
     return db_note
 
 
+def create_notes(db: Session, notes: list[NoteCreateSchema]) -> list[NoteSchema]:
+    """create new notes in one transaction, rows are inserted in batches and the files after them
+
+    Args:
+        db (Session): database session
+        notes (list[NoteCreateSchema]): note schemas for create
+
+    Raises:
+        OSError: a note file can't be created, no note is created
+
+    Returns:
+        list[NoteSchema]: new notes in the order of `notes`
+    """
+    if not notes:
+        return []
+    rows = [{"name": note.name, "url": path.join(path_config.note_dir, f"{uuid4()}.md"),
+             "content_hash": EMPTY_HASH} for note in notes]
+    # plain rows instead of models, nothing is loaded again after the commit
+    created = [NoteSchema(id=id, name=name, url=url) for id, name, url in db.execute(
+        insert(NoteModel).returning(NoteModel.id, NoteModel.name, NoteModel.url, sort_by_parameter_order=True),
+        rows)]
+    try:
+        create_note_files([row["url"] for row in rows])
+    except OSError:
+        db.rollback()
+        raise
+    db.commit()
+    for note in created:
+        tag_index.add_note(note.id)
+    return created
+
+
 def get_notes(db: Session) -> list[NoteModel]:
-    """get all notes
+    """get all notes, tags are loaded in one more query
 
     Args:
         db (Session): database session
@@ -37,7 +382,7 @@ def get_notes(db: Session) -> list[NoteModel]:
     Returns:
         list[NoteModel]: query result
     """
-    return db.query(NoteModel).all()
+    return db.query(NoteModel).options(selectinload(NoteModel.tags)).all()
 
 
 def get_note(db: Session, note_id: int) -> NoteModel | None:
@@ -54,7 +399,7 @@ def get_note(db: Session, note_id: int) -> NoteModel | None:
 
 
 def get_notes_by_tags(db: Session, tags_id: TagSetSchema) -> list[NoteModel]:
-    """get target notes by tags
+    """get target notes by tags, tags are loaded in one more query
 
     Args:
         db (Session): database session
@@ -68,7 +413,8 @@ def get_notes_by_tags(db: Session, tags_id: TagSetSchema) -> list[NoteModel]:
               NoteModel.id == note_tag_association.c.note_id)\
         .where(note_tag_association.c.tag_id.in_(tags_id.tags_id))\
         .group_by(NoteModel.id)\
-        .having(func.count() == len(tags_id.tags_id))
+        .having(func.count() == len(tags_id.tags_id))\
+        .options(selectinload(NoteModel.tags))
     return query.all()
 
 
@@ -82,10 +428,7 @@ def get_note_by_name(db: Session, note_name: str) -> NoteModel | None:
     Returns:
         NoteModel | None: query result
     """
-    if notes := db.query(NoteModel).filter(NoteModel.name == note_name).all():
-        return notes[0]
-    else:
-        return None
+    return db.query(NoteModel).filter(NoteModel.name == note_name).first()
 
 
 def delete_note(db: Session, note_id: int):
@@ -96,8 +439,45 @@ def delete_note(db: Session, note_id: int):
         note_id (int): target note id
     """
     if target_note := db.get(NoteModel, note_id):
+        url = str(target_note.url)
+        note_buffer.discard(note_id)
+        note_contents.discard(note_id)
         db.delete(target_note)
         db.commit()
+        remove_note_files([url])
+        tag_index.remove_note(note_id)
+
+
+def delete_notes(db: Session, notes_id: list[int]) -> list[int]:
+    """delete notes in one transaction, with their tags, links and positions, then their files
+
+    Args:
+        db (Session): database session
+        notes_id (list[int]): target note ids, unknown ones are skipped
+
+    Returns:
+        list[int]: id of the deleted notes
+    """
+    targets = db.execute(select(NoteModel.id, NoteModel.url)
+                         .where(NoteModel.id.in_(set(notes_id)))).all()
+    if not targets:
+        return []
+    ids = [id for id, _ in targets]
+    for id in ids:
+        note_buffer.discard(id)
+        note_contents.discard(id)
+    db.execute(delete(note_tag_association).where(note_tag_association.c.note_id.in_(ids)))
+    db.execute(delete(NoteLinkModel).where(NoteLinkModel.note_id.in_(ids))
+               .execution_options(synchronize_session=False))
+    db.execute(delete(NetPositionModel).where(NetPositionModel.note_id.in_(ids))
+               .execution_options(synchronize_session=False))
+    db.execute(delete(NoteModel).where(NoteModel.id.in_(ids))
+               .execution_options(synchronize_session=False))
+    db.commit()
+    remove_note_files([url for _, url in targets])
+    for id in ids:
+        tag_index.remove_note(id)
+    return ids
 
 
 def update_name(db: Session, note_update: NoteUpdateSchema) -> NoteModel | None:
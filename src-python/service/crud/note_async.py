@@ -0,0 +1,70 @@
+from model.note_group import NoteModel, note_tag_association
+from schemas.tag_base import TagSetSchema
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+
+async def get_notes(db: AsyncSession) -> list[NoteModel]:
+    """get all notes, tags are loaded in one more query
+
+    Args:
+        db (AsyncSession): asyncio database session
+
+    Returns:
+        list[NoteModel]: query result
+    """
+    result = await db.scalars(select(NoteModel).options(selectinload(NoteModel.tags)))
+    return list(result.all())
+
+
+async def get_note(db: AsyncSession, note_id: int) -> NoteModel | None:
+    """get target note, tags are loaded in one more query
+
+    Args:
+        db (AsyncSession): asyncio database session
+        note_id (int): target note id
+
+    Returns:
+        NoteModel | None: query result
+    """
+    return await db.get(NoteModel, note_id, options=[selectinload(NoteModel.tags)])
+
+
+async def get_notes_by_tags(db: AsyncSession, tags_id: TagSetSchema) -> list[NoteModel]:
+    """get target notes by tags, tags are loaded in one more query
+
+    Args:
+        db (AsyncSession): asyncio database session
+        tags_id (TagSetSchema): target tags id set
+
+    Returns:
+        list[NoteModel]: query result
+    """
+    query = select(NoteModel)\
+        .join(note_tag_association,
+              NoteModel.id == note_tag_association.c.note_id)\
+        .where(note_tag_association.c.tag_id.in_(tags_id.tags_id))\
+        .group_by(NoteModel.id)\
+        .having(func.count() == len(tags_id.tags_id))\
+        .options(selectinload(NoteModel.tags))
+    result = await db.scalars(query)
+    return list(result.all())
+
+
+async def get_note_by_name(db: AsyncSession, note_name: str) -> NoteModel | None:
+    """get target note by name, tags are loaded in one more query
+
+    Args:
+        db (AsyncSession): asyncio database session
+        note_name (str): target note name
+
+    Returns:
+        NoteModel | None: query result
+    """
+    result = await db.scalars(select(NoteModel)
+                              .filter(NoteModel.name == note_name)
+                              .options(selectinload(NoteModel.tags))
+                              .limit(1))
+    return result.first()
@@ -1,11 +1,13 @@
-from model.note_group import NoteModel, TagModel
+from model.note_group import NoteModel, TagModel, note_tag_association
 from schemas.tag_base import TagCreateSchema, TagSchema
+from service.tag_index import tag_index
 
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, selectinload
 
 
 def get_tags(db: Session) -> list[TagModel]:
-    """get tags
+    """get tags, notes are loaded in one more query
 
     Args:
         db (Session): database session
@@ -13,11 +15,11 @@ def get_tags(db: Session) -> list[TagModel]:
     Returns:
         list[TagModel]: query result
     """
-    return db.query(TagModel).all()
+    return db.query(TagModel).options(selectinload(TagModel.notes)).all()
 
 
 def get_note_tags(db: Session, note_id: int) -> list[TagModel]:
-    """get target note's tags
+    """get target note's tags, notes of the tags are loaded in one more query
 
     Args:
         db (Session): database session
@@ -26,10 +28,12 @@ def get_note_tags(db: Session, note_id: int) -> list[TagModel]:
     Returns:
         list[TagModel]: query result
     """
-    if db_note := db.get(NoteModel, note_id):
-        return db_note.tags
-    else:
-        return []
+    return db.query(TagModel)\
+        .join(note_tag_association,
+              TagModel.id == note_tag_association.c.tag_id)\
+        .where(note_tag_association.c.note_id == note_id)\
+        .options(selectinload(TagModel.notes))\
+        .all()
 
 
 def create_tag(db: Session, tag: TagCreateSchema) -> TagModel | None:
@@ -45,12 +49,11 @@ def create_tag(db: Session, tag: TagCreateSchema) -> TagModel | None:
 
     if db_note := db.get(NoteModel, tag.note_id):
         db_tag = TagModel(name=tag.name, color=tag.color)
-        db.add(db_tag)
-        db.commit()
-        db.refresh(db_tag)
+        # the tag row and its association row go in one commit
         db_note.tags.append(db_tag)
         db.commit()
         db.refresh(db_tag)
+        tag_index.add_tag(int(db_tag.id), int(db_note.id))
         return db_tag
     return None
 
@@ -68,13 +71,39 @@ def add_tag(db: Session, tag_id: int, note_id: int) -> NoteModel | None:
     """
 
     if (db_note := db.get(NoteModel, note_id)) and (db_tag := db.get(TagModel, tag_id)):
-        db_note.tags.append(db_tag)
-        db.commit()
-        db.refresh(db_note)
+        # (note_id, tag_id) is the primary key, a tag is added once
+        if db_tag not in db_note.tags:
+            db_note.tags.append(db_tag)
+            db.commit()
+            db.refresh(db_note)
+            tag_index.add_tag(tag_id, note_id)
         return db_note
     return None
 
 
+def assign_tags(db: Session, tags_id: list[int], notes_id: list[int]) -> int:
+    """add every tag to every note in one transaction, pairs which exist already are skipped
+
+    Args:
+        db (Session): database session
+        tags_id (list[int]): target tag ids, unknown ones are skipped
+        notes_id (list[int]): target note ids, unknown ones are skipped
+
+    Returns:
+        int: count of added tag note pairs
+    """
+    tags = db.scalars(select(TagModel.id).where(TagModel.id.in_(set(tags_id)))).all()
+    notes = db.scalars(select(NoteModel.id).where(NoteModel.id.in_(set(notes_id)))).all()
+    pairs = [{"note_id": note_id, "tag_id": tag_id} for tag_id in tags for note_id in notes]
+    if not pairs:
+        return 0
+    added = db.execute(insert(note_tag_association).prefix_with("OR IGNORE"), pairs).rowcount
+    db.commit()
+    for pair in pairs:
+        tag_index.add_tag(pair["tag_id"], pair["note_id"])
+    return added
+
+
 def update_tag(db: Session, tag: TagSchema) -> TagModel | None:
     """update tag to database
 
@@ -107,6 +136,7 @@ def delete_tag(db: Session, tag_id: int):
     if target_content := db.get(TagModel, tag_id):
         db.delete(target_content)
         db.commit()
+        tag_index.delete_tag(tag_id)
 
 
 def remove_tag(db: Session, tag_id: int, note_id: int):
@@ -120,6 +150,7 @@ def remove_tag(db: Session, tag_id: int, note_id: int):
     if (db_note := db.get(NoteModel, note_id)) and ((db_tag := db.get(TagModel, tag_id))):
         db_note.tags.remove(db_tag)
         db.commit()
+        tag_index.remove_tag(tag_id, note_id)
     return None
 
 
@@ -134,4 +165,5 @@ def remove_note(db: Session, tag_id: int, note_id: int):
     if (db_note := db.get(NoteModel, note_id)) and ((db_tag := db.get(TagModel, tag_id))):
         db_tag.notes.remove(db_note)
         db.commit()
+        tag_index.remove_tag(tag_id, note_id)
     return None
@@ -0,0 +1,36 @@
+from model.note_group import TagModel, note_tag_association
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+
+async def get_tags(db: AsyncSession) -> list[TagModel]:
+    """get tags, notes are loaded in one more query
+
+    Args:
+        db (AsyncSession): asyncio database session
+
+    Returns:
+        list[TagModel]: query result
+    """
+    result = await db.scalars(select(TagModel).options(selectinload(TagModel.notes)))
+    return list(result.all())
+
+
+async def get_note_tags(db: AsyncSession, note_id: int) -> list[TagModel]:
+    """get target note's tags, notes of the tags are loaded in one more query
+
+    Args:
+        db (AsyncSession): asyncio database session
+        note_id (int): target note id
+
+    Returns:
+        list[TagModel]: query result
+    """
+    result = await db.scalars(select(TagModel)
+                              .join(note_tag_association,
+                                    TagModel.id == note_tag_association.c.tag_id)
+                              .where(note_tag_association.c.note_id == note_id)
+                              .options(selectinload(TagModel.notes)))
+    return list(result.all())
@@ -1,14 +1,126 @@
-from service.config import path_config
+from typing import Any
 
-from sqlalchemy import create_engine
+from service.config import path_config, database_config
+
+from sqlalchemy import create_engine, event, Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{path_config.tag_path}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{path_config.tag_path}"
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def database_pragmas(readers: int = 0) -> list[str]:
+    """pragmas of `database_config` for each new connection
+
+    Args:
+        readers (int, optional): pool size of a read only engine, 0 for the writer engine.
+            Defaults to 0.
+
+    Raises:
+        ValueError: unknown journal mode or synchronous level in the config
+
+    Returns:
+        list[str]: pragma statements
+    """
+    journal_mode = database_config.journal_mode.upper()
+    synchronous = database_config.synchronous.upper()
+    if journal_mode not in JOURNAL_MODES or synchronous not in SYNCHRONOUS:
+        raise ValueError(
+            f"unknown journal_mode `{journal_mode}` or synchronous `{synchronous}`")
+    pragmas = [
+        f"PRAGMA journal_mode = {journal_mode}",
+        f"PRAGMA synchronous = {synchronous}",
+        f"PRAGMA cache_size = {int(database_config.cache_size)}",
+        f"PRAGMA mmap_size = {int(database_config.mmap_size)}",
+        f"PRAGMA busy_timeout = {int(database_config.busy_timeout)}",
+    ]
+    if readers:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
+
+
+def apply_pragmas(engine: Engine, pragmas: list[str]) -> None:
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def create_database_engine(url: str, readers: int = 0) -> Engine:
+    """create an engine with the pragmas of `database_config` applied on each new connection
+
+    Args:
+        url (str): database url
+        readers (int, optional): pool size of a read only engine, 0 for the writer engine which
+            holds a single connection, writers queue for it in turn. Defaults to 0.
+
+    Raises:
+        ValueError: unknown journal mode or synchronous level in the config
+
+    Returns:
+        Engine: database engine
+    """
+    pragmas = database_pragmas(readers)
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False,
+                      "timeout": database_config.busy_timeout / 1000},
+        pool_size=readers or 1,
+        max_overflow=0,
+    )
+    apply_pragmas(engine, pragmas)
+    return engine
+
+
+def create_async_database_engine(url: str, readers: int = 0) -> AsyncEngine:
+    """create an asyncio engine, same pool and pragmas as `create_database_engine`
+
+    The driver runs each connection in its own thread, the event loop awaits
+    the results instead of blocking on the file.
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+    Args:
+        url (str): `sqlite+aiosqlite` database url
+        readers (int, optional): pool size of a read only engine, 0 for the writer engine.
+            Defaults to 0.
+
+    Raises:
+        ValueError: unknown journal mode or synchronous level in the config
+
+    Returns:
+        AsyncEngine: asyncio database engine
+    """
+    pragmas = database_pragmas(readers)
+    engine = create_async_engine(
+        url,
+        connect_args={"timeout": database_config.busy_timeout / 1000},
+        # the dialect defaults to a new connection per checkout
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=readers or 1,
+        max_overflow=0,
+    )
+    apply_pragmas(engine.sync_engine, pragmas)
+    return engine
+
+
+# one writer connection, a pool of read only ones
+engine = create_database_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = create_database_engine(
+    SQLALCHEMY_DATABASE_URL, database_config.readers)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=read_engine)
+# read only pool for the async routes
+async_read_engine = create_async_database_engine(
+    ASYNC_DATABASE_URL, database_config.readers)
+AsyncReadSessionLocal = async_sessionmaker(
+    autoflush=False, bind=async_read_engine)
 
 Base = declarative_base()
 
@@ -20,3 +132,28 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    # Dependency, for routes which only read
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_session_factory() -> sessionmaker:
+    # Dependency, for work which outlives the request and opens its own sessions
+    return SessionLocal
+
+
+def get_read_session_factory() -> sessionmaker:
+    # Dependency, read only sessions of `get_session_factory`
+    return ReadSessionLocal
+
+
+async def get_async_read_db():
+    # Dependency, for async routes which only read
+    async with AsyncReadSessionLocal() as db:
+        yield db
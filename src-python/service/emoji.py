@@ -1,4 +1,9 @@
-from sqlite3 import connect
+from sqlite3 import connect, Error as SqliteError
+from os import path
+from bisect import bisect_left
+from functools import lru_cache
+from threading import Lock
+from typing import Optional
 
 from schemas.emoji import EmojiSchema
 from service.config import path_config
@@ -6,29 +11,118 @@ from service.config import path_config
 
 class EmojiGetter:
     """A emoji unicode getter
+
+    The emoji table is loaded once into memory. Hits are ranked name prefix
+    first (the exact name is the shortest), then word prefix, both found by
+    bisection of sorted lowercase names and word suffixes, then substring.
+    For substrings, names are cut into 1, 2 and 3 character grams, each gram
+    maps to the sorted positions of the emojis containing it, a query
+    intersects the postings of its grams and checks the remaining names.
+    Recent queries are kept in a LRU cache.
     """
 
+    # default max result count of a query
+    LIMIT = 50
+    CACHE = 1024
+    GRAM = 3
+
     def __init__(self, db_path: str) -> None:
         self.db_path = db_path
+        self._lock = Lock()
+        self._emojis: Optional[list[EmojiSchema]] = None
+        self._names: list[str] = []
+        # sorted (lowercase name or its suffix from a word start, position)
+        self._prefixes: list[tuple[str, int]] = []
+        self._words: list[tuple[str, int]] = []
+        self._postings: dict[str, list[int]] = {}
+        self._search = lru_cache(maxsize=self.CACHE)(self._rank)
+
+    def load(self) -> bool:
+        """load the emoji table and build the index, once
 
-    def search(self, emoji: str) -> list[EmojiSchema] | None:
+        Returns:
+            bool: False if the emoji database can't be read
         """
-        Search emoji from database.
+        if self._emojis is not None:
+            return True
+        with self._lock:
+            if self._emojis is not None:
+                return True
+            if not path.isfile(self.db_path):
+                return False
+            try:
+                conn = connect(f"file:{self.db_path}?mode=ro", uri=True)
+                try:
+                    rows = conn.execute(
+                        'SELECT unicode, name FROM emoji ORDER BY "#"').fetchall()
+                finally:
+                    conn.close()
+            except SqliteError:
+                return False
+            names = [name.lower() for _, name in rows]
+            postings: dict[str, list[int]] = {}
+            for i, name in enumerate(names):
+                grams = {name[j:j + n] for n in range(1, self.GRAM + 1)
+                         for j in range(len(name) - n + 1)}
+                for gram in grams:
+                    postings.setdefault(gram, []).append(i)
+            self._prefixes = sorted((name, i) for i, name in enumerate(names))
+            self._words = sorted((name[j + 1:], i) for i, name in enumerate(names)
+                                 for j, c in enumerate(name) if c == " ")
+            self._names, self._postings = names, postings
+            self._emojis = [EmojiSchema(unicode=unicode, name=name)
+                            for unicode, name in rows]
+            return True
+
+    def search(self, emoji: str, limit: int = LIMIT) -> list[EmojiSchema] | None:
         """
-        conn = connect(self.db_path)
-        cursor = conn.cursor()
+        Search emoji by name, case insensitive.
+
+        Args:
+            emoji (str): part of the name
+            limit (int, optional): max result count. Defaults to LIMIT.
 
-        cursor.execute(
-            "SELECT unicode, name FROM emoji WHERE name LIKE ?", ('%' + emoji + '%',))
-        result = cursor.fetchall()
+        Returns:
+            list[EmojiSchema] | None: ranked emojis, None if the emoji database can't be read
+        """
+        if not self.load():
+            return None
+        return list(self._search(emoji.lower(), limit))
+
+    def _rank(self, query: str, limit: int) -> tuple[EmojiSchema, ...]:
+        assert self._emojis is not None
+        hits: dict[int, None] = {}
+        for sorted_names in (self._prefixes, self._words):
+            k = bisect_left(sorted_names, (query,))
+            while len(hits) < limit and k < len(sorted_names) and sorted_names[k][0].startswith(query):
+                hits.setdefault(sorted_names[k][1])
+                k += 1
+        if len(hits) < limit:
+            for i in self._candidates(query) if query else range(len(self._names)):
+                if i not in hits and query in self._names[i]:
+                    hits[i] = None
+                    if len(hits) >= limit:
+                        break
+        return tuple(self._emojis[i] for i in hits)
+
+    def _candidates(self, query: str) -> list[int]:
+        """positions of the names containing every gram of the query, shortest postings first
+        """
+        if len(query) <= self.GRAM:
+            return self._postings.get(query, [])
+        lists = sorted((self._postings.get(query[j:j + self.GRAM], [])
+                        for j in range(len(query) - self.GRAM + 1)), key=len)
+        result = lists[0]
+        for other in lists[1:]:
+            if not result:
+                break
+            result = [i for i in result if contains(other, i)]
+        return result
 
-        conn.close()
-        if not result:
-            return []
 
-        emoji_list = [EmojiSchema(unicode=row[0], name=row[1])
-                      for row in result]
-        return emoji_list
+def contains(sorted_list: list[int], value: int) -> bool:
+    i = bisect_left(sorted_list, value)
+    return i < len(sorted_list) and sorted_list[i] == value
 
 
 emoji_getter = EmojiGetter(path_config.emoji_path)
@@ -0,0 +1,266 @@
+import signal
+from os import cpu_count
+from re import compile as re_compile, error as re_error, IGNORECASE, MULTILINE, Pattern
+from json import dumps
+from mmap import mmap, ACCESS_READ
+from time import time
+from functools import lru_cache
+from contextlib import contextmanager
+from multiprocessing import get_all_start_methods, get_context
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from threading import Lock, current_thread, main_thread
+from typing import Any, Iterator, Optional
+
+from service.config import grep_config
+
+# (note id, note name, note file path)
+NoteFile = tuple[int, str, str]
+
+
+@lru_cache(maxsize=16)
+def compile_pattern(pattern: str, ignore_case: bool) -> Pattern[bytes]:
+    """compile a pattern for the raw bytes of note files, `^` and `$` match at every line
+
+    Args:
+        pattern (str): regular expression
+        ignore_case (bool): case insensitive match
+
+    Returns:
+        Pattern[bytes]: compiled pattern
+    """
+    return re_compile(pattern.encode('utf-8'), MULTILINE | (IGNORECASE if ignore_case else 0))
+
+
+def grep_buffer(regex: Pattern[bytes], data: Any, note_id: int, name: str, limit: int) -> list[dict[str, Any]]:
+    """find the matches in the content of one note
+
+    Args:
+        regex (Pattern[bytes]): compiled pattern
+        data (Any): note content, bytes or a memory map of the file
+        note_id (int): note id
+        name (str): note name
+        limit (int): max match count
+
+    Returns:
+        list[dict[str, Any]]: matches, 1-based line and 0-based character column
+    """
+    matches: list[dict[str, Any]] = []
+    if limit <= 0:
+        return matches
+    line, counted = 1, 0
+    line_begin, column_pos, column = -1, 0, 0
+    for m in regex.finditer(data):
+        start, end = m.span()
+        line += data[counted:start].count(b"\n")
+        counted = start
+        begin = data.rfind(b"\n", 0, start) + 1
+        if begin != line_begin:
+            line_begin, column_pos, column = begin, begin, 0
+        # count from the previous match on the same line, a long line is decoded once
+        column += len(data[column_pos:start].decode('utf-8', 'replace'))
+        column_pos = start
+        line_end = data.find(b"\n", start)
+        if line_end < 0:
+            line_end = len(data)
+        matches.append({
+            "id": note_id,
+            "name": name,
+            "line": line,
+            "column": column,
+            "match": data[start:min(end, start + NoteGrep.TEXT_BYTES)].decode('utf-8', 'replace'),
+            "text": data[max(begin, start - NoteGrep.TEXT_BYTES // 2):
+                         min(line_end, start + NoteGrep.TEXT_BYTES // 2)].decode('utf-8', 'replace'),
+        })
+        if len(matches) >= limit:
+            break
+    return matches
+
+
+class Expired(Exception):
+    """the deadline of a scan passed inside a file
+    """
+
+
+@contextmanager
+def alarm(deadline: float) -> Iterator[None]:
+    """raise `Expired` in the block once `deadline` passes
+
+    The regular expression engine checks for signals while it runs, so a
+    pattern which backtracks for ages on one file stops too. Only armed in
+    the main thread of a process with `SIGALRM`, which the pool workers
+    are on POSIX, elsewhere the block runs to its end.
+
+    Args:
+        deadline (float): `time()` to stop at
+    """
+    if not hasattr(signal, "setitimer") or current_thread() is not main_thread():
+        yield
+        return
+
+    def expire(_signum: int, _frame: Any) -> None:
+        raise Expired()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, max(deadline - time(), 1e-3))
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def grep_files(pattern: str, ignore_case: bool, files: list[NoteFile],
+               limit: int, deadline: float) -> tuple[list[dict[str, Any]], int]:
+    """scan note files, runs in a worker process
+
+    Files are memory mapped, the pattern runs over the page cache without
+    reading the files into the worker.
+
+    Args:
+        pattern (str): regular expression
+        ignore_case (bool): case insensitive match
+        files (list[NoteFile]): notes to scan
+        limit (int): max match count
+        deadline (float): `time()` to stop at, checked between files and, see `alarm`,
+            inside a file in the pool workers
+
+    Returns:
+        tuple[list[dict[str, Any]], int]: matches and scanned bytes, up to the deadline
+    """
+    regex = compile_pattern(pattern, ignore_case)
+    matches: list[dict[str, Any]] = []
+    scanned = 0
+    try:
+        with alarm(deadline):
+            for note_id, name, url in files:
+                if len(matches) >= limit or time() > deadline:
+                    break
+                try:
+                    with open(url, 'rb') as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+                        found = grep_buffer(regex, data, note_id, name, limit - len(matches))
+                        scanned += len(data)
+                    matches += found
+                except (OSError, ValueError):
+                    # missing file, or an empty one which can't be mapped
+                    continue
+    except Expired:
+        pass
+    return matches, scanned
+
+
+class NoteGrep:
+    """regular expression search over all note files in a process pool
+
+    Notes are scanned in the pool in chunks which grow from a few files to
+    a few hundred, the first chunks are small so the first matches come
+    early. Matches are streamed as NDJSON in the order the chunks finish.
+
+    The workers are forked from a fork server, or spawned where there is
+    none, never from the server process with its threads and locks. On
+    POSIX a worker stops at the deadline even inside a file, a pattern
+    which backtracks for ages doesn't keep it busy. The workers on Windows
+    only check the deadline between files.
+    """
+
+    FIRST_CHUNK = 16
+    MAX_CHUNK = 256
+    # bytes of context around a match in `text`, and max bytes of `match`
+    TEXT_BYTES = 256
+
+    def __init__(self, workers: int, timeout: float, max_matches: int) -> None:
+        self.workers = workers or cpu_count() or 1
+        self.timeout = timeout
+        self.max_matches = max_matches
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        """worker processes, started on first use
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                method = "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context(method))
+            return self._pool
+
+    @staticmethod
+    def check(pattern: str, ignore_case: bool) -> Optional[str]:
+        """check a pattern before the response starts
+
+        Args:
+            pattern (str): regular expression
+            ignore_case (bool): case insensitive match
+
+        Returns:
+            Optional[str]: error message, None for a valid pattern
+        """
+        try:
+            compile_pattern(pattern, ignore_case)
+        except re_error as e:
+            return str(e)
+        return None
+
+    def chunks(self, notes: list[NoteFile]) -> list[list[NoteFile]]:
+        """split notes into chunks of doubling size
+        """
+        chunks, start, size = [], 0, self.FIRST_CHUNK
+        while start < len(notes):
+            chunks.append(notes[start:start + size])
+            start += size
+            size = min(size * 2, self.MAX_CHUNK)
+        return chunks
+
+    def grep(self, notes: list[NoteFile], pattern: str, ignore_case: bool) -> Iterator[bytes]:
+        """scan note files and yield NDJSON lines as matches are found
+
+        Every line but the last is a match:
+        `{"id", "name", "line", "column", "match", "text"}`, the last line is
+        the summary: `{"matches", "bytes", "truncated", "timeout"}`.
+
+        Args:
+            notes (list[NoteFile]): notes to scan
+            pattern (str): regular expression, checked by `check`
+            ignore_case (bool): case insensitive match
+
+        Yields:
+            Iterator[bytes]: NDJSON lines
+        """
+        deadline = time() + self.timeout
+        chunks = self.chunks(notes)
+        pending: set[Future] = set()
+        found = scanned = 0
+        try:
+            # never scanned in the calling thread, where a file can't be stopped at the deadline
+            pending = {self.pool.submit(grep_files, pattern, ignore_case, chunk, self.max_matches, deadline)
+                       for chunk in chunks}
+            while pending and found < self.max_matches:
+                done, pending = wait(pending, timeout=max(deadline - time(), 0),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for matches, size in (f.result() for f in done):
+                    scanned += size
+                    for match in matches[:self.max_matches - found]:
+                        yield dumps(match, ensure_ascii=False).encode('utf-8') + b"\n"
+                        found += 1
+        finally:
+            for f in pending:
+                f.cancel()
+        truncated = found >= self.max_matches
+        yield dumps({
+            "matches": found,
+            "bytes": scanned,
+            "truncated": truncated,
+            "timeout": not truncated and (bool(pending) or time() > deadline),
+        }).encode('utf-8') + b"\n"
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+
+note_grep = NoteGrep(grep_config.workers,
+                     grep_config.timeout, grep_config.max_matches)
@@ -0,0 +1,89 @@
+from typing import Callable
+
+from model.note_group import NoteModel, note_tag_association
+from service.logger import logger
+
+from sqlalchemy import Engine, text
+from sqlalchemy.engine import Connection
+
+
+def upgrade_note_tag_association(conn: Connection) -> None:
+    """rebuild `note_tag_association` with the (note_id, tag_id) primary key and the (tag_id, note_id)
+    index, index `notes.name`
+
+    SQLite can't add a primary key to an existing table, the rows are copied
+    into a new one, duplicate and incomplete rows are dropped. A table made
+    by `create_all` already has both.
+
+    Args:
+        conn (Connection): connection in the migration transaction
+    """
+    keys = [row.name for row in conn.execute(text("PRAGMA table_info(note_tag_association)")) if row.pk]
+    if len(keys) < 2:
+        conn.execute(text(
+            "ALTER TABLE note_tag_association RENAME TO note_tag_association_old"))
+        note_tag_association.create(conn)
+        conn.execute(text(
+            "INSERT OR IGNORE INTO note_tag_association (note_id, tag_id) "
+            "SELECT note_id, tag_id FROM note_tag_association_old "
+            "WHERE note_id IS NOT NULL AND tag_id IS NOT NULL"))
+        conn.execute(text("DROP TABLE note_tag_association_old"))
+    for index in NoteModel.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def add_note_content_hash(conn: Connection) -> None:
+    """add `notes.content_hash`, None for the existing notes until their next save
+
+    Args:
+        conn (Connection): connection in the migration transaction
+    """
+    columns = [row.name for row in conn.execute(text("PRAGMA table_info(notes)"))]
+    if "content_hash" not in columns:
+        conn.execute(text("ALTER TABLE notes ADD COLUMN content_hash VARCHAR"))
+
+
+def add_note_links_hash(conn: Connection) -> None:
+    """add `notes.links_hash`, the notes which have link records are marked as extracted at their
+    current hash, the others are extracted on the next start
+
+    Args:
+        conn (Connection): connection in the migration transaction
+    """
+    columns = [row.name for row in conn.execute(text("PRAGMA table_info(notes)"))]
+    if "links_hash" not in columns:
+        conn.execute(text("ALTER TABLE notes ADD COLUMN links_hash VARCHAR"))
+    conn.execute(text(
+        "UPDATE notes SET links_hash = coalesce(content_hash, '') "
+        "WHERE links_hash IS NULL AND id IN (SELECT note_id FROM note_links)"))
+
+
+# schema upgrades in order, the database file is at version len(MIGRATIONS) after `migrate`
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    upgrade_note_tag_association,
+    add_note_content_hash,
+    add_note_links_hash,
+]
+
+
+def migrate(engine: Engine) -> int:
+    """upgrade an existing database file, run after `create_all`
+
+    The schema version is kept in `PRAGMA user_version`, 0 for the files
+    made before migrations. Each pending migration runs in one transaction
+    with the new version, a failed one leaves the file at the version before.
+
+    Args:
+        engine (Engine): database engine
+
+    Returns:
+        int: schema version
+    """
+    with engine.connect() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar_one()
+    for target, upgrade in enumerate(MIGRATIONS[version:], version + 1):
+        logger.info(f"migrate database to version {target}: {upgrade.__name__}")
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(text(f"PRAGMA user_version = {target}"))
+    return max(version, len(MIGRATIONS))
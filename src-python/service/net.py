@@ -1,8 +1,23 @@
 import ctypes
 from sys import platform
+from json import dumps
+from array import array
+from itertools import accumulate
+from time import time_ns
+from threading import Lock
+from collections import Counter, deque
+from heapq import heappop, heappush, nlargest
+from contextlib import contextmanager
+from asyncio import AbstractEventLoop, Event, Future, ensure_future, get_running_loop, shield, to_thread
+from typing import Any, Callable, Iterator, Optional
 
+from model.note_group import NoteModel, NoteLinkModel, NetPositionModel
 from schemas.note import NoteSchema
 from schemas.net import NetSchema, NetNodeSchema, NetLinkSchema, Vector
+from service.config import net_config
+
+from sqlalchemy import insert, update, func
+from sqlalchemy.orm import Session
 
 if platform.startswith('linux'):
     lib_name = 'libmd_net.so'
@@ -44,13 +59,72 @@ class CNetSchema(ctypes.Structure):
                 ("l_len", ctypes.c_uint)]
 
 
+class CNoteColumns(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_uint32),
+                ("ids", ctypes.POINTER(ctypes.c_uint32)),
+                ("names", ctypes.c_char_p),
+                ("name_offsets", ctypes.POINTER(ctypes.c_uint32)),
+                ("urls", ctypes.c_char_p),
+                ("url_offsets", ctypes.POINTER(ctypes.c_uint32))]
+
+
+class CNetColumns(ctypes.Structure):
+    _fields_ = [("n_len", ctypes.c_uint32),
+                ("ids", ctypes.POINTER(ctypes.c_uint32)),
+                ("is_md", ctypes.POINTER(ctypes.c_uint8)),
+                ("pos_x", ctypes.POINTER(ctypes.c_uint32)),
+                ("pos_y", ctypes.POINTER(ctypes.c_uint32)),
+                ("data", ctypes.POINTER(ctypes.c_uint8)),
+                ("data_offsets", ctypes.POINTER(ctypes.c_uint32)),
+                ("l_len", ctypes.c_uint32),
+                ("sources", ctypes.POINTER(ctypes.c_uint32)),
+                ("targets", ctypes.POINTER(ctypes.c_uint32))]
+
+
+class CNetRefColumns(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_uint32),
+                ("note_ids", ctypes.POINTER(ctypes.c_uint32)),
+                ("is_md", ctypes.POINTER(ctypes.c_uint8)),
+                ("data", ctypes.POINTER(ctypes.c_uint8)),
+                ("data_offsets", ctypes.POINTER(ctypes.c_uint32))]
+
+
+class CLayoutParams(ctypes.Structure):
+    _fields_ = [("iterations", ctypes.c_uint32),
+                ("temperature", ctypes.c_float),
+                ("theta", ctypes.c_float),
+                ("length", ctypes.c_float),
+                ("gravity", ctypes.c_float)]
+
+
+class CNetAnalytics(ctypes.Structure):
+    _fields_ = [("n_len", ctypes.c_uint32),
+                ("rank", ctypes.POINTER(ctypes.c_double)),
+                ("component", ctypes.POINTER(ctypes.c_uint32)),
+                ("in_degree", ctypes.POINTER(ctypes.c_uint32)),
+                ("out_degree", ctypes.POINTER(ctypes.c_uint32)),
+                ("iterations", ctypes.c_uint32)]
+
+
+class CTrigramPostings(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_uint32),
+                ("keys", ctypes.POINTER(ctypes.c_uint32)),
+                ("offsets", ctypes.POINTER(ctypes.c_uint64)),
+                ("data", ctypes.POINTER(ctypes.c_uint8))]
+
+
 class CNetGenerator(ctypes.Structure):
     _fields_ = [("gen", ctypes.c_void_p)]
 
 
 init_net_generator = lib.init_net_generator
+init_net_generator.argtypes = [ctypes.c_uint32]
 init_net_generator.restype = ctypes.POINTER(CNetGenerator)
 
+get_workers = lib.get_workers
+get_workers.argtypes = [ctypes.POINTER(CNetGenerator)]
+get_workers.restype = ctypes.c_uint32
+
 generate = lib.generate
 generate.argtypes = [ctypes.POINTER(
     CNetGenerator), ctypes.POINTER(CNoteSchemaVec)]
@@ -59,10 +133,373 @@ generate.restype = ctypes.POINTER(CNetSchema)
 free_net_schema = lib.free_net_schema
 free_net_schema.argtypes = [ctypes.POINTER(CNetSchema)]
 
+generate_columns = lib.generate_columns
+generate_columns.argtypes = [ctypes.POINTER(
+    CNetGenerator), ctypes.POINTER(CNoteColumns)]
+generate_columns.restype = ctypes.POINTER(CNetColumns)
+
+free_net_columns = lib.free_net_columns
+free_net_columns.argtypes = [ctypes.POINTER(CNetColumns)]
+
+extract_ref_columns = lib.extract_ref_columns
+extract_ref_columns.argtypes = [ctypes.POINTER(
+    CNetGenerator), ctypes.POINTER(CNoteColumns)]
+extract_ref_columns.restype = ctypes.POINTER(CNetRefColumns)
+
+free_net_ref_columns = lib.free_net_ref_columns
+free_net_ref_columns.argtypes = [ctypes.POINTER(CNetRefColumns)]
+
+layout_columns = lib.layout_columns
+layout_columns.argtypes = [ctypes.POINTER(CNetGenerator), ctypes.c_uint32,
+                           ctypes.POINTER(ctypes.c_float), ctypes.POINTER(
+                               ctypes.c_float), ctypes.POINTER(ctypes.c_uint8),
+                           ctypes.c_uint32, ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(
+                               ctypes.c_uint32),
+                           ctypes.POINTER(CLayoutParams)]
+layout_columns.restype = None
+
+analyze_columns = lib.analyze_columns
+analyze_columns.argtypes = [ctypes.POINTER(CNetGenerator), ctypes.c_uint32, ctypes.c_uint32,
+                            ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(
+                                ctypes.c_uint32),
+                            ctypes.c_double, ctypes.c_double, ctypes.c_uint32]
+analyze_columns.restype = ctypes.POINTER(CNetAnalytics)
+
+free_net_analytics = lib.free_net_analytics
+free_net_analytics.argtypes = [ctypes.POINTER(CNetAnalytics)]
+
+build_trigram_columns = lib.build_trigram_columns
+build_trigram_columns.argtypes = [ctypes.POINTER(
+    CNetGenerator), ctypes.POINTER(CNoteColumns)]
+build_trigram_columns.restype = ctypes.POINTER(CTrigramPostings)
+
+free_trigram_postings = lib.free_trigram_postings
+free_trigram_postings.argtypes = [ctypes.POINTER(CTrigramPostings)]
+
+extract_trigrams = lib.extract_trigrams
+extract_trigrams.argtypes = [ctypes.c_char_p, ctypes.c_size_t,
+                             ctypes.POINTER(ctypes.c_uint32)]
+extract_trigrams.restype = ctypes.POINTER(ctypes.c_uint32)
+
+free_trigrams = lib.free_trigrams
+free_trigrams.argtypes = [ctypes.POINTER(ctypes.c_uint32), ctypes.c_uint32]
+
+
+class NetColumns:
+    """relationship net in columnar layout
+
+    Node `i` is `ids[i]`, `data[i]`, `is_md[i]` at `(pos_x[i], pos_y[i])`,
+    link `j` goes from node `sources[j]` to node `targets[j]`.
+    """
+
+    def __init__(self, ids: list[int], data: list[str], is_md: list[bool],
+                 pos_x: list[int], pos_y: list[int],
+                 sources: list[int], targets: list[int], version: int = 0) -> None:
+        self.ids = ids
+        self.data = data
+        self.is_md = is_md
+        self.pos_x = pos_x
+        self.pos_y = pos_y
+        self.sources = sources
+        self.targets = targets
+        self.version = version
+
+    def to_json(self) -> bytes:
+        """serialize to the JSON layout of `NetSchema` without building pydantic models
+
+        Returns:
+            bytes: UTF-8 JSON
+        """
+        nodes = [{"id": id, "data": data, "is_md": is_md, "pos": {"x": x, "y": y}}
+                 for id, data, is_md, x, y
+                 in zip(self.ids, self.data, self.is_md, self.pos_x, self.pos_y)]
+        links = [{"source": source, "target": target}
+                 for source, target in zip(self.sources, self.targets)]
+        return dumps({"nodes": nodes, "links": links, "version": self.version},
+                     ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+    def to_schema(self) -> NetSchema:
+        nodes = [NetNodeSchema(id=id, data=data, is_md=is_md, pos=Vector(x=x, y=y))
+                 for id, data, is_md, x, y
+                 in zip(self.ids, self.data, self.is_md, self.pos_x, self.pos_y)]
+        links = [NetLinkSchema(source=source, target=target)
+                 for source, target in zip(self.sources, self.targets)]
+        return NetSchema(nodes=nodes, links=links, version=self.version)
+
+
+class NetRefColumns:
+    """links of notes in columnar layout, link `i` belongs to note `note_ids[i]`,
+    `data[i]` is the target note name or the resource name
+    """
+
+    def __init__(self, note_ids: list[int], data: list[str], is_md: list[bool]) -> None:
+        self.note_ids = note_ids
+        self.data = data
+        self.is_md = is_md
+
+    def to_rows(self) -> list[dict[str, Any]]:
+        return [{"note_id": note_id, "data": data, "is_md": is_md}
+                for note_id, data, is_md in zip(self.note_ids, self.data, self.is_md)]
+
+
+# node key, (True, note id) for a note, (False, name) for a resource
+NodeKey = tuple[bool, int | str]
+LinkKey = tuple[NodeKey, NodeKey]
+
+
+def link_key(a: NodeKey, b: NodeKey) -> LinkKey:
+    return (a, b) if a <= b else (b, a)
+
+
+class NetDelta:
+    """changes of the net from version `since` to version `version`
+
+    Nodes and links are identified by `NodeKey` instead of the node index,
+    which changes between snapshots. `nodes` holds the added or renamed
+    nodes, links are undirected and stored with the smaller key first.
+    """
+
+    def __init__(self, since: int, version: int, full: bool = False) -> None:
+        self.since = since
+        self.version = version
+        self.full = full
+        self.nodes: dict[NodeKey, str] = {}
+        self.links: set[LinkKey] = set()
+        self.removed_nodes: dict[NodeKey, str] = {}
+        self.removed_links: set[LinkKey] = set()
+
+    @classmethod
+    def from_net(cls, net: NetColumns, since: int) -> "NetDelta":
+        """the whole net as a delta that replaces the net of the client
+
+        Args:
+            net (NetColumns): net snapshot
+            since (int): version the client asked from
+
+        Returns:
+            NetDelta: full delta
+        """
+        delta = cls(since, net.version, full=True)
+        keys: list[NodeKey] = []
+        for id, data, is_md in zip(net.ids, net.data, net.is_md):
+            if is_md:
+                keys.append((True, id))
+            else:
+                keys.append((False, data))
+        delta.nodes = dict(zip(keys, net.data))
+        delta.links = {link_key(keys[source], keys[target])
+                       for source, target in zip(net.sources, net.targets)}
+        return delta
+
+    def is_empty(self) -> bool:
+        return not (self.nodes or self.links or self.removed_nodes or self.removed_links)
+
+    def merge(self, other: "NetDelta") -> None:
+        """apply a later delta on top of this one
+
+        Args:
+            other (NetDelta): delta which starts where this one ends
+        """
+        for key, data in other.removed_nodes.items():
+            self.nodes.pop(key, None)
+            self.removed_nodes[key] = data
+        for key, data in other.nodes.items():
+            self.removed_nodes.pop(key, None)
+            self.nodes[key] = data
+        self.links -= other.removed_links
+        self.removed_links |= other.removed_links
+        self.removed_links -= other.links
+        self.links |= other.links
+        self.version = other.version
+
+    def to_json(self) -> bytes:
+        """serialize to the JSON layout of `NetDeltaSchema`
+
+        Returns:
+            bytes: UTF-8 JSON
+        """
+        def node(key: NodeKey, data: str) -> dict[str, Any]:
+            return {"id": key[1] if key[0] else 0, "data": data, "is_md": key[0], "pos": {"x": 0, "y": 0}}
+
+        def link(key: LinkKey) -> dict[str, Any]:
+            # a resource key sorts first, the note linking to it is the source
+            a, b = key
+            return {"source": a[1], "target": b[1]} if a[0] else {"source": b[1], "target": a[1]}
+
+        return dumps({"since": self.since, "version": self.version, "full": self.full,
+                      "nodes": [node(key, data) for key, data in self.nodes.items()],
+                      "links": [link(key) for key in self.links],
+                      "removed_nodes": [node(key, data) for key, data in self.removed_nodes.items()],
+                      "removed_links": [link(key) for key in self.removed_links]},
+                     ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+class NetAnalytics:
+    """PageRank, weakly connected component, in and out degree of each node of a net
+    """
+
+    def __init__(self, net: NetColumns, rank: list[float], component: list[int],
+                 in_degree: list[int], out_degree: list[int], iterations: int) -> None:
+        self.net = net
+        self.rank = rank
+        self.component = component
+        self.in_degree = in_degree
+        self.out_degree = out_degree
+        self.iterations = iterations
+
+    def to_json(self, top: int) -> bytes:
+        """serialize to the JSON layout of `NetAnalyticsSchema`
+
+        Args:
+            top (int): length of each ranking
+
+        Returns:
+            bytes: UTF-8 JSON
+        """
+        net = self.net
+
+        def node(i: int) -> dict[str, Any]:
+            return {"id": net.ids[i], "data": net.data[i], "is_md": net.is_md[i]}
+
+        def ranking(values: list) -> list[dict[str, Any]]:
+            return [node(i) | {"value": values[i]}
+                    for i in nlargest(top, range(len(values)), key=values.__getitem__)]
+
+        sizes = Counter(self.component)
+        return dumps({"version": net.version,
+                      "iterations": self.iterations,
+                      "pagerank": ranking(self.rank),
+                      "in_degree": ranking(self.in_degree),
+                      "out_degree": ranking(self.out_degree),
+                      "components": len(sizes),
+                      "component_sizes": [size for _, size in sizes.most_common(top)],
+                      "orphans": [node(i) for i, (is_md, d_in, d_out)
+                                  in enumerate(zip(net.is_md, self.in_degree, self.out_degree))
+                                  if is_md and d_in == d_out == 0]},
+                     ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+class NetPaths:
+    """adjacency index of a net for path queries, node `i` of the net is vertex `i`
+    """
+
+    def __init__(self, net: NetColumns) -> None:
+        self.net = net
+        self.note_index = {id: i for i, (id, is_md)
+                           in enumerate(zip(net.ids, net.is_md)) if is_md}
+        self.outgoing: list[list[int]] = [[] for _ in net.ids]
+        self.incoming: list[list[int]] = [[] for _ in net.ids]
+        for source, target in zip(net.sources, net.targets):
+            self.outgoing[source].append(target)
+            self.incoming[target].append(source)
+        self.both = [sorted(set(o) | set(i))
+                     for o, i in zip(self.outgoing, self.incoming)]
+
+    def shortest(self, source: int, target: int, directed: bool,
+                 banned_nodes: frozenset[int] | set[int] = frozenset(),
+                 banned_edges: frozenset[tuple[int, int]] | set[tuple[int, int]] = frozenset()) -> Optional[list[int]]:
+        """bidirectional BFS, expands the smaller frontier each round
+
+        Args:
+            source (int): start vertex
+            target (int): end vertex
+            directed (bool): only follow links from the linking note
+            banned_nodes (set[int], optional): vertices the path may not visit
+            banned_edges (set[tuple[int, int]], optional): edges the path may not use
+
+        Returns:
+            Optional[list[int]]: vertices of a shortest path, None if there is none
+        """
+        if source == target:
+            return [source]
+        forward_adj, backward_adj = (self.outgoing, self.incoming) if directed \
+            else (self.both, self.both)
+        forward: dict[int, int] = {source: -1}
+        backward: dict[int, int] = {target: -1}
+        forward_frontier, backward_frontier = [source], [target]
+        while forward_frontier and backward_frontier:
+            is_forward = len(forward_frontier) <= len(backward_frontier)
+            frontier, adj, parents, others = (forward_frontier, forward_adj, forward, backward) if is_forward \
+                else (backward_frontier, backward_adj, backward, forward)
+            next_frontier = []
+            meet = None
+            for u in frontier:
+                for v in adj[u]:
+                    edge = (u, v) if is_forward else (v, u)
+                    if v in parents or v in banned_nodes or edge in banned_edges \
+                            or not directed and edge[::-1] in banned_edges:
+                        continue
+                    parents[v] = u
+                    next_frontier.append(v)
+                    if v in others and meet is None:
+                        meet = v
+                if meet is not None:
+                    break
+            if meet is not None:
+                path = [meet]
+                while (u := forward[path[-1]]) != -1:
+                    path.append(u)
+                path.reverse()
+                v = meet
+                while (v := backward[v]) != -1:
+                    path.append(v)
+                return path
+            if is_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+        return None
+
+    def k_shortest(self, source: int, target: int, k: int, directed: bool) -> list[list[int]]:
+        """k shortest simple paths by Yen's algorithm over the BFS above
+
+        Args:
+            source (int): start vertex
+            target (int): end vertex
+            k (int): max path count
+            directed (bool): only follow links from the linking note
+
+        Returns:
+            list[list[int]]: paths, shortest first
+        """
+        if (first := self.shortest(source, target, directed)) is None:
+            return []
+        paths = [first]
+        candidates: list[tuple[int, list[int]]] = []
+        seen = {tuple(first)}
+        while len(paths) < k:
+            last = paths[-1]
+            for i in range(len(last) - 1):
+                root = last[:i + 1]
+                banned_edges = {(p[i], p[i + 1]) for p in paths
+                                if len(p) > i + 1 and p[:i + 1] == root}
+                spur = self.shortest(last[i], target, directed,
+                                     set(root[:-1]), banned_edges)
+                if spur is not None and tuple(path := root[:-1] + spur) not in seen:
+                    seen.add(tuple(path))
+                    heappush(candidates, (len(path), path))
+            if not candidates:
+                break
+            paths.append(heappop(candidates)[1])
+        return paths
+
+    def to_json(self, paths: list[list[int]]) -> bytes:
+        """serialize to the JSON layout of `NetPathSchema`
+        """
+        net = self.net
+        return dumps({"version": net.version,
+                      "paths": [[{"id": net.ids[i], "data": net.data[i], "is_md": net.is_md[i]}
+                                 for i in path] for path in paths]},
+                     ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
 
 class NetGenerator:
-    def __init__(self):
-        self.generator = init_net_generator()
+    def __init__(self, workers: int):
+        self.generator = init_net_generator(workers)
+
+    @property
+    def workers(self) -> int:
+        return get_workers(self.generator)
 
     def generate(self, notes: list[NoteSchema]) -> NetSchema:
         cnotes = copy_notes(notes)
@@ -71,10 +508,615 @@ class NetGenerator:
         free_net_schema(cnet)
         return net
 
+    def generate_columns(self, notes: list[NoteSchema]) -> NetColumns:
+        """generate relationship net through the columnar FFI
+
+        Args:
+            notes (list[NoteSchema]): all notes
+
+        Returns:
+            NetColumns: net
+        """
+        cnotes = copy_note_columns(notes)
+        cnet = generate_columns(self.generator, ctypes.byref(cnotes))
+        net = parse_cnet_columns(cnet.contents)
+        free_net_columns(cnet)
+        return net
+
+    def extract(self, notes: list[NoteSchema]) -> NetRefColumns:
+        """extract the links of each note file, without resolving targets
+
+        Args:
+            notes (list[NoteSchema]): target notes
+
+        Returns:
+            NetRefColumns: links
+        """
+        cnotes = copy_note_columns(notes)
+        crefs = extract_ref_columns(self.generator, ctypes.byref(cnotes))
+        refs = parse_cref_columns(crefs.contents)
+        free_net_ref_columns(crefs)
+        return refs
+
+    def layout(self, pos_x: array, pos_y: array, known: array,
+               sources: list[int], targets: list[int], params: CLayoutParams) -> None:
+        """run the force-directed layout in place on the extraction thread pool
+
+        Args:
+            pos_x (array): x of each node, `array('f')`
+            pos_y (array): y of each node, `array('f')`
+            known (array): 0 for a node without position yet, `array('B')`
+            sources (list[int]): link sources
+            targets (list[int]): link targets
+            params (CLayoutParams): layout parameters
+        """
+        if len(pos_x) == 0:
+            return
+        layout_columns(self.generator, len(pos_x),
+                       (ctypes.c_float * len(pos_x)).from_buffer(pos_x),
+                       (ctypes.c_float * len(pos_y)).from_buffer(pos_y),
+                       (ctypes.c_uint8 * len(known)).from_buffer(known),
+                       len(sources), pack_array(sources), pack_array(targets),
+                       ctypes.byref(params))
+
+    def analyze(self, net: NetColumns) -> NetAnalytics:
+        """PageRank, components and degrees of a directed net, the iteration runs in `libmd_net`
+
+        Args:
+            net (NetColumns): net, links point from the linking note
+
+        Returns:
+            NetAnalytics: analytics of each node
+        """
+        n_len = len(net.ids)
+        canalytics = analyze_columns(self.generator, n_len, len(net.sources),
+                                     pack_array(net.sources), pack_array(
+                                         net.targets),
+                                     0.85, 1e-6, 100)
+        c = canalytics.contents
+        analytics = NetAnalytics(net,
+                                 rank=view_array(c.rank, n_len),
+                                 component=view_array(c.component, n_len),
+                                 in_degree=view_array(c.in_degree, n_len),
+                                 out_degree=view_array(c.out_degree, n_len),
+                                 iterations=c.iterations)
+        free_net_analytics(canalytics)
+        return analytics
+
+    @contextmanager
+    def trigrams(self, notes: list[NoteSchema]) -> Iterator[tuple[memoryview, memoryview, memoryview]]:
+        """build the trigram posting lists of the note files on the extraction thread pool
+
+        The views point into `libmd_net` memory and are only valid inside the block.
+
+        Args:
+            notes (list[NoteSchema]): notes to index
+
+        Yields:
+            Iterator[tuple[memoryview, memoryview, memoryview]]: bytes of keys (uint32),
+            offsets (uint64) and posting data, the lists are described in `TrigramIndex`
+        """
+        cnotes = copy_note_columns(notes)
+        cpostings = build_trigram_columns(self.generator, ctypes.byref(cnotes))
+        c = cpostings.contents
+        try:
+            offsets = view_buffer(c.offsets, c.len + 1)
+            yield (view_buffer(c.keys, c.len), offsets,
+                   view_buffer(c.data, offsets.cast('Q')[-1]))
+        finally:
+            free_trigram_postings(cpostings)
+
+    @staticmethod
+    def extract_trigrams(data: bytes) -> array:
+        """sorted distinct trigrams of one text
+
+        Args:
+            data (bytes): text
+
+        Returns:
+            array: trigrams, `array('I')`
+        """
+        length = ctypes.c_uint32()
+        p = extract_trigrams(data, len(data), ctypes.byref(length))
+        grams = array('I')
+        grams.frombytes(view_buffer(p, length.value))
+        free_trigrams(p, length)
+        return grams
+
     def __del__(self):
         pass
 
 
+class NetLayout:
+    """server side force-directed layout with persisted positions
+
+    Positions are stored in `net_positions` and are the start of the next
+    layout, a net which only gained a few nodes settles in a short cooled
+    down run instead of a full one. An unchanged net is not laid out again.
+    """
+
+    LENGTH = 30.0
+
+    def __init__(self, generator: NetGenerator, iterations: int) -> None:
+        self.generator = generator
+        self.iterations = iterations
+        # net version the stored positions belong to
+        self.version: Optional[int] = None
+
+    def apply(self, db: Session, net: NetColumns) -> None:
+        """seed `pos` of every node of the net, and store the new positions
+
+        Args:
+            db (Session): database session
+            net (NetColumns): net, changed in place
+        """
+        notes: dict[int, tuple[float, float]] = {}
+        resources: dict[str, tuple[float, float]] = {}
+        for note_id, data, x, y in db.query(NetPositionModel.note_id, NetPositionModel.data,
+                                            NetPositionModel.x, NetPositionModel.y).all():
+            if note_id is not None:
+                notes[note_id] = (x, y)
+            else:
+                resources[data] = (x, y)
+        pos_x, pos_y, known = array('f'), array('f'), array('B')
+        for id, data, is_md in zip(net.ids, net.data, net.is_md):
+            pos = notes.get(id) if is_md else resources.get(data)
+            pos_x.append(pos[0] if pos else 0)
+            pos_y.append(pos[1] if pos else 0)
+            known.append(pos is not None)
+
+        placed = sum(known)
+        if placed < len(known) or net.version != self.version:
+            params = CLayoutParams(theta=0.8, length=self.LENGTH, gravity=0.01)
+            if placed * 2 < len(known):
+                params.iterations = self.iterations
+                params.temperature = self.LENGTH * len(known) ** 0.5 / 10
+            else:
+                # warm start, only the new nodes and their surroundings move noticeably
+                params.iterations = max(self.iterations // 10, 1)
+                params.temperature = self.LENGTH
+            self.generator.layout(pos_x, pos_y, known,
+                                  net.sources, net.targets, params)
+            db.query(NetPositionModel).delete(synchronize_session=False)
+            db.execute(insert(NetPositionModel), [
+                {"note_id": id if is_md else None, "data": None if is_md else data, "x": x, "y": y}
+                for id, data, is_md, x, y in zip(net.ids, net.data, net.is_md, pos_x, pos_y)])
+            db.commit()
+            self.version = net.version
+        net.pos_x = [round(x) for x in pos_x]
+        net.pos_y = [round(y) for y in pos_y]
+
+
+class NetIndex:
+    """persisted note link index
+
+    The links of every note are stored in the `note_links` table, the
+    relationship net is assembled from the table instead of parsing all
+    note files again. Only the notes touched by a save are re-extracted.
+
+    Every change of the net bumps `version` and keeps a `NetDelta` in a
+    bounded history, so clients can fetch the changes since the version
+    they hold instead of the whole net. With a `NetLayout` the net from
+    `build` carries laid out node positions.
+    """
+
+    def __init__(self, generator: NetGenerator, history: int, layout: Optional[NetLayout] = None) -> None:
+        self.generator = generator
+        self.layout = layout
+        self.is_ready = False
+        self._building: Optional[Future[bytes]] = None
+        # seeded with the start time so a version from an earlier process is not taken as current
+        self.version = time_ns() // 1_000_000
+        self._history: deque[NetDelta] = deque(maxlen=history)
+        self._lock = Lock()
+        self._watchers: dict[Event, AbstractEventLoop] = {}
+        self._analytics: Optional[NetAnalytics] = None
+        self._analytics_json: dict[int, bytes] = {}
+        self._analytics_lock = Lock()
+        self._paths: Optional[NetPaths] = None
+        self._paths_lock = Lock()
+
+    async def build(self, sessions: Callable[[], Session], read_sessions: Callable[[], Session]) -> bytes:
+        """build relationship net JSON in a worker thread
+
+        The event loop is never blocked by the database query or by
+        `libmd_net` (ctypes releases the GIL during the foreign call).
+        Calls arriving while a build is running share its result. The
+        build opens its own sessions, a caller which goes away doesn't
+        close them under the other callers. The net is assembled on a
+        read only session, the writer is only taken to store the layout.
+
+        Args:
+            sessions (Callable[[], Session]): database session factory
+            read_sessions (Callable[[], Session]): read only database session factory
+
+        Returns:
+            bytes: net JSON, the layout of `NetSchema`
+        """
+        if self._building is None:
+            self._building = ensure_future(to_thread(self._build, sessions, read_sessions))
+            self._building.add_done_callback(self._finish_build)
+        return await shield(self._building)
+
+    def _build(self, sessions: Callable[[], Session], read_sessions: Callable[[], Session]) -> bytes:
+        self.ensure_ready(sessions)
+        # read before assembling, a change committed meanwhile is sent again as a delta
+        version = self.version
+        with read_sessions() as db:
+            net = self.assemble(db)
+        net.version = version
+        if self.layout is not None:
+            with sessions() as db:
+                self.layout.apply(db, net)
+        return net.to_json()
+
+    def _finish_build(self, _building: Future[bytes]) -> None:
+        self._building = None
+
+    def prepare(self, db: Session) -> None:
+        """index the notes whose links were not extracted at their current hash, run once per process
+
+        `notes.links_hash` is the hash the links of a note were extracted at,
+        a start only reads the notes created or changed since, whether they
+        have links or not.
+
+        Args:
+            db (Session): database session
+        """
+        if self.is_ready:
+            return
+        notes = db.query(NoteModel)\
+            .where(NoteModel.links_hash.is_(None)
+                   | (NoteModel.links_hash != func.coalesce(NoteModel.content_hash, "")))\
+            .all()
+        if notes:
+            db.query(NoteLinkModel)\
+                .where(NoteLinkModel.note_id.in_([note.id for note in notes]))\
+                .delete(synchronize_session=False)
+            self._insert_refs(db, self.generator.extract(
+                list(map(parse_note_model, notes))))
+            self._mark_extracted(db, notes)
+            db.commit()
+        self.is_ready = True
+
+    def ensure_ready(self, sessions: Callable[[], Session]) -> None:
+        """`prepare` on a session of its own, the writer is only taken by the first call
+
+        The read methods take a read only session, they need the index
+        prepared beforehand.
+
+        Args:
+            sessions (Callable[[], Session]): database session factory
+        """
+        if not self.is_ready:
+            with sessions() as db:
+                self.prepare(db)
+
+    def update(self, db: Session, note: NoteModel) -> None:
+        """re-extract the links of target note after its file changed
+
+        Args:
+            db (Session): database session
+            note (NoteModel): target note
+        """
+        with self.change(db, {str(note.name)}):
+            db.query(NoteLinkModel)\
+                .where(NoteLinkModel.note_id == note.id)\
+                .delete(synchronize_session=False)
+            self._insert_refs(db, self.generator.extract(
+                [parse_note_model(note)]))
+            self._mark_extracted(db, [note])
+            db.commit()
+
+    @contextmanager
+    def change(self, db: Session, names: set[str]) -> Iterator[None]:
+        """record the changes made to the notes named `names` inside the block as a new version
+
+        Only the notes with these names can gain or lose nodes and links by
+        creating, saving, renaming or deleting one of them, so the delta is
+        the difference of their links before and after the block.
+
+        Args:
+            db (Session): database session
+            names (set[str]): names of the changed notes, old and new name for a rename
+        """
+        self.prepare(db)
+        with self._lock:
+            before = self._region(db, names)
+            yield
+            after = self._region(db, names)
+            delta = NetDelta(self.version, self.version + 1)
+            delta.nodes = {key: data for key, data in after[0].items()
+                           if before[0].get(key) != data}
+            delta.removed_nodes = {key: data for key, data in before[0].items()
+                                   if key not in after[0]}
+            delta.links = after[1] - before[1]
+            delta.removed_links = before[1] - after[1]
+            if resources := [key[1] for key in delta.removed_nodes if not key[0]]:
+                for data, in db.query(NoteLinkModel.data)\
+                        .where(NoteLinkModel.is_md.is_(False), NoteLinkModel.data.in_(resources))\
+                        .distinct().all():
+                    del delta.removed_nodes[(False, data)]
+            if not delta.is_empty():
+                self.version += 1
+                self._history.append(delta)
+                for event, loop in list(self._watchers.items()):
+                    loop.call_soon_threadsafe(event.set)
+
+    def delta(self, db: Session, since: int) -> NetDelta:
+        """changes of the net since a version
+
+        Args:
+            db (Session): database session
+            since (int): version the client holds
+
+        Returns:
+            NetDelta: merged delta, the full net if `since` is out of the history window
+        """
+        with self._lock:
+            version = self.version
+            if since == version:
+                return NetDelta(since, version)
+            if self._history and self._history[0].since <= since < version:
+                delta = NetDelta(since, since)
+                for item in self._history:
+                    if item.version > since:
+                        delta.merge(item)
+                return delta
+        self.prepare(db)
+        net = self.assemble(db)
+        net.version = version
+        return NetDelta.from_net(net, since)
+
+    def watch(self) -> Event:
+        """subscribe to new versions from the running event loop
+
+        Returns:
+            Event: set whenever the net gets a new version
+        """
+        event = Event()
+        self._watchers[event] = get_running_loop()
+        return event
+
+    def unwatch(self, event: Event) -> None:
+        self._watchers.pop(event, None)
+
+    def analytics(self, db: Session, top: int) -> bytes:
+        """analytics of the directed link graph, computed once per net version
+
+        Args:
+            db (Session): database session
+            top (int): length of each ranking
+
+        Returns:
+            bytes: JSON of `NetAnalyticsSchema`
+        """
+        with self._analytics_lock:
+            version = self.version
+            if self._analytics is None or self._analytics.net.version != version:
+                self.prepare(db)
+                net = self.assemble(db, directed=True)
+                net.version = version
+                self._analytics = self.generator.analyze(net)
+                self._analytics_json = {}
+            if top not in self._analytics_json:
+                self._analytics_json[top] = self._analytics.to_json(top)
+            return self._analytics_json[top]
+
+    def paths(self, db: Session, source: int, target: int, k: int, directed: bool) -> Optional[bytes]:
+        """k shortest reference chains between two notes, over an adjacency index kept per net version
+
+        Args:
+            db (Session): database session
+            source (int): start note id
+            target (int): end note id
+            k (int): max path count
+            directed (bool): only follow links from the linking note
+
+        Returns:
+            Optional[bytes]: JSON of `NetPathSchema`, None if a note doesn't exist
+        """
+        with self._paths_lock:
+            version = self.version
+            if self._paths is None or self._paths.net.version != version:
+                self.prepare(db)
+                net = self.assemble(db, directed=True)
+                net.version = version
+                self._paths = NetPaths(net)
+            paths = self._paths
+        if source not in paths.note_index or target not in paths.note_index:
+            return None
+        return paths.to_json(paths.k_shortest(
+            paths.note_index[source], paths.note_index[target], k, directed))
+
+    def assemble(self, db: Session, directed: bool = False) -> NetColumns:
+        """assemble relationship net from the link index
+
+        Args:
+            db (Session): database session
+            directed (bool, optional): keep both directions of a link between two notes. Defaults to False.
+
+        Returns:
+            NetColumns: net
+        """
+        notes = db.query(NoteModel.id, NoteModel.name)\
+            .order_by(NoteModel.id).all()
+        refs = db.query(NoteLinkModel.note_id, NoteLinkModel.data, NoteLinkModel.is_md)\
+            .order_by(NoteLinkModel.id).all()
+
+        ids = [id for id, _ in notes]
+        data = [name for _, name in notes]
+        is_md = [True] * len(notes)
+        id_index = {id: i for i, id in enumerate(ids)}
+        name_index: dict[str, int] = {}
+        for i, name in enumerate(data):
+            name_index.setdefault(name, i)
+
+        res_index: dict[str, int] = {}
+        sources: list[int] = []
+        targets: list[int] = []
+        link_set: set[tuple[int, int]] = set()
+        for note_id, ref, ref_is_md in refs:
+            source = id_index.get(note_id)
+            if source is None:
+                continue
+            if ref_is_md:
+                target = name_index.get(ref)
+                if target is None:
+                    continue
+            elif (target := res_index.get(ref)) is None:
+                ids.append(0)
+                data.append(ref)
+                is_md.append(False)
+                target = res_index[ref] = len(data) - 1
+            key = (source, target) if directed else (
+                min(source, target), max(source, target))
+            if key not in link_set:
+                link_set.add(key)
+                sources.append(source)
+                targets.append(target)
+        return NetColumns(ids, data, is_md, [0] * len(ids), [0] * len(ids), sources, targets)
+
+    def neighborhood(self, db: Session, note_id: int, depth: int, limit: int) -> Optional[NetColumns]:
+        """k-hop neighborhood of a note, the induced subgraph of the net
+
+        Links are followed in both directions. Each hop is a few lookups on
+        the indexed `note_links` columns, so the cost depends on the size of
+        the neighborhood rather than on the size of the vault.
+
+        Args:
+            db (Session): database session
+            note_id (int): center note id
+            depth (int): max hops from the center note
+            limit (int): max node count, nearer nodes are kept first
+
+        Returns:
+            Optional[NetColumns]: subgraph, center note is node 0, None if note doesn't exist
+        """
+        center = db.get(NoteModel, note_id)
+        if center is None:
+            return None
+        self.prepare(db)
+        center_id = int(center.id)
+        # note node key is the note id, resource node key is the resource name
+        names: dict[int, str] = {center_id: str(center.name)}
+        order: list[int | str] = [center_id]
+        seen: set[int | str] = {center_id}
+        frontier: list[int | str] = [center_id]
+        for _ in range(depth):
+            if not frontier or len(order) >= limit:
+                break
+            neighbors = self._neighbors(db, frontier, names)
+            frontier = []
+            for key in neighbors:
+                if key not in seen and len(order) < limit:
+                    seen.add(key)
+                    order.append(key)
+                    frontier.append(key)
+        return self._subgraph(db, order, names)
+
+    def _neighbors(self, db: Session, frontier: list[int | str], names: dict[int, str]) -> list[int | str]:
+        note_ids = [key for key in frontier if isinstance(key, int)]
+        resources = [key for key in frontier if isinstance(key, str)]
+        outbound = db.query(NoteLinkModel.data, NoteLinkModel.is_md)\
+            .where(NoteLinkModel.note_id.in_(note_ids))\
+            .order_by(NoteLinkModel.id).all()
+        canonical = self._resolve(
+            db, [data for data, is_md in outbound if is_md] + [names[id] for id in note_ids])
+        neighbors: list[int | str] = [
+            canonical[data] if is_md else data
+            for data, is_md in outbound if not is_md or data in canonical]
+        # a note only receives the links to its name if it is the one the name resolves to
+        targets = [names[id] for id in note_ids if canonical.get(names[id]) == id]
+        inbound = db.query(NoteLinkModel.note_id)\
+            .where(NoteLinkModel.is_md.is_(True), NoteLinkModel.data.in_(targets))\
+            .union(db.query(NoteLinkModel.note_id)
+                   .where(NoteLinkModel.is_md.is_(False), NoteLinkModel.data.in_(resources)))\
+            .all()
+        neighbors.extend(sorted(id for id, in inbound))
+        unnamed = {key for key in neighbors if isinstance(
+            key, int) and key not in names}
+        if unnamed:
+            names.update(db.query(NoteModel.id, NoteModel.name)
+                         .where(NoteModel.id.in_(unnamed)).tuples().all())
+        return neighbors
+
+    def _subgraph(self, db: Session, order: list[int | str], names: dict[int, str]) -> NetColumns:
+        index = {key: i for i, key in enumerate(order)}
+        refs = db.query(NoteLinkModel.note_id, NoteLinkModel.data, NoteLinkModel.is_md)\
+            .where(NoteLinkModel.note_id.in_([key for key in order if isinstance(key, int)]))\
+            .order_by(NoteLinkModel.id).all()
+        canonical = self._resolve(
+            db, [data for _, data, is_md in refs if is_md])
+        sources: list[int] = []
+        targets: list[int] = []
+        link_set: set[tuple[int, int]] = set()
+        for note_id, data, is_md in refs:
+            node: Optional[int | str] = canonical.get(data) if is_md else data
+            target = None if node is None else index.get(node)
+            if target is None:
+                continue
+            source = index[note_id]
+            key = (min(source, target), max(source, target))
+            if key not in link_set:
+                link_set.add(key)
+                sources.append(source)
+                targets.append(target)
+        ids = [key if isinstance(key, int) else 0 for key in order]
+        data = [names[key] if isinstance(key, int) else key for key in order]
+        is_md = [isinstance(key, int) for key in order]
+        return NetColumns(ids, data, is_md, [0] * len(ids), [0] * len(ids), sources, targets)
+
+    def _region(self, db: Session, names: set[str]) -> tuple[dict[NodeKey, str], set[LinkKey]]:
+        """nodes of the notes named `names` and their resources, with all links touching them
+        """
+        notes: dict[int, str] = dict(db.query(NoteModel.id, NoteModel.name)
+                                     .where(NoteModel.name.in_(names)).tuples().all())
+        outbound = db.query(NoteLinkModel.note_id, NoteLinkModel.data, NoteLinkModel.is_md)\
+            .where(NoteLinkModel.note_id.in_(notes)).all()
+        canonical = self._resolve(
+            db, [data for _, data, is_md in outbound if is_md] + list(names))
+        inbound = db.query(NoteLinkModel.note_id, NoteLinkModel.data)\
+            .where(NoteLinkModel.is_md.is_(True),
+                   NoteLinkModel.data.in_([name for name in names if name in canonical]))\
+            .all()
+        nodes: dict[NodeKey, str] = {(True, id): name for id, name in notes.items()}
+        links: set[LinkKey] = set()
+        for note_id, data, is_md in outbound:
+            if not is_md:
+                nodes[(False, data)] = data
+                links.add(link_key((True, note_id), (False, data)))
+            elif data in canonical:
+                links.add(link_key((True, note_id), (True, canonical[data])))
+        for note_id, data in inbound:
+            links.add(link_key((True, note_id), (True, canonical[data])))
+        return nodes, links
+
+    @staticmethod
+    def _resolve(db: Session, names: list[str]) -> dict[str, int]:
+        """map note names to the note they resolve to, the one with the smallest id
+        """
+        if not names:
+            return {}
+        return dict(db.query(NoteModel.name, func.min(NoteModel.id))
+                    .where(NoteModel.name.in_(set(names)))
+                    .group_by(NoteModel.name).all())
+
+    @staticmethod
+    def _mark_extracted(db: Session, notes: list[NoteModel]) -> None:
+        # the hash each note was loaded with, a save after it is extracted again on the next start
+        db.execute(update(NoteModel), [{"id": note.id, "links_hash": note.content_hash or ""} for note in notes])
+
+    @staticmethod
+    def _insert_refs(db: Session, refs: NetRefColumns) -> None:
+        if rows := refs.to_rows():
+            db.execute(insert(NoteLinkModel), rows)
+
+
+def parse_note_model(note: NoteModel) -> NoteSchema:
+    return NoteSchema(id=int(note.id), name=str(note.name), url=str(note.url))
+
+
 def copy_note(note: NoteSchema) -> CNoteSchema:
     c_note = CNoteSchema()
     c_note.id = note.id
@@ -115,4 +1157,73 @@ def parse_cnet_link(input: CNetLinkSchema) -> NetLinkSchema:
     )
 
 
-net_generator = NetGenerator()
+def copy_note_columns(notes: list[NoteSchema]) -> CNoteColumns:
+    names = [note.name.encode('utf-8') for note in notes]
+    urls = [note.url.encode('utf-8') for note in notes]
+    return CNoteColumns(
+        len=len(notes),
+        ids=pack_array([note.id for note in notes]),
+        names=b''.join(names),
+        name_offsets=pack_array(accumulate(map(len, names), initial=0)),
+        urls=b''.join(urls),
+        url_offsets=pack_array(accumulate(map(len, urls), initial=0))
+    )
+
+
+def pack_array(values) -> ctypes.Array:
+    """pack integers into a contiguous uint32 buffer shared with ctypes
+    """
+    buffer = array('I', values)
+    return (ctypes.c_uint32 * len(buffer)).from_buffer(buffer)
+
+
+def view_array(p, length: int) -> list:
+    """read `length` items behind pointer `p` through one memoryview
+    """
+    if length == 0:
+        return []
+    return view_buffer(p, length).cast(p._type_._type_).tolist()
+
+
+def view_buffer(p, length: int) -> memoryview:
+    """bytes of the `length` items behind pointer `p`, without copying
+    """
+    if length == 0:
+        return memoryview(b'')
+    items = (p._type_ * length).from_address(ctypes.addressof(p.contents))
+    return memoryview(items).cast('B')
+
+
+def view_strings(p_data, p_offsets, length: int) -> list[str]:
+    """split the packed UTF-8 blob by offsets
+    """
+    offsets = view_array(p_offsets, length + 1)
+    if length == 0:
+        return []
+    blob = ctypes.string_at(p_data, offsets[-1])
+    return [blob[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+def parse_cnet_columns(input: CNetColumns) -> NetColumns:
+    return NetColumns(
+        ids=view_array(input.ids, input.n_len),
+        data=view_strings(input.data, input.data_offsets, input.n_len),
+        is_md=list(map(bool, view_array(input.is_md, input.n_len))),
+        pos_x=view_array(input.pos_x, input.n_len),
+        pos_y=view_array(input.pos_y, input.n_len),
+        sources=view_array(input.sources, input.l_len),
+        targets=view_array(input.targets, input.l_len)
+    )
+
+
+def parse_cref_columns(input: CNetRefColumns) -> NetRefColumns:
+    return NetRefColumns(
+        note_ids=view_array(input.note_ids, input.len),
+        data=view_strings(input.data, input.data_offsets, input.len),
+        is_md=list(map(bool, view_array(input.is_md, input.len)))
+    )
+
+
+net_generator = NetGenerator(net_config.workers)
+net_index = NetIndex(net_generator, net_config.history,
+                     NetLayout(net_generator, net_config.layout_iterations) if net_config.layout else None)
@@ -0,0 +1,146 @@
+import ctypes
+from sys import platform
+from threading import Lock
+from typing import Optional
+
+from service.content_cache import ContentCache
+from service.logger import logger
+
+if platform.startswith('linux'):
+    lib_name = 'libmdencoder.so'
+elif platform.startswith('win'):
+    lib_name = 'mdencoder.dll'
+else:
+    raise Exception('Unknown platform')
+
+
+class CProto(ctypes.Structure):
+    _fields_ = [("data", ctypes.POINTER(ctypes.c_uint8)),
+                ("len", ctypes.c_uint32)]
+
+
+class CProtoVec(ctypes.Structure):
+    _fields_ = [("data", ctypes.POINTER(ctypes.POINTER(CProto))),
+                ("len", ctypes.c_uint32)]
+
+
+class CProtoGenerator(ctypes.Structure):
+    _fields_ = [("ctx", ctypes.c_void_p)]
+
+
+def delimited(blocks: list[bytes]) -> bytes:
+    """join protobuf messages into a length-delimited stream, each one after the varint of its size
+
+    Args:
+        blocks (list[bytes]): serialized messages
+
+    Returns:
+        bytes: stream for `decodeDelimited` of protobuf.js or `parseDelimitedFrom`
+    """
+    out = bytearray()
+    for block in blocks:
+        size = len(block)
+        while size > 0x7f:
+            out.append(size & 0x7f | 0x80)
+            size >>= 7
+        out.append(size)
+        out += block
+    return bytes(out)
+
+
+class BlockRenderer:
+    """markdown to `pap_proto.Block` renderer of `libmdencoder`, the output is cached by content hash
+
+    The library is loaded on the first render, the backend runs without it.
+    Blocks are parsed in parallel from `PARALLEL_THRESHOLD` blocks on, the
+    rendered streams are kept in a LRU cache under `BUDGET` bytes.
+    """
+
+    PARALLEL_THRESHOLD = 1000
+    BUDGET = 128 * 1024 * 1024
+
+    def __init__(self, lib_path: str) -> None:
+        self.lib_path = lib_path
+        self.cache = ContentCache(self.BUDGET)
+        self._lock = Lock()
+        self._lib: Optional[ctypes.CDLL] = None
+        self._generator = None
+        self._failed = False
+
+    def load(self) -> bool:
+        """load `libmdencoder` and make the generator, once
+
+        Returns:
+            bool: False if the library can't be loaded
+        """
+        if self._lib is not None:
+            return True
+        with self._lock:
+            if self._lib is not None:
+                return True
+            if self._failed:
+                return False
+            try:
+                lib = ctypes.CDLL(self.lib_path)
+            except OSError as error:
+                logger.error(f"fail to load {self.lib_path}: {error}")
+                self._failed = True
+                return False
+            lib.init_proto_generator.argtypes = [ctypes.c_uint32]
+            lib.init_proto_generator.restype = ctypes.POINTER(CProtoGenerator)
+            lib.generate_proto.argtypes = [ctypes.POINTER(CProtoGenerator), ctypes.c_char_p]
+            lib.generate_proto.restype = ctypes.POINTER(CProtoVec)
+            lib.free_proto_vec.argtypes = [ctypes.POINTER(CProtoVec)]
+            self._generator = lib.init_proto_generator(self.PARALLEL_THRESHOLD)
+            self._lib = lib
+            return True
+
+    def get(self, content_hash: str) -> Optional[bytes]:
+        """rendered blocks of a content if cached
+
+        Args:
+            content_hash (str): sha256 of the note content
+
+        Returns:
+            Optional[bytes]: length-delimited blocks, None if not cached
+        """
+        return self.cache.get(content_hash)
+
+    def render(self, content_hash: str, data: bytes) -> Optional[bytes]:
+        """render a note content into length-delimited `pap_proto.Block` messages
+
+        Args:
+            content_hash (str): sha256 of `data`, the cache key
+            data (bytes): note content
+
+        Raises:
+            ValueError: the content is not UTF-8 text
+
+        Returns:
+            Optional[bytes]: length-delimited blocks, None if `libmdencoder` can't be loaded
+        """
+        if (blocks := self.cache.get(content_hash)) is not None:
+            return blocks
+        # the library reads a NUL terminated UTF-8 string and aborts on anything else
+        data.decode('utf-8')
+        if b"\0" in data:
+            raise ValueError("NUL character in note content")
+        if not self.load():
+            return None
+        blocks = delimited(self._generate(data))
+        self.cache.put(content_hash, blocks, len(blocks))
+        return blocks
+
+    def _generate(self, data: bytes) -> list[bytes]:
+        assert self._lib is not None
+        # ctypes releases the GIL during the call
+        proto_vec = self._lib.generate_proto(self._generator, data)
+        try:
+            vec = proto_vec.contents
+            return [ctypes.string_at(vec.data[i].contents.data, vec.data[i].contents.len)
+                    for i in range(vec.len)]
+        finally:
+            self._lib.free_proto_vec(proto_vec)
+
+
+block_renderer = BlockRenderer(f"./{lib_name}")
@@ -0,0 +1,199 @@
+from re import compile, escape, IGNORECASE
+from typing import Any, Callable
+
+from model.note_group import NoteModel
+from schemas.note_base import NoteSchema
+from schemas.note import NoteSearchSchema
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+def read_note(url: str) -> str:
+    """read the text of a note file, empty for a missing file
+
+    Args:
+        url (str): note file path
+
+    Returns:
+        str: note text
+    """
+    try:
+        with open(url, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+class NoteSearch:
+    """full-text search over all notes with the SQLite FTS5 table `note_fts`
+
+    Name and content of every note are kept in `note_fts`, updated by the
+    note routes on each create, save, rename and delete. Hits are ranked by
+    BM25, a match in the name weighs more than one in the content.
+    """
+
+    NAME_WEIGHT = 10.0
+    # a trigram token advances one character, 64 is the max and about as many characters
+    SNIPPET_TOKENS = 64
+    SNIPPET_CHARS = 64
+    # the trigram tokenizer can't match a shorter term, it becomes a substring filter
+    MIN_TERM = 3
+
+    def __init__(self, mark: tuple[str, str] = ("<mark>", "</mark>")) -> None:
+        self.mark = mark
+        self.is_ready = False
+
+    def prepare(self, db: Session) -> None:
+        """index the notes which are not in `note_fts` yet, run once per process
+
+        Args:
+            db (Session): database session
+        """
+        if self.is_ready:
+            return
+        notes = db.execute(text(
+            "SELECT id, name, url FROM notes WHERE id NOT IN (SELECT rowid FROM note_fts)")).all()
+        if notes:
+            db.execute(text("INSERT INTO note_fts(rowid, name, content) VALUES (:id, :name, :content)"),
+                       [{"id": id, "name": name, "content": read_note(url)} for id, name, url in notes])
+            db.commit()
+        self.is_ready = True
+
+    def ensure_ready(self, sessions: Callable[[], Session]) -> None:
+        """`prepare` on a session of its own, the writer is only taken by the first call
+
+        Args:
+            sessions (Callable[[], Session]): database session factory
+        """
+        if not self.is_ready:
+            with sessions() as db:
+                self.prepare(db)
+
+    def update(self, db: Session, note: NoteModel) -> None:
+        """index name and file content of target note again
+
+        Args:
+            db (Session): database session
+            note (NoteModel): target note
+        """
+        db.execute(text("DELETE FROM note_fts WHERE rowid = :id"), {"id": note.id})
+        db.execute(text("INSERT INTO note_fts(rowid, name, content) VALUES (:id, :name, :content)"),
+                   {"id": note.id, "name": note.name, "content": read_note(str(note.url))})
+        db.commit()
+
+    def update_many(self, db: Session, notes: list[NoteSchema]) -> None:
+        """index name and file content of many notes again in one transaction
+
+        Args:
+            db (Session): database session
+            notes (list[NoteSchema]): target notes
+        """
+        if not notes:
+            return
+        db.execute(text("DELETE FROM note_fts WHERE rowid = :id"), [{"id": note.id} for note in notes])
+        db.execute(text("INSERT INTO note_fts(rowid, name, content) VALUES (:id, :name, :content)"),
+                   [{"id": note.id, "name": note.name, "content": read_note(note.url)} for note in notes])
+        db.commit()
+
+    def rename(self, db: Session, note_id: int, name: str) -> None:
+        """update the indexed name of target note
+
+        Args:
+            db (Session): database session
+            note_id (int): target note id
+            name (str): new name
+        """
+        db.execute(text("UPDATE note_fts SET name = :name WHERE rowid = :id"),
+                   {"id": note_id, "name": name})
+        db.commit()
+
+    def remove(self, db: Session, note_id: int) -> None:
+        """drop target note from the index
+
+        Args:
+            db (Session): database session
+            note_id (int): target note id
+        """
+        db.execute(text("DELETE FROM note_fts WHERE rowid = :id"), {"id": note_id})
+        db.commit()
+
+    def remove_many(self, db: Session, notes_id: list[int]) -> None:
+        """drop many notes from the index in one transaction
+
+        Args:
+            db (Session): database session
+            notes_id (list[int]): target note ids
+        """
+        if notes_id:
+            db.execute(text("DELETE FROM note_fts WHERE rowid = :id"), [{"id": id} for id in notes_id])
+            db.commit()
+
+    def search(self, db: Session, query: str, limit: int) -> list[NoteSearchSchema]:
+        """search notes containing every whitespace separated term of the query
+
+        Terms are matched as case insensitive substrings of name or content.
+
+        Args:
+            db (Session): database session
+            query (str): search terms
+            limit (int): max hit count
+
+        Returns:
+            list[NoteSearchSchema]: hits, best first
+        """
+        self.prepare(db)
+        terms = query.split()
+        phrases = [t for t in terms if len(t) >= self.MIN_TERM]
+        params: dict[str, Any] = {"limit": limit}
+        filters = []
+        for i, term in enumerate(t for t in terms if len(t) < self.MIN_TERM):
+            params[f"s{i}"] = "%" + term.replace("\\", "\\\\").replace(
+                "%", "\\%").replace("_", "\\_") + "%"
+            filters.append(
+                f"(name LIKE :s{i} ESCAPE '\\' OR content LIKE :s{i} ESCAPE '\\')")
+        if not phrases and not filters:
+            return []
+        if phrases:
+            # every term a quoted string, FTS5 operators in the query are plain text
+            params["match"] = " ".join(
+                '"' + t.replace('"', '""') + '"' for t in phrases)
+            params["open"], params["close"] = self.mark
+            rows = db.execute(text(
+                "SELECT rowid, name, "
+                f"snippet(note_fts, 1, :open, :close, '…', {self.SNIPPET_TOKENS}), "
+                f"bm25(note_fts, {self.NAME_WEIGHT}, 1.0) AS score "
+                "FROM note_fts WHERE note_fts MATCH :match "
+                + "".join(f"AND {f} " for f in filters)
+                + "ORDER BY score LIMIT :limit"), params).all()
+            return [NoteSearchSchema(id=id, name=name, snippet=snippet, score=-score)
+                    for id, name, snippet, score in rows]
+        # short terms only, a scan without ranking
+        rows = db.execute(text(
+            "SELECT rowid, name, content FROM note_fts WHERE "
+            + " AND ".join(filters) + " ORDER BY rowid LIMIT :limit"), params).all()
+        return [NoteSearchSchema(id=id, name=name, snippet=self._snippet(content, terms), score=0.0)
+                for id, name, content in rows]
+
+    def _snippet(self, content: str, terms: list[str]) -> str:
+        """text around the first match of a term, matches wrapped in `mark`
+        """
+        # matched on `content` itself, lowercasing may change the length of a character
+        patterns = [compile(escape(term), IGNORECASE) for term in terms if term]
+        found = [match.start() for pattern in patterns if (match := pattern.search(content))]
+        if not found:
+            return content[:self.SNIPPET_CHARS]
+        start = max(min(found) - self.SNIPPET_CHARS // 2, 0)
+        end = min(start + self.SNIPPET_CHARS, len(content))
+        spans = [match.span() for pattern in patterns for match in pattern.finditer(content, start, end)]
+        parts, last = [], start
+        for a, b in sorted(spans):
+            if a < last:
+                continue
+            parts += [content[last:a], self.mark[0], content[a:b], self.mark[1]]
+            last = b
+        parts.append(content[last:end])
+        return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(content) else "")
+
+
+note_search = NoteSearch()
@@ -0,0 +1,169 @@
+from re import compile as re_compile
+from collections import Counter
+from itertools import chain
+from threading import Lock
+
+from model.note_group import NoteModel, note_tag_association
+from schemas.tag_base import TagQuerySchema
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+ONE = re_compile("1")
+
+
+def bitmap_ids(bitmap: int) -> list[int]:
+    """the set bits of a bitmap in ascending order
+
+    Args:
+        bitmap (int): bitmap, bit `i` for note `i`
+
+    Returns:
+        list[int]: note ids
+    """
+    # the regex scan of the reversed binary string is faster than walking the bytes in python
+    return [m.start() for m in ONE.finditer(bin(bitmap)[:1:-1])]
+
+
+class TagIndex:
+    """tag to note bitmaps held in memory, boolean tag queries and facet counts
+
+    A bitmap is a python int, bit `i` for note `i`. The bitmaps are loaded on
+    the first query, then kept in sync by the note and tag crud functions
+    after each commit. Before the first query the mutations are skipped,
+    `prepare` reads everything.
+
+    Facets of a small selection are counted from the tags of each selected
+    note, of a large one by intersecting the selection with every tag bitmap,
+    whichever touches less memory.
+    """
+
+    # cost of counting one note tag pair against one 64 bit word of a bitmap intersection
+    PAIR_COST = 16
+
+    def __init__(self) -> None:
+        self.is_ready = False
+        self._lock = Lock()
+        self._tags: dict[int, int] = {}
+        # tags of each note, indexed by note id
+        self._note_tags: list[tuple[int, ...]] = []
+        self._pairs = 0
+        self._notes = 0
+
+    def prepare(self, db: Session) -> None:
+        """load the bitmaps of all tags, run once per process
+
+        Args:
+            db (Session): database session
+        """
+        if self.is_ready:
+            return
+        with self._lock:
+            if self.is_ready:
+                return
+            notes = 0
+            for note_id in db.scalars(select(NoteModel.id)):
+                notes |= 1 << note_id
+            tags: dict[int, int] = {}
+            note_tags: list[list[int]] = [[] for _ in range(notes.bit_length())]
+            pairs = 0
+            rows = db.execute(select(note_tag_association.c.tag_id, note_tag_association.c.note_id)
+                              .order_by(note_tag_association.c.tag_id))
+            tag_id, bits = None, 0
+            for row_tag_id, note_id in rows:
+                if row_tag_id != tag_id:
+                    if tag_id is not None:
+                        tags[tag_id] = bits
+                    tag_id, bits = row_tag_id, 0
+                bits |= 1 << note_id
+                if note_id < len(note_tags):
+                    note_tags[note_id].append(row_tag_id)
+                pairs += 1
+            if tag_id is not None:
+                tags[tag_id] = bits
+            self._tags, self._pairs, self._notes = tags, pairs, notes
+            self._note_tags = [tuple(t) for t in note_tags]
+            self.is_ready = True
+
+    def add_note(self, note_id: int) -> None:
+        with self._lock:
+            if self.is_ready:
+                self._notes |= 1 << note_id
+                if note_id >= len(self._note_tags):
+                    self._note_tags += [()] * (note_id + 1 - len(self._note_tags))
+
+    def remove_note(self, note_id: int) -> None:
+        """drop a deleted note from all bitmaps
+        """
+        with self._lock:
+            if self.is_ready:
+                mask = ~(1 << note_id)
+                self._notes &= mask
+                if note_id < len(self._note_tags):
+                    for tag_id in self._note_tags[note_id]:
+                        self._tags[tag_id] &= mask
+                        self._pairs -= 1
+                    self._note_tags[note_id] = ()
+
+    def add_tag(self, tag_id: int, note_id: int) -> None:
+        with self._lock:
+            if self.is_ready and note_id < len(self._note_tags) and tag_id not in self._note_tags[note_id]:
+                self._note_tags[note_id] += (tag_id,)
+                self._tags[tag_id] = self._tags.get(tag_id, 0) | 1 << note_id
+                self._pairs += 1
+
+    def remove_tag(self, tag_id: int, note_id: int) -> None:
+        with self._lock:
+            if self.is_ready and note_id < len(self._note_tags) and tag_id in self._note_tags[note_id]:
+                self._note_tags[note_id] = tuple(t for t in self._note_tags[note_id] if t != tag_id)
+                self._tags[tag_id] &= ~(1 << note_id)
+                self._pairs -= 1
+
+    def delete_tag(self, tag_id: int) -> None:
+        with self._lock:
+            if self.is_ready:
+                for note_id in bitmap_ids(self._tags.pop(tag_id, 0)):
+                    self._note_tags[note_id] = tuple(t for t in self._note_tags[note_id] if t != tag_id)
+                    self._pairs -= 1
+
+    def query(self, expression: TagQuerySchema) -> tuple[list[int], dict[int, int]]:
+        """notes matching a boolean tag expression, and the facet counts of the selection
+
+        Args:
+            expression (TagQuerySchema): tag expression, an unknown tag matches no note
+
+        Returns:
+            tuple[list[int], dict[int, int]]: note ids ascending, count of selected notes by tag
+        """
+        with self._lock:
+            selection = self._evaluate(expression)
+            notes_id = bitmap_ids(selection)
+            pair_cost = len(notes_id) * self._pairs // max(self._notes.bit_count(), 1) * self.PAIR_COST
+            if pair_cost < len(self._tags) * (self._notes.bit_length() // 64 + 1):
+                facets = dict(Counter(chain.from_iterable(
+                    map(self._note_tags.__getitem__, notes_id))))
+            else:
+                facets = {tag_id: count for tag_id, bits in self._tags.items()
+                          if (count := (bits & selection).bit_count())}
+        return notes_id, facets
+
+    def _evaluate(self, expression: TagQuerySchema) -> int:
+        if expression.tag_id is not None:
+            return self._tags.get(expression.tag_id, 0)
+        if expression.and_ is not None:
+            bits = self._notes
+            for sub in expression.and_:
+                bits &= self._evaluate(sub)
+                if not bits:
+                    break
+            return bits
+        if expression.or_ is not None:
+            bits = 0
+            for sub in expression.or_:
+                bits |= self._evaluate(sub)
+            return bits
+        assert expression.not_ is not None
+        return self._notes & ~self._evaluate(expression.not_)
+
+
+tag_index = TagIndex()
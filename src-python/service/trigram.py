@@ -0,0 +1,466 @@
+from os import path, stat, replace, fsync
+from re import IGNORECASE, MULTILINE
+from mmap import mmap, ACCESS_READ
+from array import array
+from struct import Struct
+from bisect import bisect_left
+from importlib import import_module
+from threading import Lock, Thread
+from types import ModuleType
+from typing import BinaryIO, Optional, Union
+
+from model.note_group import NoteModel
+from schemas.note import NoteSchema
+from service.config import path_config
+from service.net import NetGenerator, net_generator
+
+from sqlalchemy.orm import Session
+
+# a literal all its trigrams are required for, an `and` or `or` of plans, or None for any note
+Plan = Union[None, bytes, tuple[str, list["Plan"]]]
+
+VARINT = 0
+BITSET = 1
+
+
+def load_parser() -> Optional[ModuleType]:
+    """the regular expression parser of `re`
+
+    It is a private module, None where it is missing and every note is a candidate.
+    """
+    for name in ["re._parser", "sre_parse"]:
+        try:
+            return import_module(name)
+        except ImportError:
+            pass
+    return None
+
+
+sre_parse = load_parser()
+
+
+def required(pattern: str, ignore_case: bool) -> Plan:
+    """the literals a text must contain to match a pattern
+
+    Only contiguous literal runs are taken, everything else weakens the plan
+    toward None, so a note without the required literals can't match. The
+    plan is None as well if the parser of `re` is missing or has changed.
+
+    Args:
+        pattern (str): regular expression over bytes, see `service.grep`
+        ignore_case (bool): case insensitive match
+
+    Returns:
+        Plan: literal plan
+    """
+    if sre_parse is None:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern.encode('utf-8'),
+                                 MULTILINE | (IGNORECASE if ignore_case else 0))
+        return _required(sre_parse, parsed)
+    except Exception:
+        return None
+
+
+def _required(sre_parse: ModuleType, parsed) -> Plan:
+    plans: list[Plan] = []
+    run = bytearray()
+
+    def flush():
+        if len(run) >= 3:
+            plans.append(bytes(run))
+        run.clear()
+
+    repeats = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+               getattr(sre_parse, "POSSESSIVE_REPEAT", None)}
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(av)
+        elif op is sre_parse.AT:
+            # zero width, the literals around it are still contiguous
+            continue
+        else:
+            flush()
+            if op is sre_parse.SUBPATTERN:
+                plans.append(_required(sre_parse, av[-1]))
+            elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+                plans.append(_required(sre_parse, av))
+            elif op is sre_parse.BRANCH:
+                plans.append(_any([_required(sre_parse, branch) for branch in av[1]]))
+            elif op in repeats and av[0] >= 1:
+                plans.append(_required(sre_parse, av[2]))
+    flush()
+    return _all(plans)
+
+
+def _all(plans: list[Plan]) -> Plan:
+    plans = [p for p in plans if p is not None]
+    if not plans:
+        return None
+    return plans[0] if len(plans) == 1 else ("and", plans)
+
+
+def _any(plans: list[Plan]) -> Plan:
+    if not plans or any(p is None for p in plans):
+        return None
+    return plans[0] if len(plans) == 1 else ("or", plans)
+
+
+def literal_trigrams(literal: bytes) -> set[int]:
+    """trigrams of a literal, lowercased like the index
+    """
+    literal = literal.lower()
+    return {literal[i] << 16 | literal[i + 1] << 8 | literal[i + 2]
+            for i in range(len(literal) - 2)}
+
+
+class TrigramStream:
+    """trigrams of a content fed in chunks, the content is never held whole
+
+    Memory is the distinct trigrams, at most 2^24, instead of the content.
+    """
+
+    def __init__(self, generator: NetGenerator) -> None:
+        self.generator = generator
+        self._grams: Optional[array] = None
+        self._seen: set[int] = set()
+        # the last two bytes, trigrams across a chunk border
+        self._tail = b""
+
+    def update(self, chunk: bytes) -> None:
+        if self._grams is not None:
+            self._seen.update(self._grams)
+        self._grams = self.generator.extract_trigrams(self._tail + chunk)
+        self._tail = (self._tail + chunk)[-2:]
+
+    def trigrams(self) -> array:
+        """sorted distinct trigrams of everything fed, like `NetGenerator.extract_trigrams`
+        """
+        grams = self._grams if self._grams is not None else array('I')
+        if not self._seen:
+            return grams
+        self._seen.update(grams)
+        return array('I', sorted(self._seen))
+
+
+def decode(posting: memoryview) -> int:
+    """decode a posting list into a bitset of note ids
+    """
+    if posting[0] == BITSET:
+        return int.from_bytes(posting[1:], 'little')
+    ids = []
+    last = delta = shift = 0
+    for b in posting[1:]:
+        delta |= (b & 0x7f) << shift
+        shift += 7
+        if b < 0x80:
+            last += delta
+            ids.append(last)
+            delta = shift = 0
+    bits = bytearray(last // 8 + 1)
+    for id in ids:
+        bits[id >> 3] |= 1 << (id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class TrigramIndex:
+    """trigram posting lists of note contents, the prefilter of `/note/grep_notes`
+
+    The base segment is a file built by `libmd_net` and memory mapped, the
+    process never loads it into RAM. Layout, native byte order:
+
+        header   magic, note count, trigram count, data length
+        notes    note ids (uint32), file mtime_ns and size (uint64) at build time
+        keys     sorted trigrams (uint32)
+        offsets  posting list of `keys[i]` is `data[offsets[i]:offsets[i + 1]]` (uint64)
+        data     posting lists, a kind byte, then note ids delta-encoded as
+                 LEB128 varints or a bitset over note ids
+
+    Notes saved later are kept in an in-memory overlay, which shadows their
+    base postings. The base is rebuilt in a background thread once the
+    overlay holds `COMPACT` notes. A note whose file changed while the
+    server was down is found by its mtime and size and goes to the overlay.
+    """
+
+    MAGIC = b"PAPTRI01"
+    HEADER = Struct("=8sIIQ")
+    COMPACT = 1024
+    # decoded base posting lists kept as bitsets
+    CACHE = 4096
+
+    def __init__(self, generator: NetGenerator, index_path: str) -> None:
+        self.generator = generator
+        self.path = index_path
+        self.is_ready = False
+        self._lock = Lock()
+        self._file: Optional[BinaryIO] = None
+        self._map: Optional[mmap] = None
+        self._view: Optional[memoryview] = None
+        self._keys: Optional[memoryview] = None
+        self._offsets: Optional[memoryview] = None
+        self._data: Optional[memoryview] = None
+        self._decoded: dict[int, int] = {}
+        # note id -> (sequence number of the change, trigrams, None for a removed note)
+        self._overlay: dict[int, tuple[int, Optional[array]]] = {}
+        self._shadow = 0
+        self._seq = 0
+        self._urls: dict[int, str] = {}
+        self._compacting: Optional[Thread] = None
+        self._open()
+
+    def prepare(self, db: Session) -> None:
+        """reconcile the base segment with the notes, run once per process
+
+        Args:
+            db (Session): database session
+        """
+        if self.is_ready:
+            return
+        if (compacting := self._compacting) is not None:
+            compacting.join()
+        notes = db.query(NoteModel.id, NoteModel.url).all()
+        with self._lock:
+            self._urls = {int(id): str(url) for id, url in notes}
+            if self._map is None:
+                self._open()
+        base = self._stamps()
+        changed = [id for id, url in self._urls.items()
+                   if base.get(id) != file_stamp(url)]
+        if self._map is None or len(changed) > self.COMPACT:
+            self._build(self._seq)
+        else:
+            for id in changed:
+                self.update(id, self._urls[id])
+            for id in base.keys() - self._urls.keys():
+                self.remove(id)
+        self.is_ready = True
+
+    def update(self, note_id: int, url: str, data: Optional[bytes] = None, grams: Optional[array] = None) -> None:
+        """index the content of a saved note
+
+        Args:
+            note_id (int): note id
+            url (str): note file path
+            data (Optional[bytes], optional): file content, read from `url` if None. Defaults to None.
+            grams (Optional[array], optional): trigrams of the content from a `TrigramStream`,
+                instead of `data`. Defaults to None.
+        """
+        if grams is None:
+            if data is None:
+                try:
+                    with open(url, 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    data = b""
+            grams = self.generator.extract_trigrams(data)
+        with self._lock:
+            self._urls[note_id] = url
+            self._set(note_id, grams)
+
+    def remove(self, note_id: int) -> None:
+        """drop a deleted note
+
+        Args:
+            note_id (int): note id
+        """
+        with self._lock:
+            self._urls.pop(note_id, None)
+            self._set(note_id, None)
+
+    def candidates(self, pattern: str, ignore_case: bool) -> Optional[int]:
+        """the notes which may match a pattern
+
+        Args:
+            pattern (str): regular expression over bytes, see `service.grep`
+            ignore_case (bool): case insensitive match
+
+        Returns:
+            Optional[int]: bitset of note ids, bit `i` for note `i`, None if the pattern has no
+            literal to narrow by and every note is a candidate
+        """
+        plan = required(pattern, ignore_case)
+        if plan is None:
+            return None
+        with self._lock:
+            bits = self._base(plan) & ~self._shadow
+            for note_id, (_, grams) in self._overlay.items():
+                if grams is not None and self._contains(plan, grams):
+                    bits |= 1 << note_id
+        return bits
+
+    def close(self) -> None:
+        """wait for a running rebuild and unmap the base segment, `prepare` maps it again
+        """
+        if (compacting := self._compacting) is not None:
+            compacting.join()
+        with self._lock:
+            self._close()
+            self.is_ready = False
+
+    def set_path(self, index_path: str) -> None:
+        """close the index and keep the base segment in another file, `prepare` maps or builds it
+
+        Args:
+            index_path (str): base segment file path
+        """
+        self.close()
+        with self._lock:
+            self.path = index_path
+
+    def _set(self, note_id: int, grams: Optional[array]) -> None:
+        self._seq += 1
+        self._overlay[note_id] = (self._seq, grams)
+        self._shadow |= 1 << note_id
+        if len(self._overlay) >= self.COMPACT and self._compacting is None:
+            self._compacting = Thread(
+                target=self._build, args=(self._seq,), daemon=True)
+            self._compacting.start()
+
+    def _base(self, plan: Plan) -> int:
+        if isinstance(plan, bytes):
+            bits = -1
+            for gram in literal_trigrams(plan):
+                bits &= self._lookup(gram)
+                if not bits:
+                    break
+            return bits
+        op, plans = plan  # type: ignore
+        if op == "and":
+            bits = -1
+            for p in plans:
+                bits &= self._base(p)
+            return bits
+        bits = 0
+        for p in plans:
+            bits |= self._base(p)
+        return bits
+
+    def _lookup(self, gram: int) -> int:
+        if (bits := self._decoded.get(gram)) is not None:
+            return bits
+        bits = 0
+        if self._keys is not None and self._offsets is not None and self._data is not None:
+            i = bisect_left(self._keys, gram)
+            if i < len(self._keys) and self._keys[i] == gram:
+                bits = decode(self._data[self._offsets[i]:self._offsets[i + 1]])
+        if len(self._decoded) >= self.CACHE:
+            self._decoded.clear()
+        self._decoded[gram] = bits
+        return bits
+
+    def _contains(self, plan: Plan, grams: array) -> bool:
+        if isinstance(plan, bytes):
+            for gram in literal_trigrams(plan):
+                i = bisect_left(grams, gram)
+                if i == len(grams) or grams[i] != gram:
+                    return False
+            return True
+        op, plans = plan  # type: ignore
+        if op == "and":
+            return all(self._contains(p, grams) for p in plans)
+        return any(self._contains(p, grams) for p in plans)
+
+    def _build(self, seq: int) -> None:
+        """write a new base segment from all note files, the overlay up to `seq` is merged into it
+        """
+        with self._lock:
+            urls = dict(self._urls)
+        ids = sorted(urls)
+        stamps = [file_stamp(urls[id]) for id in ids]
+        tmp = self.path + ".tmp"
+        with self.generator.trigrams([NoteSchema(id=id, name="", url=urls[id]) for id in ids]) \
+                as (keys, offsets, data):
+            with open(tmp, 'wb') as f:
+                n_keys = len(keys) // 4
+                f.write(self.HEADER.pack(self.MAGIC, len(ids), n_keys, len(data)))
+                f.write(pad(array('I', ids)))
+                f.write(array('Q', (mtime for mtime, _ in stamps)))
+                f.write(array('Q', (size for _, size in stamps)))
+                f.write(keys)
+                f.write(bytes(-len(keys) % 8))
+                f.write(offsets)
+                f.write(data)
+                f.flush()
+                fsync(f.fileno())
+        with self._lock:
+            self._close()
+            replace(tmp, self.path)
+            self._open()
+            self._overlay = {id: change for id, change in self._overlay.items()
+                             if change[0] > seq}
+            self._shadow = 0
+            for id in self._overlay:
+                self._shadow |= 1 << id
+            self._compacting = None
+
+    def _open(self) -> None:
+        if not path.exists(self.path):
+            return
+        self._file = open(self.path, 'rb')
+        try:
+            self._map = mapped = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+            magic, n_notes, n_keys, _ = self.HEADER.unpack_from(mapped)
+        except ValueError:
+            magic = None
+        if magic != self.MAGIC:
+            self._close()
+            return
+        self._view = view = memoryview(mapped)
+        start = self.HEADER.size + 4 * n_notes + (-4 * n_notes % 8) + 16 * n_notes
+        self._keys = view[start:start + 4 * n_keys].cast('I')
+        start += 4 * n_keys + (-4 * n_keys % 8)
+        self._offsets = view[start:start + 8 * (n_keys + 1)].cast('Q')
+        self._data = view[start + 8 * (n_keys + 1):]
+
+    def _stamps(self) -> dict[int, tuple[int, int]]:
+        """file stamps of the notes in the base segment
+        """
+        with self._lock:
+            if self._map is None:
+                return {}
+            _, n_notes, _, _ = self.HEADER.unpack_from(self._map)
+            view = memoryview(self._map)
+            start = self.HEADER.size
+            ids = view[start:start + 4 * n_notes].cast('I')
+            start += 4 * n_notes + (-4 * n_notes % 8)
+            mtimes = view[start:start + 8 * n_notes].cast('Q')
+            sizes = view[start + 8 * n_notes:start + 16 * n_notes].cast('Q')
+            stamps = dict(zip(ids, zip(mtimes, sizes)))
+            for v in [ids, mtimes, sizes, view]:
+                v.release()
+            return stamps
+
+    def _close(self) -> None:
+        self._decoded.clear()
+        for view in [self._keys, self._offsets, self._data, self._view]:
+            if view is not None:
+                view.release()
+        self._keys = self._offsets = self._data = self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def file_stamp(url: str) -> tuple[int, int]:
+    """mtime_ns and size of a file, zeros for a missing one
+    """
+    try:
+        st = stat(url)
+        return st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return 0, 0
+
+
+def pad(values: array) -> bytes:
+    """bytes of an array, zero padded to a multiple of 8
+    """
+    data = values.tobytes()
+    return data + bytes(-len(data) % 8)
+
+
+trigram_index = TrigramIndex(net_generator, path.join(
+    path.dirname(path_config.tag_path), "trigram.idx"))
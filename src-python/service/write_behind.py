@@ -0,0 +1,195 @@
+from os import path
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Callable, NamedTuple, Optional
+
+from service.config import save_config
+from service.logger import logger
+
+
+class PendingNote(NamedTuple):
+    """latest saved content of a note which is not on disk yet
+    """
+    note_id: int
+    url: str
+    data: bytes
+    # monotonic time the content is due on disk
+    deadline: float
+
+
+class NoteWriteBehind:
+    """write-behind buffer of note saves, the latest content of each note is
+    kept in memory and written once `debounce` after the first save which is
+    not on disk yet, a burst of saves becomes one write
+
+    `get` returns the buffered content until it is on disk, readers see the
+    newest save either way. `writer` writes a note file and `indexer` updates
+    what depends on it from the file on disk, they run in the flush thread, or
+    in the caller of `flush` and `close`. The indexer runs after the write lock
+    is released: it waits for the database writer, which a request calling
+    `discard` may hold. `close` writes everything before the process exits, it
+    runs at shutdown.
+    """
+
+    # larger saves are written at once, the buffer holds at most a few of them in memory
+    MAX_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, debounce: float, writer: Optional[Callable[[int, str, bytes], None]] = None,
+                 indexer: Optional[Callable[[int, str], None]] = None) -> None:
+        """
+        Args:
+            debounce (float): seconds from the first buffered save of a note to its write
+            writer (Optional[Callable[[int, str, bytes], None]], optional): writes note id, file path
+                and content, set by the note routes. Defaults to None.
+            indexer (Optional[Callable[[int, str], None]], optional): indexes note id and file path
+                once written, set by the note routes. Defaults to None.
+        """
+        self.debounce = debounce
+        self.writer = writer
+        self.indexer = indexer
+        self._pending: dict[int, PendingNote] = {}
+        # content taken by a running write, still the newest until it is on disk
+        self._writing: dict[int, PendingNote] = {}
+        self._urls: dict[str, int] = {}
+        self._condition = Condition()
+        # one file write at a time, a note is never written with older content after newer,
+        # never held while waiting for the database
+        self._write_lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._closing = False
+
+    @property
+    def is_enabled(self) -> bool:
+        return bool(save_config.write_behind)
+
+    def accepts(self, size: int) -> bool:
+        return self.is_enabled and size <= self.MAX_SIZE
+
+    def put(self, note_id: int, url: str, data: bytes) -> None:
+        """buffer the new content of a note, acknowledged once this returns
+
+        Args:
+            note_id (int): note id
+            url (str): note file path
+            data (bytes): new content
+        """
+        with self._condition:
+            deadline = pending.deadline if (pending := self._pending.get(note_id)) \
+                else monotonic() + self.debounce
+            self._pending[note_id] = PendingNote(note_id, url, data, deadline)
+            self._urls[path.realpath(url)] = note_id
+            if self._thread is None:
+                self._closing = False
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def get(self, note_id: int) -> Optional[bytes]:
+        """newest content of a note if it is not on disk yet
+
+        Args:
+            note_id (int): note id
+
+        Returns:
+            Optional[bytes]: buffered content, None to read the note file
+        """
+        with self._condition:
+            if note := self._pending.get(note_id) or self._writing.get(note_id):
+                return note.data
+            return None
+
+    def get_file(self, file_path: str) -> Optional[bytes]:
+        """newest content of a note file if it is not on disk yet
+
+        Args:
+            file_path (str): note file path
+
+        Returns:
+            Optional[bytes]: buffered content, None to read the file
+        """
+        with self._condition:
+            note_id = self._urls.get(path.realpath(file_path))
+        return None if note_id is None else self.get(note_id)
+
+    def discard(self, note_id: int) -> None:
+        """drop the buffered content of a note which is deleted or written without the buffer,
+        a running file write of it is waited for, its indexing is not
+
+        Args:
+            note_id (int): note id
+        """
+        with self._write_lock, self._condition:
+            if note := self._pending.pop(note_id, None):
+                self._urls.pop(path.realpath(note.url), None)
+
+    def flush(self, notes_id: Optional[list[int]] = None) -> int:
+        """write buffered notes now
+
+        Args:
+            notes_id (Optional[list[int]], optional): target notes, all if None. Defaults to None.
+
+        Returns:
+            int: count of written notes
+        """
+        with self._condition:
+            targets = list(self._pending) if notes_id is None else \
+                [note_id for note_id in notes_id if note_id in self._pending]
+        return sum(self._write(note_id) for note_id in targets)
+
+    def close(self) -> None:
+        """write everything buffered and stop the flush thread, at shutdown
+        """
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._closing = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+        count = self.flush()
+        if count:
+            logger.info(f"write-behind buffer flushed {count} notes on shutdown")
+
+    def _write(self, note_id: int) -> bool:
+        with self._write_lock:
+            with self._condition:
+                if not (note := self._pending.pop(note_id, None)):
+                    return False
+                self._writing[note_id] = note
+            try:
+                assert self.writer is not None
+                self.writer(note.note_id, note.url, note.data)
+            except Exception as error:
+                # kept for the next flush, the save was acknowledged
+                logger.error(f"write-behind buffer fail to write note {note_id}: {error}")
+                with self._condition:
+                    self._pending.setdefault(note_id, note._replace(deadline=monotonic() + self.debounce))
+                return False
+            finally:
+                with self._condition:
+                    del self._writing[note_id]
+                    if note_id not in self._pending:
+                        self._urls.pop(path.realpath(note.url), None)
+        # the indexes read the file, an indexer finishing after a newer write still sees it
+        try:
+            if self.indexer is not None:
+                self.indexer(note.note_id, note.url)
+        except Exception as error:
+            logger.error(f"write-behind buffer fail to index note {note_id}: {error}")
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closing:
+                    due = [note.note_id for note in self._pending.values() if note.deadline <= monotonic()]
+                    if due:
+                        break
+                    timeout = min((note.deadline for note in self._pending.values()), default=None)
+                    self._condition.wait(None if timeout is None else max(timeout - monotonic(), 0))
+                if self._closing:
+                    return
+            for note_id in due:
+                self._write(note_id)
+
+
+note_buffer = NoteWriteBehind(save_config.debounce / 1000)
@@ -1,17 +1,33 @@
 from backend import app
 from model.note_group import Base
 from schemas.note_base import NoteCreateSchema
-from service.database import get_db
+from service.database import get_db, get_read_db, get_async_read_db, get_session_factory, \
+    get_read_session_factory
+from service.config import path_config
 from service.crud.note import create_note
+from service.trigram import trigram_index
+
+from contextlib import contextmanager
+from typing import Any, Iterator
 
 from pytest import fixture
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.routing import Mount
 from fastapi.testclient import TestClient
 
 
 @fixture
-def context():
+def context(tmp_path, monkeypatch):
+    # notes are created in a temporary directory, served by the note mount from there
+    note_dir = tmp_path / "note"
+    note_dir.mkdir()
+    monkeypatch.setattr(type(path_config), "note_dir", property(lambda _self: str(note_dir)))
+    static = next(route.app for route in app.routes if isinstance(route, Mount) and route.path == "/data/note")
+    monkeypatch.setattr(static, "all_directories", [str(note_dir)])
+
     SQLALCHEMY_DATABASE_URL = "./data/fake_tag.db"
     db = open(SQLALCHEMY_DATABASE_URL, 'w')
     db.close()
@@ -32,6 +48,39 @@ def context():
         finally:
             db.close()
 
+    AsyncSessionLocal = async_sessionmaker(
+        autoflush=False, bind=create_async_engine(f'sqlite+aiosqlite:///{SQLALCHEMY_DATABASE_URL}'))
+
+    async def override_get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
+    app.dependency_overrides[get_session_factory] = lambda: SessionLocal
+    app.dependency_overrides[get_read_session_factory] = lambda: SessionLocal
+    # the index of the fake database, not the one next to the real database
+    trigram_index.set_path(str(tmp_path / "trigram.idx"))
     client = TestClient(app)
     yield client
+    trigram_index.close()
+
+
+@contextmanager
+def count_statements() -> Iterator[list[str]]:
+    """collect the SQL statements executed by any engine inside the block
+
+    Yields:
+        Iterator[list[str]]: executed statements, filled while the block runs
+    """
+    statements: list[str] = []
+
+    def before_cursor_execute(_conn: Any, _cursor: Any, statement: str, *_args: Any) -> None:
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
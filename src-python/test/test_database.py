@@ -0,0 +1,104 @@
+from backend import app
+from model.note_group import Base
+from schemas.note_base import NoteCreateSchema
+from service.config import database_config, path_config
+from service.crud.note import create_note
+from service.database import create_database_engine, create_async_database_engine, \
+    get_db, get_read_db, get_session_factory, get_read_session_factory
+from service.net import net_index
+from service.search import note_search
+
+from asyncio import run, gather
+from concurrent.futures import ThreadPoolExecutor
+
+from pytest import raises
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+
+def test_database_engines(tmp_path):
+    url = f"sqlite:///{tmp_path / 'tag.db'}"
+    writer = create_database_engine(url)
+    reader = create_database_engine(url, 2)
+    with writer.begin() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar_one() == database_config.journal_mode.lower()
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar_one() == database_config.busy_timeout
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+
+    with reader.connect() as conn, raises(OperationalError, match="readonly"):
+        conn.execute(text("INSERT INTO t VALUES (2)"))
+
+    # a reader sees the last commit while a write is in progress
+    with writer.begin() as write:
+        write.execute(text("INSERT INTO t VALUES (3)"))
+        with reader.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM t")).scalar_one() == 1
+    with reader.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar_one() == 2
+    writer.dispose()
+    reader.dispose()
+
+
+def test_async_database_engine(tmp_path):
+    writer = create_database_engine(f"sqlite:///{tmp_path / 'tag.db'}")
+    with writer.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+    reader = create_async_database_engine(f"sqlite+aiosqlite:///{tmp_path / 'tag.db'}", 2)
+
+    async def count() -> int:
+        async with reader.connect() as conn:
+            assert (await conn.execute(text("PRAGMA query_only"))).scalar_one() == 1
+            return (await conn.execute(text("SELECT count(*) FROM t"))).scalar_one()
+
+    async def main() -> list[int]:
+        # more queries than connections, they wait for the pool instead of failing
+        counts = await gather(*(count() for _ in range(8)))
+        await reader.dispose()
+        return counts
+
+    assert run(main()) == [1] * 8
+    writer.dispose()
+
+
+def test_reads_beside_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(type(path_config), "note_dir", property(lambda _self: str(tmp_path)))
+    url = f"sqlite:///{tmp_path / 'tag.db'}"
+    writer = create_database_engine(url)
+    reader = create_database_engine(url, 4)
+    Base.metadata.create_all(writer)
+    Sessions = sessionmaker(autocommit=False, autoflush=False, bind=writer)
+    ReadSessions = sessionmaker(autocommit=False, autoflush=False, bind=reader)
+    with Sessions() as db:
+        create_note(db, NoteCreateSchema(name="test"))
+
+    def get_db_of(sessions):
+        def override():
+            with sessions() as db:
+                yield db
+        return override
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, get_db_of(Sessions))
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, get_db_of(ReadSessions))
+    monkeypatch.setitem(app.dependency_overrides, get_session_factory, lambda: Sessions)
+    monkeypatch.setitem(app.dependency_overrides, get_read_session_factory, lambda: ReadSessions)
+    monkeypatch.setattr(net_index, "is_ready", False)
+    monkeypatch.setattr(note_search, "is_ready", False)
+    monkeypatch.setattr(net_index, "layout", None)
+    client = TestClient(app)
+    urls = ["/net/get_net", "/net/get_net_delta?since=0", "/net/get_analytics",
+            "/net/get_path?from=1&to=1", "/net/get_neighborhood?note_id=1", "/note/search_notes?query=test"]
+    # the first requests index the notes on the writer
+    assert all(client.get(url).status_code == 200 for url in urls)
+
+    # a write transaction holds the only writer connection, the reads go on beside it
+    with writer.connect() as write, ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        write.execute(text("INSERT INTO notes (name, url) VALUES ('pending', 'pending.md')"))
+        reads = [pool.submit(client.get, url) for url in urls]
+        assert all(read.result(timeout=5).status_code == 200 for read in reads)
+        write.rollback()
+    writer.dispose()
+    reader.dispose()
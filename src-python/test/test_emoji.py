@@ -12,3 +12,19 @@ def test_search_emoji():
     target_data = jsonable_encoder(
         [{"name": "cat with wry smile", "unicode": "U+1F63C"}])
     assert response.json() == target_data
+
+
+def test_search_emoji_ranked():
+    response = client.get("/emoji/get_emoji?emoji=CAT&limit=4")
+    assert response.status_code == 200
+    names = [e["name"] for e in response.json()]
+    # name prefix, the exact name first, then word prefix
+    assert names == ["cat", "cat face", "cat with tears of joy", "cat with wry smile"]
+    names = [e["name"] for e in client.get("/emoji/get_emoji?emoji=cat").json()]
+    assert names[4] == "grinning cat"
+    assert all("cat" in name.lower() for name in names)
+
+    response = client.get("/emoji/get_emoji?emoji=zzzzz")
+    assert response.status_code == 404
+    response = client.get("/emoji/get_emoji?emoji=cat&limit=0")
+    assert response.status_code == 422
@@ -0,0 +1,64 @@
+from sqlite3 import connect
+
+from model.note_group import Base
+from service.migration import migrate, MIGRATIONS
+
+from sqlalchemy import create_engine
+
+# schema of the files made before migrations
+OLD_SCHEMA = """
+CREATE TABLE notes (id INTEGER NOT NULL, name VARCHAR, url VARCHAR, PRIMARY KEY (id));
+CREATE TABLE tags (id INTEGER NOT NULL, name VARCHAR(15), color VARCHAR(7), PRIMARY KEY (id));
+CREATE TABLE note_tag_association (
+    note_id INTEGER, tag_id INTEGER,
+    FOREIGN KEY(note_id) REFERENCES notes (id), FOREIGN KEY(tag_id) REFERENCES tags (id));
+INSERT INTO notes VALUES (1, 'a', 'a.md'), (2, 'b', 'b.md');
+INSERT INTO tags VALUES (1, 't1', '#FFFFFF'), (2, 't2', '#FFFFFF');
+INSERT INTO note_tag_association VALUES (1, 1), (1, 1), (1, 2), (2, 2), (NULL, 2);
+"""
+
+
+def plan(db_path: str, query: str) -> str:
+    with connect(db_path) as conn:
+        return " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}"))
+
+
+def test_migrate_old_database(tmp_path):
+    db_path = str(tmp_path / "tag.db")
+    with connect(db_path) as conn:
+        conn.executescript(OLD_SCHEMA)
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    with connect(db_path) as conn:
+        conn.execute("INSERT INTO note_links (note_id, data, is_md) VALUES (1, 'b', 1)")
+    assert "SCAN note_tag_association" in plan(
+        db_path, "SELECT note_id FROM note_tag_association WHERE tag_id IN (2)")
+
+    assert migrate(engine) == len(MIGRATIONS)
+    with connect(db_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        # duplicate and incomplete rows dropped
+        assert sorted(conn.execute("SELECT note_id, tag_id FROM note_tag_association")) == [
+            (1, 1), (1, 2), (2, 2)]
+        # hashed on the next save
+        assert list(conn.execute("SELECT id, content_hash FROM notes")) == [(1, None), (2, None)]
+        # extracted at its current hash if it has link records, on the next start if not
+        assert list(conn.execute("SELECT id, links_hash FROM notes")) == [(1, ""), (2, None)]
+    assert "USING COVERING INDEX ix_note_tag_association_tag_id_note_id" in plan(
+        db_path, "SELECT note_id FROM note_tag_association WHERE tag_id IN (2)")
+    assert "USING COVERING INDEX sqlite_autoindex_note_tag_association_1" in plan(
+        db_path, "SELECT tag_id FROM note_tag_association WHERE note_id = 1")
+    assert "USING INDEX ix_notes_name" in plan(db_path, "SELECT * FROM notes WHERE name = 'a'")
+
+    # up to date, nothing to run
+    assert migrate(engine) == len(MIGRATIONS)
+    engine.dispose()
+
+
+def test_migrate_new_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tag.db'}")
+    Base.metadata.create_all(engine)
+    assert migrate(engine) == len(MIGRATIONS)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA user_version").scalar_one() == len(MIGRATIONS)
+    engine.dispose()
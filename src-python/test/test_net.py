@@ -0,0 +1,486 @@
+from os import path
+from json import loads
+from time import sleep, perf_counter
+from random import Random
+from asyncio import run, gather, ensure_future, sleep as async_sleep
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+from backend import app
+from model.note_group import Base, NoteModel
+from schemas.note import NoteSchema
+from service.database import get_db
+from service.net import net_index, net_generator, NetIndex, NetLayout
+from .database_test_base import context
+
+from pytest import mark, MonkeyPatch
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+
+def induced_subgraph(net: dict, center: int, depth: int) -> tuple[set, set]:
+    """brute force k-hop subgraph of the full net, nodes and links by node label
+    """
+    label = [(n["is_md"], n["id"] if n["is_md"] else n["data"])
+             for n in net["nodes"]]
+    adjacency: dict[int, set[int]] = {i: set() for i in range(len(label))}
+    for l in net["links"]:
+        adjacency[l["source"]].add(l["target"])
+        adjacency[l["target"]].add(l["source"])
+    distance = {center: 0}
+    queue = deque([center])
+    while queue:
+        i = queue.popleft()
+        if distance[i] < depth:
+            for j in adjacency[i]:
+                if j not in distance:
+                    distance[j] = distance[i] + 1
+                    queue.append(j)
+    nodes = {label[i] for i in distance}
+    links = {frozenset((label[l["source"]], label[l["target"]])) for l in net["links"]
+             if l["source"] in distance and l["target"] in distance}
+    return nodes, links
+
+
+def labels(net: dict) -> tuple[set, set]:
+    label = [(n["is_md"], n["id"] if n["is_md"] else n["data"])
+             for n in net["nodes"]]
+    return set(label), {frozenset((label[l["source"]], label[l["target"]])) for l in net["links"]}
+
+
+def apply_delta(net: dict, delta: dict) -> None:
+    """apply a delta on the client side net model, nodes by key and undirected links
+    """
+    def key(ref: int | str) -> tuple:
+        return (True, ref) if isinstance(ref, int) else (False, ref)
+
+    if delta["full"]:
+        net["nodes"].clear()
+        net["links"].clear()
+    for n in delta["removed_nodes"]:
+        net["nodes"].pop((n["is_md"], n["id"] if n["is_md"] else n["data"]), None)
+    for l in delta["removed_links"]:
+        net["links"].discard(frozenset((key(l["source"]), key(l["target"]))))
+    for n in delta["nodes"]:
+        net["nodes"][(n["is_md"], n["id"] if n["is_md"] else n["data"])] = n["data"]
+    for l in delta["links"]:
+        net["links"].add(frozenset((key(l["source"]), key(l["target"]))))
+    net["version"] = delta["version"]
+
+
+def keyed(net: dict) -> dict:
+    label = [(n["is_md"], n["id"] if n["is_md"] else n["data"])
+             for n in net["nodes"]]
+    return {"nodes": {k: n["data"] for k, n in zip(label, net["nodes"])},
+            "links": {frozenset((label[l["source"]], label[l["target"]])) for l in net["links"]}}
+
+
+def pagerank(n: int, links: list[tuple[int, int]], damping: float = 0.85) -> list[float]:
+    """dense power iteration, dangling rank spread evenly
+    """
+    out = [[t for s, t in links if s == i] for i in range(n)]
+    rank = [1 / n] * n
+    for _ in range(200):
+        next = [(1 - damping) / n] * n
+        for i in range(n):
+            if out[i]:
+                for t in out[i]:
+                    next[t] += damping * rank[i] / len(out[i])
+            else:
+                next = [r + damping * rank[i] / n for r in next]
+        rank = next
+    return rank
+
+
+def simple_paths(net: dict, source: int, target: int, directed: bool) -> list[list[int]]:
+    """every simple path between two nodes by depth first search
+    """
+    adjacency: dict[int, set[int]] = {i: set() for i in range(len(net["nodes"]))}
+    for l in net["links"]:
+        adjacency[l["source"]].add(l["target"])
+        if not directed:
+            adjacency[l["target"]].add(l["source"])
+    paths = []
+    stack = [[source]]
+    while stack:
+        path = stack.pop()
+        if path[-1] == target:
+            paths.append(path)
+            continue
+        stack.extend(path + [v] for v in adjacency[path[-1]] if v not in path)
+    return paths
+
+
+def test_build_shared(tmp_path, monkeypatch: MonkeyPatch):
+    size, per_note = 5_000, 4
+    rand = Random(size)
+    # a synthetic vault, each note links to some random notes and to a shared resource
+    notes: list[dict[str, str]] = []
+    expected: set[frozenset[tuple[bool, int | str]]] = set()
+    for i in range(size):
+        url = path.join(tmp_path, f"{i}.md")
+        targets = rand.sample(range(size), per_note)
+        with open(url, "w") as f:
+            f.write(" ".join(f"[n{j}](md://n{j})" for j in targets) + f" [res_{i % 100}](res_{i % 100}.pdf)\n")
+        notes.append({"name": f"n{i}", "url": url})
+        expected |= {frozenset(((True, i + 1), (True, j + 1))) for j in targets}
+        expected.add(frozenset(((True, i + 1), (False, f"res_{i % 100}"))))
+    engine = create_engine(f"sqlite:///{tmp_path / 'tag.db'}")
+    Base.metadata.create_all(engine)
+    Sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Sessions() as db:
+        db.execute(insert(NoteModel), notes)
+        db.commit()
+
+    index = NetIndex(net_generator, 16)
+    assemble = index.assemble
+    builds = []
+
+    def counted_assemble(db):
+        builds.append(db)
+        return assemble(db)
+
+    monkeypatch.setattr(index, "assemble", counted_assemble)
+
+    async def callers() -> list[bytes]:
+        first = ensure_future(index.build(Sessions, Sessions))
+        await async_sleep(0)
+        # later callers join the running build, the first one prepares the index and assembles
+        return await gather(first, *[index.build(Sessions, Sessions) for _ in range(7)])
+
+    results = run(callers())
+    engine.dispose()
+    assert len(builds) == 1
+    assert all(r == results[0] for r in results)
+    nodes, links = labels(loads(results[0]))
+    assert nodes == {(True, i + 1) for i in range(size)} | {(False, f"res_{k}") for k in range(100)}
+    assert links == expected
+
+
+@mark.usefixtures("context")
+class TestNetClass:
+
+    def test_get_net(self, context: TestClient):
+        response = context.post("/note/create_note", json={"name": "ref"})
+        assert response.status_code == 201
+        ref_id = response.json()["id"]
+        response = context.post(
+            f"/note/save_note?note_id={ref_id}",
+            files={"file": ("ref.md", b"see [test](md://test) and [pdf](res.pdf)")})
+        assert response.status_code == 202
+
+        response = context.get("/net/get_net")
+        assert response.status_code == 200
+        data = response.json()
+        nodes = [(n["data"], n["is_md"]) for n in data["nodes"]]
+        assert nodes == [("test", True), ("ref", True), ("pdf", False)]
+        links = sorted((l["source"], l["target"]) for l in data["links"])
+        assert links == [(1, 0), (1, 2)]
+
+    def test_get_net_resource(self, context: TestClient):
+        for name in ["a", "b"]:
+            response = context.post("/note/create_note", json={"name": name})
+            context.post(f"/note/save_note?note_id={response.json()['id']}",
+                         files={"file": ("n.md", b"[pdf](res.pdf) [pdf](res.pdf)")})
+        response = context.get("/net/get_net")
+        assert response.status_code == 200
+        data = response.json()
+        assert [n["data"] for n in data["nodes"]] == ["test", "a", "b", "pdf"]
+        links = sorted((l["source"], l["target"]) for l in data["links"])
+        assert links == [(1, 3), (2, 3)]
+
+    def test_get_neighborhood(self, context: TestClient):
+        bodies = {
+            "a": b"[test](md://test) [r](r.pdf)",
+            "b": b"[a](md://a) [missing](md://missing)",
+            "c": b"[b](md://b) [c](md://c)",
+            "d": b"[r](r.pdf) [e](md://e)",
+            "e": b"",
+            "f": b"[test](md://test)",
+        }
+        for name, body in bodies.items():
+            response = context.post("/note/create_note", json={"name": name})
+            context.post(f"/note/save_note?note_id={response.json()['id']}",
+                         files={"file": (f"{name}.md", body)})
+        context.post("/note/save_note?note_id=1",
+                     files={"file": ("test.md", b"[c](md://c)")})
+        net = context.get("/net/get_net").json()
+
+        for note_id in [1, 3, 6]:
+            for depth in range(5):
+                response = context.get(
+                    f"/net/get_neighborhood?note_id={note_id}&depth={depth}")
+                assert response.status_code == 200
+                data = response.json()
+                assert data["nodes"][0]["id"] == note_id
+                assert labels(data) == induced_subgraph(
+                    net, note_id - 1, depth)
+
+        response = context.get(
+            "/net/get_neighborhood?note_id=1&depth=4&limit=3")
+        assert len(response.json()["nodes"]) == 3
+        response = context.get("/net/get_neighborhood?note_id=100")
+        assert response.status_code == 404
+
+    def test_get_net_delta(self, context: TestClient):
+        net = context.get("/net/get_net").json()
+        client = keyed(net) | {"version": net["version"]}
+        first = net["version"]
+
+        response = context.get(f"/net/get_net_delta?since={first}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["version"] == first and not data["full"]
+        assert data["nodes"] == data["links"] == []
+
+        ids = {}
+        for name, body in [("a", b"[test](md://test) [r](r.pdf)"),
+                           ("b", b"[a](md://a) [c](md://c) [r](r.pdf)"),
+                           ("c", b"[b](md://b)"),
+                           ("a", b"[b](md://b) [s](s.pdf)")]:
+            if name not in ids:
+                ids[name] = context.post("/note/create_note",
+                                         json={"name": name}).json()["id"]
+            context.post(f"/note/save_note?note_id={ids[name]}",
+                         files={"file": (f"{name}.md", body)})
+        steps = [lambda: context.put("/note/rename_note", json={"id": ids["c"], "name": "a"}),
+                 lambda: context.delete(f"/note/delete_note?note_id={ids['a']}"),
+                 lambda: context.post("/note/create_note", json={"name": "c"}),
+                 lambda: context.delete(f"/note/delete_note?note_id={ids['b']}")]
+        for step in [lambda: None] + steps:
+            step()
+            data = context.get(
+                f"/net/get_net_delta?since={client['version']}").json()
+            assert not data["full"]
+            apply_delta(client, data)
+            net = context.get("/net/get_net").json()
+            assert net["version"] == client["version"]
+            assert keyed(net) == {
+                "nodes": client["nodes"], "links": client["links"]}
+
+        response = context.get(f"/net/get_net_delta?since={first}")
+        assert response.json()["version"] == client["version"]
+        replay = keyed(context.get("/net/get_net").json()
+                       ) | {"version": first}
+        apply_delta(replay, response.json())
+        assert replay == client
+
+        response = context.get("/net/get_net_delta?since=0")
+        data = response.json()
+        assert data["full"]
+        full: dict = {"nodes": {}, "links": set()}
+        apply_delta(full, data)
+        assert full == client
+
+    def test_watch_net(self, context: TestClient):
+        version = context.get("/net/get_net").json()["version"]
+        with context.websocket_connect(f"/net/watch_net?since={version}") as websocket:
+            context.post("/note/save_note?note_id=1",
+                         files={"file": ("test.md", b"[r](r.pdf)")})
+            data = websocket.receive_json()
+            assert data["since"] == version
+            assert data["version"] > version
+            assert data["nodes"] == [
+                {"id": 0, "data": "r", "is_md": False, "pos": {"x": 0, "y": 0}}]
+            assert data["links"] == [{"source": 1, "target": "r"}]
+
+    def test_get_net_layout(self, context: TestClient, monkeypatch: MonkeyPatch):
+        monkeypatch.setattr(net_index, "layout", NetLayout(net_generator, 50))
+        for name, body in [("a", b"[test](md://test) [r](r.pdf)"),
+                           ("b", b"[a](md://a) [r](r.pdf)"),
+                           ("c", b"")]:
+            response = context.post("/note/create_note", json={"name": name})
+            context.post(f"/note/save_note?note_id={response.json()['id']}",
+                         files={"file": (f"{name}.md", body)})
+        net = context.get("/net/get_net").json()
+        positions = {(n["is_md"], n["id"] if n["is_md"] else n["data"]): (n["pos"]["x"], n["pos"]["y"])
+                     for n in net["nodes"]}
+        assert len(set(positions.values())) == len(positions) == 5
+
+        assert context.get("/net/get_net").json() == net
+
+        response = context.post("/note/create_note", json={"name": "d"})
+        context.post(f"/note/save_note?note_id={response.json()['id']}",
+                     files={"file": ("d.md", b"[c](md://c)")})
+        net = context.get("/net/get_net").json()
+        moved = {(n["is_md"], n["id"] if n["is_md"] else n["data"]): (n["pos"]["x"], n["pos"]["y"])
+                 for n in net["nodes"]}
+        assert moved.keys() == positions.keys() | {(True, 5)}
+        # a warm start moves old nodes by at most a few link lengths
+        assert all(abs(moved[k][0] - x) + abs(moved[k][1] - y) < 10 * NetLayout.LENGTH
+                   for k, (x, y) in positions.items())
+
+    def test_get_analytics(self, context: TestClient, monkeypatch: MonkeyPatch):
+        bodies = {
+            "a": b"[test](md://test) [b](md://b) [r](r.pdf)",
+            "b": b"[a](md://a) [test](md://test)",
+            "c": b"[test](md://test)",
+            "d": b"[e](md://e)",
+            "e": b"",
+            "f": b"",
+        }
+        for name, body in bodies.items():
+            response = context.post("/note/create_note", json={"name": name})
+            context.post(f"/note/save_note?note_id={response.json()['id']}",
+                         files={"file": (f"{name}.md", body)})
+        analyze = net_index.generator.analyze
+        calls = []
+
+        def counted(net):
+            calls.append(net)
+            return analyze(net)
+
+        monkeypatch.setattr(net_index.generator, "analyze", counted)
+
+        response = context.get("/net/get_analytics?top=3")
+        assert response.status_code == 200
+        data = response.json()
+        # nodes test a b c d e f r.pdf, links by index
+        links = [(1, 0), (1, 2), (1, 7), (2, 1), (2, 0), (3, 0), (4, 5)]
+        names = ["test", "a", "b", "c", "d", "e", "f", "r"]
+        expected = sorted(zip(pagerank(8, links), names), reverse=True)[:3]
+        assert [n["data"] for n in data["pagerank"]] == [
+            name for _, name in expected]
+        for n, (value, _) in zip(data["pagerank"], expected):
+            assert abs(n["value"] - value) < 1e-5
+        assert [(n["data"], n["value"]) for n in data["in_degree"]] == [
+            ("test", 3), ("a", 1), ("b", 1)]
+        assert [(n["data"], n["value"]) for n in data["out_degree"]] == [
+            ("a", 3), ("b", 2), ("c", 1)]
+        assert data["components"] == 3
+        assert data["component_sizes"] == [5, 2, 1]
+        assert data["orphans"] == [{"id": 7, "data": "f", "is_md": True}]
+
+        assert context.get("/net/get_analytics?top=3").json() == data
+        assert len(calls) == 1
+        context.post("/note/save_note?note_id=7",
+                     files={"file": ("f.md", b"[e](md://e)")})
+        data = context.get("/net/get_analytics?top=3").json()
+        assert len(calls) == 2
+        assert data["orphans"] == []
+        assert data["component_sizes"] == [5, 3]
+
+    def test_get_path(self, context: TestClient):
+        rand = Random(7)
+        size = 9
+        for i in range(2, size + 1):
+            context.post("/note/create_note", json={"name": f"n{i}"})
+        names = ["test"] + [f"n{i}" for i in range(2, size + 1)]
+        directed_links: set[tuple[int, int]] = set()
+        for i in range(size):
+            targets = rand.sample(range(size), 2)
+            directed_links.update((i, j) for j in targets)
+            refs = " ".join(f"[x](md://{names[j]})" for j in targets)
+            context.post(f"/note/save_note?note_id={i + 1}",
+                         files={"file": ("n.md", f"{refs} [r](r{i % 3}.pdf)".encode())})
+        net = context.get("/net/get_net").json()
+        # get_net keeps one direction of a mutual link, resources can't be passed through directed
+        directed_net = {"nodes": net["nodes"][:size],
+                        "links": [{"source": s, "target": t} for s, t in directed_links]}
+
+        def label(n: dict) -> tuple:
+            return (n["is_md"], n["id"] if n["is_md"] else n["data"])
+
+        node_labels = [label(n) for n in net["nodes"]]
+        for directed, graph in [(False, net), (True, directed_net)]:
+            for source in range(1, size + 1):
+                for target in range(1, size + 1):
+                    response = context.get(
+                        f"/net/get_path?from={source}&to={target}&k=4&directed={str(directed).lower()}")
+                    assert response.status_code == 200
+                    paths = [[label(n) for n in path]
+                             for path in response.json()["paths"]]
+                    expected = sorted(map(len, simple_paths(
+                        graph, source - 1, target - 1, directed)))[:4]
+                    assert list(map(len, paths)) == expected
+                    valid = {tuple(node_labels[i] for i in path)
+                             for path in simple_paths(graph, source - 1, target - 1, directed)}
+                    assert all(tuple(path) in valid for path in paths)
+                    assert len({tuple(path) for path in paths}) == len(paths)
+
+        response = context.get("/net/get_path?from=1&to=100")
+        assert response.status_code == 404
+
+    def test_update_net(self, context: TestClient):
+        response = context.post("/note/create_note", json={"name": "ref"})
+        ref_id = response.json()["id"]
+        context.post(f"/note/save_note?note_id={ref_id}",
+                     files={"file": ("ref.md", b"[test](md://test)")})
+        context.post(f"/note/save_note?note_id={ref_id}",
+                     files={"file": ("ref.md", b"no link")})
+        response = context.get("/net/get_net")
+        assert response.status_code == 200
+        assert response.json()["links"] == []
+
+        context.post(f"/note/save_note?note_id={ref_id}",
+                     files={"file": ("ref.md", b"[test](md://test)")})
+        response = context.delete("/note/delete_note?note_id=1")
+        assert response.status_code == 200
+        response = context.get("/net/get_net")
+        assert response.status_code == 200
+        data = response.json()
+        assert [n["data"] for n in data["nodes"]] == ["ref"]
+        assert data["links"] == []
+
+    def test_prepare_extracted(self, context: TestClient, monkeypatch: MonkeyPatch):
+        linked = context.post("/note/create_note", json={"name": "linked"}).json()["id"]
+        context.post(f"/note/save_note?note_id={linked}", files={"file": ("n.md", b"[test](md://test)")})
+        linkless = context.post("/note/create_note", json={"name": "linkless"}).json()["id"]
+        extract = net_index.generator.extract
+        extracted: list[set[int]] = []
+
+        def spy(notes: list[NoteSchema]):
+            extracted.append({note.id for note in notes})
+            return extract(notes)
+
+        monkeypatch.setattr(net_index.generator, "extract", spy)
+        db = next(app.dependency_overrides[get_db]())
+
+        def restart() -> set[int]:
+            extracted.clear()
+            monkeypatch.setattr(net_index, "is_ready", False)
+            net_index.prepare(db)
+            return set().union(*extracted)
+
+        # the created note has not been extracted yet, the saved one has
+        assert linkless in restart() and linked not in extracted[0]
+        # every note is extracted at its hash, with or without links
+        assert restart() == set()
+        # a hash stored without its links extracted, like a crash before the write-behind flush
+        db.query(NoteModel).filter(NoteModel.id == linkless).update({NoteModel.content_hash: "lost"})
+        db.commit()
+        assert restart() == {linkless}
+        assert restart() == set()
+        links = context.get("/net/get_net").json()["links"]
+        db.close()
+        assert len(links) == 1
+
+    def test_get_net_concurrency(self, context: TestClient, monkeypatch: MonkeyPatch):
+        assemble = net_index.assemble
+        builds = []
+
+        def slow_assemble(db):
+            builds.append(db)
+            sleep(0.5)
+            return assemble(db)
+
+        monkeypatch.setattr(net_index, "assemble", slow_assemble)
+        latencies = []
+        with context, ThreadPoolExecutor(max_workers=4) as pool:
+            nets = [pool.submit(context.get, "/net/get_net") for _ in range(4)]
+            while not all(n.done() for n in nets):
+                start = perf_counter()
+                response = context.get("/emoji/get_emoji?emoji=smile")
+                latencies.append(perf_counter() - start)
+                assert response.status_code == 200
+            responses = [n.result() for n in nets]
+
+        assert all(r.status_code == 200 for r in responses)
+        assert all(r.json() == responses[0].json() for r in responses)
+        assert len(builds) == 1
+        # the build session is the build's own and is closed with it
+        assert not builds[0].in_transaction()
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)]
+        assert p99 < 0.2
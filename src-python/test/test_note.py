@@ -1,12 +1,52 @@
-from os import path
+import signal
+from array import array
+from os import path, stat, listdir
+from time import time, perf_counter
+from hashlib import sha256
+from io import BytesIO
+from re import finditer, search, MULTILINE, IGNORECASE
+from json import loads
+from random import Random
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from typing import Any
 
-from .database_test_base import context
+from service.search import note_search
+from service.grep import note_grep, grep_files
+from service import trigram
+from service.trigram import TrigramIndex, TrigramStream
+from service.tag_index import tag_index
+from service.net import net_generator
+from service.content_cache import note_contents, ContentCache
+from service.render import block_renderer, delimited
+from service.database import get_db, create_database_engine
+from service.crud import note as note_crud
+from model.note_group import NoteModel
+from backend import app
+from router import note as note_router
+from .database_test_base import context, count_statements
 
-from pytest import mark
+from pytest import mark, MonkeyPatch
+from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 from fastapi.encoders import jsonable_encoder
 
 
+def split_delimited(stream: bytes) -> list[bytes]:
+    """messages of a length-delimited stream
+    """
+    blocks, i = [], 0
+    while i < len(stream):
+        size, shift = 0, 0
+        while stream[i] & 0x80:
+            size |= (stream[i] & 0x7f) << shift
+            shift, i = shift + 7, i + 1
+        size |= stream[i] << shift
+        blocks.append(stream[i + 1:i + 1 + size])
+        i += 1 + size
+    return blocks
+
+
 @mark.usefixtures("context")
 class TestNoteClass:
 
@@ -25,9 +65,536 @@ class TestNoteClass:
         data[0].pop("url")
         assert data == jsonable_encoder(note_data)
 
+    def test_get_notes_statements(self, context: TestClient):
+        def statements(method: str, url: str, **kwargs) -> int:
+            with count_statements() as executed:
+                response = context.request(method, url, **kwargs)
+            assert response.status_code == 200
+            return len(executed)
+
+        context.post("/tag/create_tag", json={"name": "a", "color": "#FFFFFF", "note_id": 1})
+        requests: list[tuple[str, str, dict[str, Any]]] = [
+            ("GET", "/note/get_notes", {}),
+            ("POST", "/note/get_note_by_tags", {"json": {"tags_id": [1]}})]
+        few = [statements(method, url, **kwargs) for method, url, kwargs in requests]
+        for i in range(10):
+            note_id = context.post("/note/create_note", json={"name": f"n{i}"}).json()["id"]
+            context.put(f"/tag/add_tag?tag_id=1&note_id={note_id}")
+            context.post("/tag/create_tag", json={"name": f"t{i}", "color": "#FFFFFF", "note_id": note_id})
+        # notes and their tags in a fixed number of queries, not one per note
+        assert [statements(method, url, **kwargs) for method, url, kwargs in requests] == few
+        assert all(count <= 2 for count in few)
+        assert len(context.post("/note/get_note_by_tags", json={"tags_id": [1]}).json()) == 11
+
+    def test_query_by_tags(self, context: TestClient, monkeypatch: MonkeyPatch):
+        # built from the database of this test on the first query
+        monkeypatch.setattr(tag_index, "is_ready", False)
+        rand = Random(0)
+
+        def evaluate(expression: dict, tags: set[int]) -> bool:
+            if "tag_id" in expression:
+                return expression["tag_id"] in tags
+            if "and" in expression:
+                return all(evaluate(e, tags) for e in expression["and"])
+            if "or" in expression:
+                return any(evaluate(e, tags) for e in expression["or"])
+            return not evaluate(expression["not"], tags)
+
+        def expression(depth: int) -> dict:
+            if depth == 0 or rand.random() < 0.3:
+                return {"tag_id": rand.randint(1, 6)}
+            op = rand.choice(["and", "or", "not"])
+            if op == "not":
+                return {"not": expression(depth - 1)}
+            return {op: [expression(depth - 1) for _ in range(rand.randint(1, 3))]}
+
+        def check():
+            notes = {n["id"]: {t["id"] for t in n["tags"]} for n in context.get("/note/get_notes").json()}
+            for _ in range(30):
+                query = expression(3)
+                response = context.post("/note/query_by_tags", json=query)
+                assert response.status_code == 200
+                expect = sorted(i for i, tags in notes.items() if evaluate(query, tags))
+                facets = {}
+                for i in expect:
+                    for t in notes[i]:
+                        facets[str(t)] = facets.get(str(t), 0) + 1
+                assert response.json() == {"count": len(expect), "notes_id": expect, "facets": facets}
+
+        for i in range(15):
+            context.post("/note/create_note", json={"name": f"n{i}"})
+        for i in range(5):
+            context.post("/tag/create_tag", json={"name": f"t{i}", "color": "#FFFFFF", "note_id": i + 1})
+        for _ in range(30):
+            context.put(f"/tag/add_tag?tag_id={rand.randint(1, 5)}&note_id={rand.randint(1, 16)}")
+        check()
+        # kept in sync after it is built
+        context.put("/tag/remove_tag?tag_id=1&note_id=1")
+        context.put("/note/remove_note?tag_id=2&note_id=2")
+        context.delete("/tag/delete_tag?tag_id=3")
+        context.delete("/note/delete_note?note_id=4")
+        context.post("/note/create_note", json={"name": "new"})
+        context.post("/tag/create_tag", json={"name": "t5", "color": "#FFFFFF", "note_id": 17})
+        for _ in range(10):
+            context.put(f"/tag/add_tag?tag_id={rand.choice([1, 2, 4, 5, 6])}&note_id={rand.randint(1, 17)}")
+        check()
+
+        response = context.post("/note/query_by_tags", json={"tag_id": 1, "not": {"tag_id": 2}})
+        assert response.status_code == 422
+
     def test_delete_note(self, context: TestClient):
         delete_data = f"note_id={1}"
         response = context.delete(
             f"/note/delete_note?{delete_data}"
         )
         assert response.status_code == 200
+
+    def test_bulk_notes(self, context: TestClient, monkeypatch: MonkeyPatch):
+        monkeypatch.setattr(note_search, "is_ready", False)
+        response = context.post("/note/bulk_create", json=[{"name": f"bulk{i}"} for i in range(20)])
+        assert response.status_code == 201
+        created = response.json()
+        assert [n["name"] for n in created] == [f"bulk{i}" for i in range(20)]
+        assert all(path.exists(n["url"]) for n in created)
+        assert len(context.get("/note/get_notes").json()) == 21
+        assert len(context.get("/note/search_notes?query=bulk&limit=500").json()) == 20
+
+        ids = [n["id"] for n in created]
+        assert context.put("/tag/bulk_assign", json={"tags_id": [], "notes_id": ids}).json() == 0
+        context.post("/tag/create_tag", json={"name": "a", "color": "#FFFFFF", "note_id": ids[0]})
+        context.put(f"/tag/add_tag?tag_id=1&note_id={ids[1]}")
+
+        response = context.post("/note/bulk_delete", json={"notes_id": ids[:10] + [999]})
+        assert response.status_code == 200
+        assert response.json() == ids[:10]
+        assert not any(path.exists(n["url"]) for n in created[:10])
+        assert all(path.exists(n["url"]) for n in created[10:])
+        assert [n["id"] for n in context.get("/note/get_notes").json()] == [1] + ids[10:]
+        assert context.get("/tag/get_tags").json()[0]["notes"] == []
+        assert len(context.get("/note/search_notes?query=bulk&limit=500").json()) == 10
+        assert context.post("/note/bulk_delete", json={"notes_id": ids[:10]}).json() == []
+
+    def test_save_note(self, context: TestClient, monkeypatch: MonkeyPatch):
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        body = "".join(f"line {i}\n" for i in range(300_000)).encode()
+        response = context.post("/note/save_note?note_id=1", files={"file": ("n.md", body)})
+        assert response.status_code == 202
+        assert response.json() == sha256(body).hexdigest()
+        with open(url, "rb") as f:
+            assert f.read() == body
+        inode = stat(url).st_ino
+        # indexed from the chunks of the upload, the last line is in the last chunk
+        candidates = note_router.trigram_index.candidates("line 299999", False)
+        assert candidates is not None and candidates >> 1 & 1
+
+        # unchanged, with or without the hash the note file stays the same one and nothing is written
+        temps = []
+        monkeypatch.setattr(note_crud, "write_temp_file", lambda *args: temps.append(args))
+        for query in [f"&content_hash={sha256(body).hexdigest()}", ""]:
+            response = context.post(f"/note/save_note?note_id=1{query}", files={"file": ("n.md", body)})
+            assert response.json() == sha256(body).hexdigest()
+            assert stat(url).st_ino == inode
+        assert temps == []
+        monkeypatch.undo()
+        response = context.post(f"/note/save_note?note_id=1&content_hash={sha256(b'x').hexdigest()}",
+                                files={"file": ("n.md", b"x")})
+        assert response.json() == sha256(b"x").hexdigest()
+        with open(url, "rb") as f:
+            assert f.read() == b"x"
+        assert not [name for name in listdir(path.dirname(url)) if name.endswith(".tmp")]
+        assert context.post("/note/save_note?note_id=999", files={"file": ("n.md", b"x")}).status_code == 404
+
+    def test_save_beside_writer(self, context: TestClient):
+        other = context.post("/note/create_note", json={"name": "other"}).json()["id"]
+        # the single writer connection of production
+        engine = create_database_engine("sqlite:///./data/fake_tag.db")
+        Sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        renames: list[Thread] = []
+
+        def rename() -> None:
+            with Sessions() as db:
+                db.query(NoteModel).filter(NoteModel.id == other).update({NoteModel.name: "renamed"})
+                db.commit()
+
+        class Tap:
+            def update(self, _chunk: bytes) -> None:
+                # another request writes while the upload streams
+                if not renames:
+                    renames.append(Thread(target=rename))
+                    renames[0].start()
+                    renames[0].join(5)
+                    assert not renames[0].is_alive()
+
+        body = b"streamed " * 100_000
+        with Sessions() as db:
+            data = note_crud.get_note(db, 1)
+            assert data is not None
+            assert note_crud.save_note(db, data, BytesIO(body), Tap())
+            assert data.content_hash == sha256(body).hexdigest()
+        assert len(renames) == 1
+        assert context.get(f"/note/get_note?note_id={other}").json()["name"] == "renamed"
+        engine.dispose()
+
+    def test_patch_note(self, context: TestClient):
+        body = "标题\nhello world\n".encode()
+        base = context.post("/note/save_note?note_id=1", files={"file": ("n.md", body)}).json()
+
+        def patch(base_hash: str, *edits: tuple[int, int, str]):
+            return context.post("/note/patch_note", json={
+                "note_id": 1, "base_hash": base_hash,
+                "edits": [{"start": start, "end": end, "text": text} for start, end, text in edits]})
+
+        # offsets are bytes of the base version, not shifted by the edits before
+        response = patch(base, (0, 0, "# "), (13, 18, "there"), (len(body), len(body), "end"))
+        assert response.status_code == 202
+        expected = "# 标题\nhello there\nend".encode()
+        assert response.json() == sha256(expected).hexdigest()
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        with open(url, "rb") as f:
+            assert f.read() == expected
+
+        # stale base, the client saves in full
+        assert patch(base, (0, 0, "x")).status_code == 409
+        assert patch(sha256(expected).hexdigest(), (0, len(expected) + 1, "")).status_code == 400
+        assert patch(sha256(expected).hexdigest(), (4, 6, ""), (5, 7, "")).status_code == 422
+        assert patch(sha256(expected).hexdigest(), (6, 4, "")).status_code == 422
+        assert context.post("/note/patch_note", json={"note_id": 999, "base_hash": base, "edits": []}).status_code == 404
+        with open(url, "rb") as f:
+            assert f.read() == expected
+
+    def test_patch_note_concurrent(self, context: TestClient):
+        base = context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"0123456789")}).json()
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        # patches against one version, a single one applies
+        with ThreadPoolExecutor(8) as pool:
+            responses = list(pool.map(lambda i: context.post("/note/patch_note", json={
+                "note_id": 1, "base_hash": base, "edits": [{"start": i, "end": i + 1, "text": "x" * 3}]}),
+                range(8)))
+        assert sorted(r.status_code for r in responses) == [202] + [409] * 7
+        winner = next(i for i, r in enumerate(responses) if r.status_code == 202)
+        with open(url, "rb") as f:
+            content = f.read()
+        assert content == b"0123456789"[:winner] + b"xxx" + b"0123456789"[winner + 1:]
+        assert responses[winner].json() == sha256(content).hexdigest()
+
+        # patches chained on the hash of the one before all apply
+        content_hash = responses[winner].json()
+        for i in range(20):
+            response = context.post("/note/patch_note", json={
+                "note_id": 1, "base_hash": content_hash, "edits": [{"start": 0, "end": 0, "text": f"{i % 10}"}]})
+            assert response.status_code == 202
+            content_hash = response.json()
+        with open(url, "rb") as f:
+            assert f.read() == "".join(f"{i % 10}" for i in reversed(range(20))).encode() + content
+
+    def test_get_content(self, context: TestClient):
+        assert context.get("/note/get_content?note_id=0").status_code == 404
+        content = "- [ ] 一行笔记\n".encode() * 200
+        content_hash = context.post("/note/save_note?note_id=1", files={"file": ("n.md", content)}).json()
+
+        response = context.get("/note/get_content?note_id=1", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert response.content == content
+        assert response.headers["ETag"] == f'"{content_hash}"'
+        assert "Content-Encoding" not in response.headers
+
+        response = context.get("/note/get_content?note_id=1", headers={"Accept-Encoding": "gzip"})
+        assert response.content == content
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["ETag"] == f'"{content_hash}-gzip"'
+        assert response.num_bytes_downloaded < len(content) // 10
+
+        # a cached copy is validated without a body, for both encodings
+        hits = note_contents.hits
+        for tag, encoding in ((f'"{content_hash}"', "identity"), (f'"{content_hash}-gzip"', "gzip")):
+            response = context.get("/note/get_content?note_id=1",
+                                   headers={"If-None-Match": f'"other", {tag}', "Accept-Encoding": encoding})
+            assert response.status_code == 304
+            assert response.content == b""
+            assert response.headers["ETag"] == tag
+        assert note_contents.hits == hits
+        context.get("/note/get_content?note_id=1")
+        assert note_contents.hits == hits + 1
+
+        # a save makes the old tag stale and the cached content unused
+        context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"new")})
+        response = context.get("/note/get_content?note_id=1", headers={"If-None-Match": f'"{content_hash}"'})
+        assert response.status_code == 200
+        assert response.content == b"new"
+        assert response.headers["ETag"] == f'"{sha256(b"new").hexdigest()}"'
+
+        context.delete("/note/delete_note?note_id=1")
+        assert note_contents.get(1) is None
+        assert context.get("/note/get_content?note_id=1").status_code == 404
+
+    def test_blocks_delimited(self):
+        blocks = [b"", b"a" * 127, b"b" * 128, b"c" * 300, b"d" * 20000]
+        stream = delimited(blocks)
+        assert stream[:3] == b"\x00\x7f" + b"a"
+        assert len(stream) == sum(map(len, blocks)) + 1 + 1 + 2 + 2 + 3
+        assert split_delimited(stream) == blocks
+
+    def test_get_blocks(self, context: TestClient, monkeypatch: MonkeyPatch):
+        # one block per line instead of `libmdencoder`, the route and its cache are under test
+        renders = []
+
+        def generate(data: bytes) -> list[bytes]:
+            renders.append(data)
+            return data.split(b"\n")
+
+        monkeypatch.setattr(block_renderer, "load", lambda: True)
+        monkeypatch.setattr(block_renderer, "_generate", generate)
+        monkeypatch.setattr(block_renderer, "cache", ContentCache(block_renderer.BUDGET))
+        assert context.get("/note/get_blocks?note_id=0").status_code == 404
+        content = "# title\n\nsome **text**".encode()
+        content_hash = context.post("/note/save_note?note_id=1", files={"file": ("n.md", content)}).json()
+
+        response = context.get("/note/get_blocks?note_id=1")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/x-protobuf"
+        assert response.headers["ETag"] == f'"{content_hash}"'
+        assert response.content == delimited([b"# title", b"", b"some **text**"])
+        # a cache hit renders nothing
+        assert context.get("/note/get_blocks?note_id=1").content == response.content
+        assert renders == [content]
+        assert block_renderer.cache.hits == 1
+        response = context.get("/note/get_blocks?note_id=1", headers={"If-None-Match": f'"{content_hash}"'})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"## other")})
+        response = context.get("/note/get_blocks?note_id=1", headers={"If-None-Match": f'"{content_hash}"'})
+        assert response.status_code == 200
+        assert response.headers["ETag"] == f'"{sha256(b"## other").hexdigest()}"'
+        assert renders == [content, b"## other"]
+        for invalid in (b"\xff\xfe", b"a\0b"):
+            context.post("/note/save_note?note_id=1", files={"file": ("n.md", invalid)})
+            response = context.get("/note/get_blocks?note_id=1")
+            assert response.status_code == 400
+            assert response.json() == {"detail": "笔记内容不是UTF-8文本"}
+        assert len(renders) == 2
+
+    @mark.skipif(not block_renderer.load(), reason="libmdencoder is not built")
+    def test_get_blocks_encoder(self, context: TestClient, monkeypatch: MonkeyPatch):
+        monkeypatch.setattr(block_renderer, "cache", ContentCache(block_renderer.BUDGET))
+        # past the parallel threshold, the blocks are parsed by the rayon pool
+        paragraphs = block_renderer.PARALLEL_THRESHOLD * 2
+        content = "".join(f"## part {i}\n\nsome **text** `{i}`\n\n- [ ] task\n\n" for i in range(paragraphs)).encode()
+        content_hash = context.post("/note/save_note?note_id=1", files={"file": ("n.md", content)}).json()
+
+        response = context.get("/note/get_blocks?note_id=1")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/x-protobuf"
+        assert response.headers["ETag"] == f'"{content_hash}"'
+        blocks = split_delimited(response.content)
+        assert len(blocks) >= paragraphs
+        assert blocks == block_renderer._generate(content)
+        # a cache hit, then a cached copy of the client
+        assert context.get("/note/get_blocks?note_id=1").content == response.content
+        assert block_renderer.cache.hits == 1
+        response = context.get("/note/get_blocks?note_id=1", headers={"If-None-Match": f'"{content_hash}"'})
+        assert response.status_code == 304
+
+    @mark.skipif(not block_renderer.load(), reason="libmdencoder is not built")
+    def test_render_blocks(self):
+        content = "# title\n\nsome **text**\n\n- [ ] task\n".encode()
+        blocks = block_renderer.render(sha256(content).hexdigest(), content)
+        assert blocks
+        assert blocks == delimited(block_renderer._generate(content))
+
+    def test_search_notes(self, context: TestClient, monkeypatch: MonkeyPatch):
+        # the fixture note is not indexed yet
+        monkeypatch.setattr(note_search, "is_ready", False)
+        rand = Random(0)
+        words = ["alpha", "beta", "gamma", "delta", "笔记", "数据库索引", "ab"]
+        bodies = {"test": ""}
+        for i in range(30):
+            name = f"note{i}"
+            body = " ".join(rand.choices(words, k=rand.randint(1, 12)))
+            response = context.post("/note/create_note", json={"name": name})
+            context.post(f"/note/save_note?note_id={response.json()['id']}",
+                         files={"file": ("n.md", body.encode('utf-8'))})
+            bodies[name] = body
+
+        for query in ["alpha", "ALPHA gamma", "数据库", "笔记", "ab", "ab beta", "note1", "zeta"]:
+            response = context.get(f"/note/search_notes?query={query}&limit=500")
+            assert response.status_code == 200
+            hits = response.json()
+            expected = {name for name, body in bodies.items()
+                        if all(t.lower() in (name + " " + body).lower() for t in query.split())}
+            assert {h["name"] for h in hits} == expected
+            if len(min(query.split(), key=len)) >= 3:
+                scores = [h["score"] for h in hits]
+                assert scores == sorted(scores, reverse=True)
+            for h in hits:
+                if query.split()[0].lower() in bodies[h["name"]].lower():
+                    assert "<mark>" in h["snippet"]
+
+        # more occurrences rank higher, a name match ranks highest
+        response = context.post("/note/create_note", json={"name": "epsilon"})
+        context.post(f"/note/save_note?note_id={response.json()['id']}",
+                     files={"file": ("n.md", b"empty")})
+        for content in [b"epsilon", b"epsilon epsilon epsilon"]:
+            response = context.post("/note/create_note", json={"name": "x"})
+            context.post(f"/note/save_note?note_id={response.json()['id']}",
+                         files={"file": ("n.md", content)})
+        hits = context.get("/note/search_notes?query=epsilon").json()
+        assert [h["snippet"] for h in hits] == [
+            "empty", "<mark>epsilon</mark> <mark>epsilon</mark> <mark>epsilon</mark>", "<mark>epsilon</mark>"]
+
+        # a short term is marked where it is, lowercase "İ" is two characters
+        response = context.post("/note/create_note", json={"name": "y"})
+        context.post(f"/note/save_note?note_id={response.json()['id']}",
+                     files={"file": ("n.md", "İİİİ Qz qz".encode())})
+        assert [h["snippet"] for h in context.get("/note/search_notes?query=qz").json()] == [
+            "İİİİ <mark>Qz</mark> <mark>qz</mark>"]
+
+        # FTS5 syntax is plain text
+        for query in ['"', 'a OR b', 'NEAR(', '%_']:
+            assert context.get("/note/search_notes", params={"query": query}).status_code == 200
+
+        # rename and delete keep the index in step
+        epsilon = hits[0]["id"]
+        context.put("/note/rename_note", json={"id": epsilon, "name": "omega"})
+        assert [h["id"] for h in context.get("/note/search_notes?query=omega").json()] == [epsilon]
+        context.delete(f"/note/delete_note?note_id={epsilon}")
+        assert context.get("/note/search_notes?query=omega").json() == []
+        assert len(context.get("/note/search_notes?query=epsilon").json()) == 2
+
+    def test_grep_notes(self, context: TestClient, monkeypatch: MonkeyPatch):
+        rand = Random(1)
+        words = ["Alpha", "beta", "gamma42", "笔记", "x7", "\u00e9t\u00e9"]
+        bodies = {}
+        for i in range(60):
+            lines = [" ".join(rand.choices(words, k=rand.randint(0, 8)))
+                     for _ in range(rand.randint(0, 5))]
+            response = context.post("/note/create_note", json={"name": f"n{i}"})
+            note_id = response.json()["id"]
+            context.post(f"/note/save_note?note_id={note_id}",
+                         files={"file": ("n.md", "\n".join(lines).encode('utf-8'))})
+            bodies[note_id] = "\n".join(lines)
+
+        def grep(pattern: str, ignore_case: bool = False) -> tuple[list[dict], dict]:
+            response = context.get("/note/grep_notes",
+                                   params={"pattern": pattern, "ignore_case": ignore_case})
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/x-ndjson"
+            lines = [loads(line) for line in response.text.splitlines()]
+            return lines[:-1], lines[-1]
+
+        for pattern, ignore_case in [(r"gamma\d+", False), (r"^alpha", True), (r"笔记 x7$", False),
+                                     (r"\bbeta\b", False), ("été", False), ("nothing", False)]:
+            matches, summary = grep(pattern, ignore_case)
+            expected = set()
+            for note_id, body in bodies.items():
+                flags = MULTILINE | (IGNORECASE if ignore_case else 0)
+                for m in finditer(pattern, body, flags):
+                    line = body.count("\n", 0, m.start())
+                    column = m.start() - (body.rfind("\n", 0, m.start()) + 1)
+                    expected.add((note_id, line + 1, column, m.group()))
+            assert {(m["id"], m["line"], m["column"], m["match"]) for m in matches} == expected
+            assert all(m["match"] in m["text"] for m in matches)
+            assert summary["matches"] == len(expected)
+            assert not summary["truncated"] and not summary["timeout"]
+            # the trigram prefilter skips notes without the literals of the pattern
+            assert summary["bytes"] <= sum(len(b.encode('utf-8')) for b in bodies.values())
+
+        monkeypatch.setattr(note_grep, "max_matches", 3)
+        matches, summary = grep("beta")
+        assert len(matches) == 3 and summary["truncated"]
+
+        monkeypatch.setattr(note_grep, "timeout", 0)
+        matches, summary = grep("nothing")
+        assert matches == [] and summary["timeout"]
+
+        response = context.get("/note/grep_notes", params={"pattern": "(unclosed"})
+        assert response.status_code == 400
+
+    def test_trigram_stream(self):
+        data = "Alpha beta 笔记本 gamma42\n".encode() * 100
+        stream = TrigramStream(net_generator)
+        # trigrams across the chunk borders are kept
+        for i in range(0, len(data), 7):
+            stream.update(data[i:i + 7])
+        assert stream.trigrams() == net_generator.extract_trigrams(data)
+        assert TrigramStream(net_generator).trigrams() == array('I')
+
+    @mark.skipif(not hasattr(signal, "setitimer"), reason="no interval timer on this platform")
+    def test_grep_deadline(self, tmp_path):
+        url = tmp_path / "n.md"
+        url.write_bytes(b"a" * 64 + b"b")
+        # backtracks for ages, the scan stops inside the file at the deadline
+        start = perf_counter()
+        matches, _ = grep_files(r"(a|aa)+$", False, [(1, "n", str(url))], 10, time() + 0.2)
+        assert matches == []
+        assert perf_counter() - start < 2
+
+    @mark.skipif(not hasattr(signal, "setitimer"), reason="no interval timer on this platform")
+    def test_grep_backtracking(self, context: TestClient, monkeypatch: MonkeyPatch):
+        note_id = context.post("/note/create_note", json={"name": "n"}).json()["id"]
+        context.post(f"/note/save_note?note_id={note_id}", files={"file": ("n.md", b"a" * 64 + b"!")})
+        monkeypatch.setattr(note_grep, "timeout", 1.0)
+        # backtracks for ages in the first chunk, the response still ends at the deadline
+        start = perf_counter()
+        response = context.get("/note/grep_notes", params={"pattern": "(a+)+$"})
+        assert perf_counter() - start < note_grep.timeout + 1
+        lines = [loads(line) for line in response.text.splitlines()]
+        assert lines == [{"matches": 0, "bytes": 0, "truncated": False, "timeout": True}]
+        # the worker stopped too, the next scan finds its matches
+        lines = [loads(line) for line in context.get("/note/grep_notes", params={"pattern": "a!"}).text.splitlines()]
+        assert [m["id"] for m in lines[:-1]] == [note_id]
+        assert not lines[-1]["timeout"]
+
+    def test_grep_prefilter(self, context: TestClient, monkeypatch: MonkeyPatch, tmp_path):
+        index = TrigramIndex(net_generator, str(tmp_path / "trigram.idx"))
+        monkeypatch.setattr(note_router, "trigram_index", index)
+        # a few saves start a background rebuild of the base segment
+        monkeypatch.setattr(TrigramIndex, "COMPACT", 8)
+        rand = Random(2)
+        words = ["Alpha", "beta", "gamma42", "笔记本", "x7", "été", "foobar"]
+        urls = {}
+        for i in range(40):
+            body = " ".join(rand.choices(words, k=rand.randint(0, 6)))
+            note_id = context.post("/note/create_note", json={"name": f"n{i}"}).json()["id"]
+            context.post(f"/note/save_note?note_id={note_id}",
+                         files={"file": ("n.md", body.encode('utf-8'))})
+            urls[note_id] = context.get(f"/note/get_note?note_id={note_id}").json()["url"]
+
+        patterns = [("alpha", True), ("Alpha", False), ("gamma\\d+ x7", False), ("笔记本|foobar", False),
+                    ("(beta|été) [a-z]+42", False), ("[ab]eta", False), ("nothing", False), ("foo.*bar", True)]
+
+        def check(index: TrigramIndex):
+            for pattern, ignore_case in patterns:
+                matching = set()
+                for note_id, url in urls.items():
+                    with open(url, encoding='utf-8') as f:
+                        if search(pattern, f.read(), IGNORECASE if ignore_case else 0):
+                            matching.add(note_id)
+                candidates = index.candidates(pattern, ignore_case)
+                assert candidates is None or all(candidates >> id & 1 for id in matching)
+                response = context.get("/note/grep_notes",
+                                       params={"pattern": pattern, "ignore_case": ignore_case})
+                found = {loads(line)["id"] for line in response.text.splitlines()[:-1]}
+                assert found == matching
+
+        check(index)
+        assert index.candidates("nothing", False) == 0
+        index.close()
+
+        # a file changed while the server was down is found at startup
+        note_id = next(iter(urls))
+        with open(urls[note_id], "w") as f:
+            f.write("nothing changed but this")
+        reopened = TrigramIndex(net_generator, str(tmp_path / "trigram.idx"))
+        monkeypatch.setattr(note_router, "trigram_index", reopened)
+        db = next(app.dependency_overrides[get_db]())
+        reopened.prepare(db)
+        db.close()
+        assert reopened.candidates("nothing", False) == 1 << note_id
+        check(reopened)
+
+        # without the private parser of `re` there is no prefilter, every match is still found
+        monkeypatch.setattr(trigram, "sre_parse", None)
+        assert reopened.candidates("nothing", False) is None
+        check(reopened)
+        reopened.close()
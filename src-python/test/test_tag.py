@@ -1,6 +1,6 @@
 from os import path
 
-from .database_test_base import context
+from .database_test_base import context, count_statements
 
 from pytest import mark
 from fastapi.testclient import TestClient
@@ -80,3 +80,43 @@ class TestTagClass:
         response = context.get("/note/get_notes")
         assert response.status_code == 200
         assert len(response.json()[0]["tags"]) == 0
+
+    def test_get_tags_statements(self, context: TestClient):
+        def statements(url: str) -> int:
+            with count_statements() as executed:
+                response = context.get(url)
+            assert response.status_code == 200
+            return len(executed)
+
+        context.post("/tag/create_tag", json={"name": "a", "color": "#FFFFFF", "note_id": 1})
+        urls = ["/tag/get_tags", "/tag/get_note_tags?note_id=1"]
+        few = [statements(url) for url in urls]
+        for i in range(10):
+            note_id = context.post("/note/create_note", json={"name": f"n{i}"}).json()["id"]
+            context.put(f"/tag/add_tag?tag_id=1&note_id={note_id}")
+            tag_id = context.post("/tag/create_tag",
+                                  json={"name": f"t{i}", "color": "#FFFFFF", "note_id": note_id}).json()["id"]
+            context.put(f"/tag/add_tag?tag_id={tag_id}&note_id=1")
+        # tags and their notes in a fixed number of queries, not one per tag
+        assert [statements(url) for url in urls] == few
+        assert all(count <= 2 for count in few)
+        tags = context.get("/tag/get_note_tags?note_id=1").json()
+        assert len(tags) == 11
+        assert len(tags[0]["notes"]) == 11
+
+    def test_bulk_assign(self, context: TestClient):
+        notes_id = [n["id"] for n in context.post(
+            "/note/bulk_create", json=[{"name": f"n{i}"} for i in range(5)]).json()]
+        for i in range(3):
+            context.post("/tag/create_tag", json={"name": f"t{i}", "color": "#FFFFFF", "note_id": 1})
+        context.put(f"/tag/add_tag?tag_id=1&note_id={notes_id[0]}")
+
+        response = context.put("/tag/bulk_assign", json={"tags_id": [1, 2, 99], "notes_id": notes_id + [99]})
+        assert response.status_code == 202
+        # 2 tags to 5 notes, one pair existed
+        assert response.json() == 9
+        assert context.put("/tag/bulk_assign", json={"tags_id": [1, 2], "notes_id": notes_id}).json() == 0
+        tags = {t["id"]: {n["id"] for n in t["notes"]} for t in context.get("/tag/get_tags").json()}
+        assert tags == {1: {1, *notes_id}, 2: {1, *notes_id}, 3: {1}}
+        response = context.post("/note/get_note_by_tags", json={"tags_id": [1, 2]})
+        assert {n["id"] for n in response.json()} == {1, *notes_id}
@@ -0,0 +1,166 @@
+from hashlib import sha256
+from json import loads
+from os import path
+from threading import Thread
+from time import sleep
+from typing import Iterator
+
+from backend import app
+from model.note_group import NoteModel
+from router import note as note_router
+from service.database import create_database_engine
+from service.write_behind import note_buffer, NoteWriteBehind
+from .database_test_base import context
+
+from pytest import fixture, mark, MonkeyPatch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+
+@fixture
+def writes(context: TestClient, monkeypatch: MonkeyPatch) -> Iterator[list[tuple[int, bytes]]]:
+    """write-behind on, a long debounce, the flush thread indexes into the test database
+
+    Yields:
+        Iterator[list[tuple[int, bytes]]]: note id and content of each note file write
+    """
+    monkeypatch.setattr(NoteWriteBehind, "is_enabled", property(lambda _self: True))
+    monkeypatch.setattr(note_buffer, "debounce", 60.0)
+    monkeypatch.setattr(note_router, "SessionLocal", sessionmaker(
+        autocommit=False, autoflush=False, bind=create_engine("sqlite:///./data/fake_tag.db")))
+    written: list[tuple[int, bytes]] = []
+
+    def writer(note_id: int, url: str, content: bytes) -> None:
+        written.append((note_id, content))
+        note_router.write_buffered_note(note_id, url, content)
+
+    monkeypatch.setattr(note_buffer, "writer", writer)
+    yield written
+    note_buffer.close()
+
+
+def read_file(url: str) -> bytes:
+    with open(url, "rb") as f:
+        return f.read()
+
+
+@mark.usefixtures("context")
+class TestWriteBehindClass:
+
+    def test_coalesce_saves(self, context: TestClient, writes: list[tuple[int, bytes]]):
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        for i in range(20):
+            response = context.post("/note/save_note?note_id=1", files={"file": ("n.md", f"draft {i}".encode())})
+            assert response.status_code == 202
+            assert response.json() == sha256(f"draft {i}".encode()).hexdigest()
+            # not on disk yet, reads see the newest save
+            assert read_file(url) == b""
+            assert context.get(f"/data/note/{path.basename(url)}").content == f"draft {i}".encode()
+
+        # a patch applies to the buffered content
+        response = context.post("/note/patch_note", json={
+            "note_id": 1, "base_hash": sha256(b"draft 19").hexdigest(),
+            "edits": [{"start": 0, "end": 5, "text": "final"}]})
+        assert response.status_code == 202
+        assert context.get(f"/data/note/{path.basename(url)}").content == b"final 19"
+        assert writes == []
+
+        # a graceful restart writes the last acknowledged save once
+        with TestClient(app):
+            pass
+        assert writes == [(1, b"final 19")]
+        assert read_file(url) == b"final 19"
+        assert context.get(f"/data/note/{path.basename(url)}").content == b"final 19"
+        assert [h["id"] for h in context.get("/note/search_notes?query=final").json()] == [1]
+
+    def test_debounce(self, context: TestClient, writes: list[tuple[int, bytes]], monkeypatch: MonkeyPatch):
+        monkeypatch.setattr(note_buffer, "debounce", 0.2)
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        for i in range(5):
+            context.post("/note/save_note?note_id=1", files={"file": ("n.md", f"v{i}".encode())})
+        for _ in range(100):
+            if note_buffer.get(1) is None:
+                break
+            sleep(0.05)
+        assert writes == [(1, b"v4")]
+        assert read_file(url) == b"v4"
+
+    def test_search_buffered(self, context: TestClient, writes: list[tuple[int, bytes]]):
+        context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"buffered needle")})
+        assert writes == []
+        # search and grep write the buffered saves first
+        assert [h["id"] for h in context.get("/note/search_notes?query=needle").json()] == [1]
+        assert writes == [(1, b"buffered needle")]
+        context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"another pin")})
+        lines = context.get("/note/grep_notes?pattern=pin").text.splitlines()
+        assert [loads(line)["id"] for line in lines[:-1]] == [1]
+        assert writes == [(1, b"buffered needle"), (1, b"another pin")]
+
+    def test_delete_buffered(self, context: TestClient, writes: list[tuple[int, bytes]]):
+        note_id = context.post("/note/create_note", json={"name": "n"}).json()["id"]
+        url = context.get(f"/note/get_note?note_id={note_id}").json()["url"]
+        context.post(f"/note/save_note?note_id={note_id}", files={"file": ("n.md", b"gone")})
+        context.delete(f"/note/delete_note?note_id={note_id}")
+        note_buffer.close()
+        assert writes == []
+        assert not path.exists(url)
+
+    def test_large_save_bypasses(self, context: TestClient, writes: list[tuple[int, bytes]], monkeypatch: MonkeyPatch):
+        monkeypatch.setattr(NoteWriteBehind, "MAX_SIZE", 4)
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"abc")})
+        # written at once, the older buffered content is dropped
+        context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"abcdef")})
+        assert read_file(url) == b"abcdef"
+        note_buffer.close()
+        assert writes == []
+        assert read_file(url) == b"abcdef"
+
+    def test_max_size(self, context: TestClient, writes: list[tuple[int, bytes]]):
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        # up to 8 MiB a save is buffered
+        assert NoteWriteBehind.MAX_SIZE == 8 * 1024 * 1024
+        content = b"a" * NoteWriteBehind.MAX_SIZE
+        response = context.post("/note/save_note?note_id=1", files={"file": ("n.md", content)})
+        assert response.json() == sha256(content).hexdigest()
+        assert note_buffer.get(1) == content
+        assert read_file(url) == b""
+        # one byte more is written at once
+        content += b"b"
+        response = context.post("/note/save_note?note_id=1", files={"file": ("n.md", content)})
+        assert response.json() == sha256(content).hexdigest()
+        assert note_buffer.get(1) is None
+        assert read_file(url) == content
+        note_buffer.close()
+        assert writes == []
+        assert read_file(url) == content
+
+    def test_flush_beside_writer(self, context: TestClient, writes: list[tuple[int, bytes]], monkeypatch: MonkeyPatch):
+        # the single writer connection of production
+        engine = create_database_engine("sqlite:///./data/fake_tag.db")
+        Sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        monkeypatch.setattr(note_router, "SessionLocal", Sessions)
+        url = context.get("/note/get_note?note_id=1").json()["url"]
+        context.post("/note/save_note?note_id=1", files={"file": ("n.md", b"flushed needle")})
+
+        # a request holds the writer, like a save or delete before it discards the note
+        request = Sessions()
+        request.get(NoteModel, 1)
+        flush = Thread(target=note_buffer.flush)
+        flush.start()
+        for _ in range(100):
+            if read_file(url) == b"flushed needle":
+                break
+            sleep(0.05)
+        # the flush thread waits for the writer to index the note, not while holding the write lock
+        discard = Thread(target=note_buffer.discard, args=(1,))
+        discard.start()
+        discard.join(5)
+        assert not discard.is_alive()
+        request.close()
+        flush.join(5)
+        assert not flush.is_alive()
+        assert writes == [(1, b"flushed needle")]
+        assert [h["id"] for h in context.get("/note/search_notes?query=needle").json()] == [1]
+        engine.dispose()